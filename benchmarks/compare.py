@@ -0,0 +1,79 @@
+"""Diff two benchmark results and fail on regressions.
+
+    python benchmarks/compare.py benchmarks/baselines/management-sqlite.json current.json
+
+A scenario regresses when its p95 latency or queries per request grow, or
+its throughput drops, by more than ``--threshold`` (default 25%). Query
+counts are deterministic, so any growth beyond the threshold is reported
+even on a noisy machine. Exits 1 when anything regressed.
+"""
+import argparse
+import json
+import sys
+
+# metric -> True when bigger is better
+METRICS = {
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "queries_per_request": False,
+    "commits": False,
+    "requests_per_second": True,
+    "rows_per_second": True,
+    "peak_rss_mb": False,
+}
+GATED = ("p95_ms", "queries_per_request", "requests_per_second", "rows_per_second")
+
+
+def change(old, new):
+    if old in (None, 0) or new is None:
+        return None
+    return (new - old) / old
+
+
+def compare(baseline, current, threshold):
+    """Return ``(rows, regressions)`` comparing the scenarios of two results."""
+    rows = []
+    regressions = []
+    for name, before in sorted(baseline["scenarios"].items()):
+        after = current["scenarios"].get(name)
+        if after is None:
+            regressions.append(f"{name}: missing from current run")
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if metric not in before:
+                continue
+            delta = change(before[metric], after.get(metric))
+            worse = delta is not None and (-delta if higher_is_better else delta) > threshold
+            rows.append((name, metric, before[metric], after.get(metric), delta, worse))
+            if worse and metric in GATED:
+                regressions.append(f"{name}: {metric} {before[metric]} -> {after.get(metric)} ({delta:+.0%})")
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args()
+    with open(args.baseline) as fh:
+        baseline = json.load(fh)
+    with open(args.current) as fh:
+        current = json.load(fh)
+    if baseline.get("params") != current.get("params") or baseline.get("database") != current.get("database"):
+        print("warning: runs used different parameters or databases; deltas are not comparable", file=sys.stderr)
+
+    rows, regressions = compare(baseline, current, args.threshold)
+    print(f"{baseline.get('commit')} -> {current.get('commit')} ({current.get('service')}, {current.get('database')})")
+    for name, metric, before, after, delta, worse in rows:
+        shown = "n/a" if delta is None else f"{delta:+.1%}"
+        print(f"{'!' if worse else ' '} {name:<22} {metric:<20} {before!s:>12} {after!s:>12} {shown:>8}")
+    if regressions:
+        print("\nregressions:\n  " + "\n  ".join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
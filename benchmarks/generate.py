@@ -0,0 +1,105 @@
+"""Deterministic synthetic data for the benchmark suite.
+
+Writes ``products.csv`` and ``purchases.csv`` in the formats the management
+upload endpoints accept. Rows are streamed to disk, so memory stays flat
+from 10k up to 10M purchases::
+
+    python benchmarks/generate.py --purchases 1000000 --out /tmp/bench-data
+"""
+import argparse
+import csv
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+DAYS = 90
+MAX_ITEMS = 5
+
+
+def default_sizes(purchases):
+    """Catalog, store and user counts that scale with the purchase count."""
+    return {
+        "products": max(50, min(purchases // 20, 50_000)),
+        "stores": max(5, min(purchases // 2_000, 500)),
+        "users": max(100, purchases // 10),
+    }
+
+
+def product_names(count):
+    return [f"product-{i:06d}" for i in range(1, count + 1)]
+
+
+def store_ids(count):
+    return [f"SM{i:04d}" for i in range(1, count + 1)]
+
+
+def user_ids(count):
+    return [f"u{i:08d}" for i in range(1, count + 1)]
+
+
+def product_prices(count, seed=0):
+    rng = random.Random(seed)
+    return {name: round(rng.uniform(0.5, 50), 2) for name in product_names(count)}
+
+
+def iter_purchases(purchases, products, stores, users, seed=0):
+    """Yield ``(store_id, timestamp, user_id, product_names)`` tuples.
+
+    Popularity is skewed (a few products and users dominate) so the report
+    queries see realistic group sizes.
+    """
+    rng = random.Random(seed + 1)
+    names = product_names(products)
+    stores = store_ids(stores)
+    users = user_ids(users)
+    for _ in range(purchases):
+        count = rng.randint(1, min(MAX_ITEMS, len(names)))
+        picked = {names[min(int(rng.paretovariate(1.2)) - 1, len(names) - 1)] for _ in range(count)}
+        ts = EPOCH + timedelta(seconds=rng.randrange(DAYS * 86400))
+        user = users[min(int(rng.paretovariate(1.5)) - 1, len(users) - 1)] if rng.random() < 0.5 else rng.choice(users)
+        yield rng.choice(stores), ts, user, sorted(picked)
+
+
+def write_products(path, count, seed=0):
+    with open(path, "w", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["product_name", "unit_price"])
+        writer.writerows(product_prices(count, seed).items())
+
+
+def write_purchases(path, purchases, products, stores, users, seed=0):
+    prices = product_prices(products, seed)
+    with open(path, "w", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["supermarket_id", "timestamp", "user_id", "items_list", "total_amount"])
+        for store, ts, user, items in iter_purchases(purchases, products, stores, users, seed):
+            total = round(sum(prices[name] for name in items), 2)
+            writer.writerow([store, ts.strftime("%Y-%m-%dT%H:%M:%SZ"), user, ",".join(items), total])
+
+
+def generate(out_dir, purchases, products=None, stores=None, users=None, seed=0):
+    """Write both CSVs into ``out_dir`` and return the sizes used."""
+    sizes = default_sizes(purchases)
+    sizes.update({k: v for k, v in (("products", products), ("stores", stores), ("users", users)) if v})
+    os.makedirs(out_dir, exist_ok=True)
+    write_products(os.path.join(out_dir, "products.csv"), sizes["products"], seed)
+    write_purchases(os.path.join(out_dir, "purchases.csv"), purchases, seed=seed, **sizes)
+    return dict(sizes, purchases=purchases, seed=seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--purchases", type=int, default=10_000)
+    parser.add_argument("--products", type=int)
+    parser.add_argument("--stores", type=int)
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench-data")
+    args = parser.parse_args()
+    sizes = generate(args.out, args.purchases, args.products, args.stores, args.users, args.seed)
+    print(f"wrote {args.out}: {sizes}")
+
+
+if __name__ == "__main__":
+    main()
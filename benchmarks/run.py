@@ -0,0 +1,271 @@
+"""Drive one service through its Flask app and record a JSON baseline.
+
+Each service runs in its own process (both import a package called
+``mvc_app``); ``all`` re-invokes this script once per service::
+
+    python benchmarks/run.py all --purchases 10000 --out-dir benchmarks/baselines
+    python benchmarks/run.py management --database-url postgresql+psycopg2://... --reset
+
+Without ``--database-url`` a throwaway SQLite file is used. Against any
+other database the run drops and recreates the app tables, so ``--reset``
+must be given explicitly.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+SERVICES = ("management", "cash_register")
+sys.path.insert(0, HERE)
+
+from generate import default_sizes, generate, iter_purchases, product_prices, store_ids  # noqa: E402
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Runner:
+    """Times requests against a Flask test client and reads the SQL counters."""
+
+    def __init__(self, client, registry):
+        self.client = client
+        self.registry = registry
+        self.results = {}
+
+    def run(self, name, endpoint, requests, rows=None, warmup=None):
+        """Issue ``requests`` (callables returning a response) and record one scenario.
+
+        ``warmup`` is sent once, untimed and uncounted, so lazy imports and
+        cold caches don't land in the first timed request.
+        """
+        if warmup is not None:
+            self.check(f"{name} warm-up", warmup())
+        label = (("endpoint", endpoint),)
+        queries = self.registry.value("db_statements_total", label)
+        commits = self.registry.value("db_commits_total", label)
+        latencies = []
+        started = time.perf_counter()
+        for send in requests:
+            t0 = time.perf_counter()
+            response = send()
+            latencies.append(time.perf_counter() - t0)
+            self.check(name, response)
+        elapsed = time.perf_counter() - started
+        count = len(latencies)
+        queries = self.registry.value("db_statements_total", label) - queries
+        result = {
+            "requests": count,
+            "seconds": round(elapsed, 4),
+            "requests_per_second": round(count / elapsed, 2) if elapsed else None,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "queries": queries,
+            "queries_per_request": round(queries / count, 2),
+            "commits": self.registry.value("db_commits_total", label) - commits,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        if rows:
+            result["rows"] = rows
+            result["rows_per_second"] = round(rows / elapsed, 1) if elapsed else None
+        self.results[name] = result
+        print(f"  {name:<22} {count:>6} req  p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+              f"{result['queries_per_request']:>8} q/req", flush=True)
+        return result
+
+    @staticmethod
+    def check(name, response):
+        if response.status_code >= 400:
+            raise SystemExit(f"{name}: HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}")
+
+
+def expect(name, actual, expected):
+    # uploads and form checkouts redirect even when rows are rejected
+    if actual != expected:
+        raise SystemExit(f"{name}: expected {expected} rows, found {actual}")
+
+
+def repeat(times, send):
+    return [send] * times
+
+
+def bench_management(client, runner, args, data_dir):
+    def upload(url, filename):
+        def send():
+            with open(os.path.join(data_dir, filename), "rb") as fh:
+                return client.post(url, data={"file": (fh, filename)}, content_type="multipart/form-data")
+        return send
+
+    def upload_header(url, filename):
+        # same columns, no rows: loads pandas and the import path without changing the data
+        def send():
+            with open(os.path.join(data_dir, filename), "rb") as fh:
+                header = fh.readline()
+            return client.post(url, data={"file": (io.BytesIO(header), filename)}, content_type="multipart/form-data")
+        return send
+
+    runner.run("upload_products", "main.upload_products", [upload("/upload_products", "products.csv")],
+               rows=args.sizes["products"], warmup=upload_header("/upload_products", "products.csv"))
+    runner.run("upload_purchases", "main.upload_purchases", [upload("/upload_purchases", "purchases.csv")],
+               rows=args.purchases, warmup=upload_header("/upload_purchases", "purchases.csv"))
+    from mvc_app.db import SessionLocal
+    from mvc_app.models import Purchase
+
+    with SessionLocal() as session:
+        expect("upload_purchases", session.query(Purchase).count(), args.purchases)
+    store = store_ids(1)[0]
+    reports = [
+        ("best_sellers", "main.best_sellers", "/best_sellers?n=10"),
+        ("best_sellers_filtered", "main.best_sellers", f"/best_sellers?n=10&store={store}&start=2025-02-01"),
+        ("loyal_customers", "main.loyal_customers", "/loyal_customers?format=json&threshold=3"),
+        ("unique_customers", "main.unique_customers", "/unique_customers?format=json&granularity=week"),
+        ("analytics_sales", "main.analytics_sales", "/analytics/sales?group_by=product"),
+    ]
+    for name, endpoint, url in reports:
+        def send(url=url):
+            return client.get(url)
+        runner.run(name, endpoint, repeat(args.repeat, send), warmup=send)
+
+
+def bench_cash_register(client, runner, args, data_dir):
+    from mvc_app.bulk import chunked
+    from mvc_app.db import SessionLocal
+    from mvc_app.models import Product, Purchase, Store
+
+    prices = product_prices(args.sizes["products"], args.seed)
+    with SessionLocal() as session:
+        session.execute(Product.__table__.insert(), [{"product_name": n, "unit_price": p} for n, p in prices.items()])
+        session.execute(Store.__table__.insert(), [{"store_id": s} for s in store_ids(args.sizes["stores"])])
+        session.commit()
+        ids = dict(session.query(Product.product_name, Product.id))
+
+    def payloads(count, seed):
+        for store, ts, user, items in iter_purchases(count, seed=seed, **args.sizes):
+            yield {"store_id": store, "user_id": user, "timestamp": ts.isoformat(),
+                   "items_list": json.dumps([{"product_id": ids[name]} for name in items])}
+
+    def index():
+        return client.get("/")
+
+    runner.run("index", "main.index", repeat(args.repeat, index), warmup=index)
+    # checkouts write rows, so each warm-up is one extra purchase
+    forms = [lambda form=form: client.post("/create", data=form) for form in payloads(args.checkouts + 1, args.seed)]
+    runner.run("create_purchase", "main.create_purchase", forms[1:], rows=args.checkouts, warmup=forms[0])
+    with SessionLocal() as session:
+        expect("create_purchase", session.query(Purchase).count(), args.checkouts + 1)
+    purchases = [dict(p, items=json.loads(p.pop("items_list"))) for p in payloads(args.purchases + 1, args.seed + 1)]
+    warmup = purchases.pop(0)
+    batches = list(chunked(purchases, args.batch_size))
+    runner.run("purchases_batch", "main.create_purchases_batch",
+               [lambda batch=batch: client.post("/purchases/batch", json={"purchases": batch}) for batch in batches],
+               rows=args.purchases, warmup=lambda: client.post("/purchases/batch", json={"purchases": [warmup]}))
+    with SessionLocal() as session:
+        expect("purchases_batch", session.query(Purchase).count(), args.checkouts + args.purchases + 2)
+
+
+BENCHES = {"management": bench_management, "cash_register": bench_cash_register}
+
+
+def run_service(args):
+    service_dir = os.path.join(ROOT, args.service)
+    workdir = tempfile.mkdtemp(prefix=f"bench-{args.service}-")
+    url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    if not url.startswith("sqlite") and not args.reset:
+        raise SystemExit("refusing to drop tables in a non-SQLite database without --reset")
+    os.environ["DATABASE_URL"] = url
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("UPLOAD_SPOOL_DIR", workdir)
+    os.chdir(workdir)  # no log.cfg here, so LOG_LEVEL applies
+    sys.path.insert(0, service_dir)
+
+    from app import create_app
+    from mvc_app import metrics
+    from mvc_app.db import Base, engine
+
+    data_dir = args.data_dir or os.path.join(workdir, "data")
+    if args.service == "management" and not args.data_dir:
+        generate(data_dir, args.purchases, seed=args.seed, **args.sizes)
+    Base.metadata.drop_all(bind=engine)
+    app = create_app()
+    metrics.registry.reset()
+    runner = Runner(app.test_client(), metrics.registry)
+    print(f"{args.service} on {engine.dialect.name} ({args.purchases} purchases)", flush=True)
+    BENCHES[args.service](runner.client, runner, args, data_dir)
+    return {
+        "service": args.service,
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "database": engine.dialect.name,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"purchases": args.purchases, "checkouts": args.checkouts, "batch_size": args.batch_size,
+                   "repeat": args.repeat, "seed": args.seed, **args.sizes},
+        "scenarios": runner.results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("service", choices=SERVICES + ("all",))
+    parser.add_argument("--purchases", type=int, default=10_000, help="rows in purchases.csv / batch checkouts")
+    parser.add_argument("--checkouts", type=int, default=500, help="single form checkouts (cash_register)")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20, help="requests per read-only scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="reuse CSVs written by generate.py")
+    parser.add_argument("--database-url")
+    parser.add_argument("--reset", action="store_true", help="allow dropping tables in --database-url")
+    parser.add_argument("--out", help="write the JSON result here")
+    parser.add_argument("--out-dir", help="write <service>-<database>.json here")
+    args = parser.parse_args()
+
+    if args.service == "all":
+        for service in SERVICES:
+            subprocess.run([sys.executable, os.path.abspath(__file__), service, *sys.argv[2:]], check=True)
+        return
+
+    # run_service changes directory; resolve user paths first
+    for name in ("data_dir", "out", "out_dir"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    args.sizes = default_sizes(args.purchases)
+    result = run_service(args)
+    out = args.out or (args.out_dir and os.path.join(args.out_dir, f"{args.service}-{result['database']}.json"))
+    if out:
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        with open(out, "w") as fh:
+            json.dump(result, fh, indent=2, sort_keys=True)
+            fh.write("\n")
+        print(f"wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
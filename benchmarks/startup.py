@@ -0,0 +1,80 @@
+"""Measure worker startup: import time and time to the first request.
+
+Each sample is a fresh interpreter that imports ``app``, calls
+``create_app()`` and serves ``GET /`` through the test client, which is
+what a newly spawned worker does. The first run creates the schema and is
+discarded, so the samples reflect a restart against an existing database::
+
+    python benchmarks/startup.py all --runs 10
+    python benchmarks/startup.py management --database-url postgresql+psycopg2://...
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+SERVICES = ("management", "cash_register")
+HEAVY_MODULES = ("pandas", "numpy", "dateutil.parser")
+
+# runs inside the service directory of a fresh interpreter
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+application = app.create_app()
+t2 = time.perf_counter()
+status = application.test_client().get("/").status_code
+t3 = time.perf_counter()
+sys.stdout.write(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "create_app_ms": (t2 - t1) * 1000,
+    "first_request_ms": (t3 - t2) * 1000,
+    "status": status,
+    "loaded": [name for name in %r if name in sys.modules],
+}) + "\\n")
+""" % (HEAVY_MODULES,)
+
+
+def probe(service, env):
+    started = subprocess.run([sys.executable, "-c", PROBE], cwd=os.path.join(ROOT, service), env=env,
+                             capture_output=True, text=True)
+    if started.returncode:
+        raise SystemExit(f"{service}: probe failed:\n{started.stderr}")
+    # log lines come from a background thread and can follow the probe's output
+    return json.loads([line for line in started.stdout.splitlines() if line.startswith("{")][-1])
+
+
+def measure(service, runs, database_url=None):
+    workdir = tempfile.mkdtemp(prefix=f"startup-{service}-")
+    env = dict(os.environ, LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"), UPLOAD_SPOOL_DIR=workdir,
+               DATABASE_URL=database_url or f"sqlite:///{os.path.join(workdir, 'startup.db')}")
+    probe(service, env)  # creates the schema
+    samples = [probe(service, env) for _ in range(runs)]
+    result = {"service": service, "runs": runs, "loaded": samples[-1]["loaded"]}
+    for key in ("import_ms", "create_app_ms", "first_request_ms"):
+        result[key] = round(statistics.median(s[key] for s in samples), 1)
+    result["total_ms"] = round(result["import_ms"] + result["create_app_ms"] + result["first_request_ms"], 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("service", choices=SERVICES + ("all",))
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+    for service in SERVICES if args.service == "all" else (args.service,):
+        result = measure(service, args.runs, args.database_url)
+        print(f"{service:<14} import {result['import_ms']:>7.1f} ms  create_app {result['create_app_ms']:>6.1f} ms  "
+              f"first request {result['first_request_ms']:>6.1f} ms  total {result['total_ms']:>7.1f} ms  "
+              f"heavy modules: {', '.join(result['loaded']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,16 @@
 from flask import Flask
 import os
 
+from mvc_app.catalog import catalog_cache
 from mvc_app.controllers import bp as main_bp
-from mvc_app.db import create_tables
-import mvc_app.models
+from mvc_app.db import ensure_schema
+from mvc_app import metrics
+from mvc_app.models import SCHEMA_VERSION
 from mvc_app.logging_config import setup_logging
 
 # Replace monolith with MVC app factory bootstrap
 setup_logging("log.cfg")
+metrics.registry.add_collector("catalog_cache", catalog_cache.metrics)
 
 
 def create_app(test_config=None):
@@ -15,8 +18,9 @@ def create_app(test_config=None):
     app = Flask(__name__, template_folder=os.path.join(os.path.dirname(__file__), "mvc_app", "templates"))
     app.secret_key = os.getenv("SECRET_KEY", "dev-secret")
     app.register_blueprint(main_bp)
-    # ensure tables exist
-    create_tables()
+    metrics.init_app(app)
+    # one version query on restart; create_all only for a new or older schema
+    ensure_schema("cash_register", SCHEMA_VERSION)
     return app
 
 
@@ -0,0 +1,154 @@
+"""Async (ASGI) server for the cash register.
+
+Serves the same routes as ``app.py`` with Quart and async SQLAlchemy, so a
+checkout waiting on the database holds a coroutine instead of a thread.
+Validation, pricing and the write path are the sync helpers from
+``mvc_app.checkout``, run on the async session through ``run_sync``.
+Requires ``requirements-async.txt``::
+
+    hypercorn asgi:app --bind 0.0.0.0:5000
+"""
+import asyncio
+import logging
+import os
+import uuid
+
+from quart import Blueprint, Quart, flash, jsonify, redirect, render_template, request, url_for
+from sqlalchemy import select
+
+from mvc_app import metrics
+from mvc_app.aio import AsyncSessionLocal, async_engine
+from mvc_app.catalog import catalog_cache
+from mvc_app.checkout import (
+    BATCH_MAX_PURCHASES, CheckoutError, UnknownProductError, build_batch, build_purchase, write_purchases,
+)
+from mvc_app.db import ensure_schema
+from mvc_app.logging_config import hot_logger, setup_logging
+from mvc_app.models import SCHEMA_VERSION, User
+from mvc_app.search import (
+    SEARCH_IN_DATABASE, SearchArgumentError, parse_search_args, search_catalog, search_page, search_query,
+)
+
+setup_logging("log.cfg")
+metrics.registry.add_collector("catalog_cache", catalog_cache.metrics)
+
+bp = Blueprint("main", __name__)
+
+
+async def current_catalog(refresh=False):
+    if refresh:
+        return await catalog_cache.refresh_async(AsyncSessionLocal)
+    return await catalog_cache.get_async(AsyncSessionLocal)
+
+
+async def save_purchases(purchases):
+    async with AsyncSessionLocal() as session:
+        await session.run_sync(write_purchases, purchases)
+        await session.commit()
+
+
+@bp.route("/")
+async def index():
+    catalog = await current_catalog()
+    return await render_template("index.html", stores=catalog.stores)
+
+
+@bp.route("/create", methods=["POST"])
+async def create_purchase():
+    logger = hot_logger("app.create_purchase")
+    form = await request.form
+    args = (form.get("store_id"), form.get("user_id"), form.get("items_list"), form.get("timestamp"))
+    try:
+        try:
+            purchase = build_purchase(await current_catalog(), *args)
+        except UnknownProductError:
+            # the product may have been added since the last catalog reload
+            purchase = build_purchase(await current_catalog(refresh=True), *args)
+    except CheckoutError as exc:
+        logger.warning("Rejected purchase: %s", exc)
+        await flash(str(exc))
+        return redirect(url_for("main.index"))
+
+    await save_purchases([purchase])
+    await flash("Purchase created")
+    return redirect(url_for("main.index"))
+
+
+@bp.route("/purchases/batch", methods=["POST"])
+async def create_purchases_batch():
+    """Async twin of the sync batch endpoint; same request and response format."""
+    logger = logging.getLogger("app.create_purchases_batch")
+    payload = await request.get_json(silent=True)
+    purchases = payload.get("purchases") if isinstance(payload, dict) else None
+    if not isinstance(purchases, list):
+        return jsonify({"error": "expected a JSON object with a 'purchases' list"}), 400
+    if len(purchases) > BATCH_MAX_PURCHASES:
+        return jsonify({"error": f"at most {BATCH_MAX_PURCHASES} purchases per batch"}), 413
+
+    results, valid, unknown = build_batch(await current_catalog(), purchases)
+    if unknown:
+        # re-check the catalog version once per batch
+        results, valid, _ = build_batch(await current_catalog(refresh=True), purchases)
+
+    if valid:
+        await save_purchases(valid)
+    logger.info("Batch of %d purchases: %d created, %d rejected", len(purchases), len(valid), len(purchases) - len(valid))
+    return jsonify({"created": len(valid), "rejected": len(purchases) - len(valid), "results": results})
+
+
+@bp.route("/products/search")
+async def search_products():
+    """Async twin of the sync product search; same parameters and response."""
+    try:
+        q, mode, limit, after = parse_search_args(request.args)
+    except SearchArgumentError as exc:
+        return jsonify({"error": str(exc)}), 400
+    if SEARCH_IN_DATABASE:
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(search_query(q, mode, limit, after))).all()
+    else:
+        rows = search_catalog(await current_catalog(), q, mode, limit, after)
+    products, next_cursor = search_page(rows, limit)
+    return jsonify({"q": q, "mode": mode, "products": products, "next": next_cursor})
+
+
+@bp.route("/catalog/stats")
+async def catalog_stats():
+    """Catalog cache hit/miss counters."""
+    return jsonify(catalog_cache.metrics())
+
+
+@bp.route("/create_user", methods=["POST"])
+async def create_user():
+    """Create a new user with a unique UUID and return it as JSON."""
+    async with AsyncSessionLocal() as session:
+        for _ in range(10):
+            new_uuid = str(uuid.uuid4())
+            if await session.scalar(select(User.id).where(User.user_id == new_uuid)) is None:
+                session.add(User(user_id=new_uuid))
+                await session.commit()
+                return jsonify({"user_id": new_uuid})
+
+    return jsonify({"error": "could not generate unique user id"}), 500
+
+
+def create_app():
+    """Application factory for the async server"""
+    app = Quart(__name__, template_folder=os.path.join(os.path.dirname(__file__), "mvc_app", "templates"))
+    app.secret_key = os.getenv("SECRET_KEY", "dev-secret")
+    app.register_blueprint(bp)
+    metrics.init_async_app(app, async_engine)
+
+    @app.before_serving
+    async def ensure_tables():
+        # the version check and create_all run on the sync engine, once per process
+        await asyncio.to_thread(ensure_schema, "cash_register", SCHEMA_VERSION)
+
+    @app.after_serving
+    async def dispose_engine():
+        await async_engine.dispose()
+
+    return app
+
+
+app = create_app()
@@ -0,0 +1,21 @@
+"""gunicorn settings; worker count and preloading come from the environment.
+
+With ``GUNICORN_PRELOAD`` (the default) the app is imported and the schema
+version checked once in the master, and workers are forked from it. Pooled
+connections opened by the master are dropped in each child so no socket
+is shared across processes; background threads (the catalog listener) start on first use, after
+the fork.
+"""
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1").lower() in ("1", "true", "yes", "on")
+
+
+def post_fork(server, worker):
+    from mvc_app.db import engine, read_engine
+
+    engine.dispose(close=False)
+    read_engine.dispose(close=False)
@@ -0,0 +1,17 @@
+"""Async database access for the ASGI checkout server (see ``asgi.py``).
+
+Needs the optional asyncio drivers from ``requirements-async.txt``. The
+engine points at the same database as ``db.engine`` unless
+``ASYNC_DATABASE_URL`` overrides it.
+"""
+import os
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from .db import DATABASE_URL, async_url, engine_options
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_url(DATABASE_URL)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False,
+                                   **engine_options(ASYNC_DATABASE_URL, "async", is_async=True))
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
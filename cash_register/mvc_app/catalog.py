@@ -0,0 +1,197 @@
+"""In-process cache of the product and store catalog.
+
+The management service bumps ``catalog_version`` whenever products or
+stores change. The cache re-reads that single row at most every
+``CATALOG_CHECK_INTERVAL`` seconds and reloads the catalog only when the
+version moved, so checkout price lookups normally never reach the
+database. On Postgres a LISTEN thread additionally marks the cache stale
+as soon as a ``catalog_changed`` notification arrives.
+"""
+import asyncio
+import logging
+import os
+import select
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import select as sql_select
+
+from .db import PGBOUNCER, SessionLocal, engine
+from .models import CatalogVersion, Product, Store
+
+CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", "1.0"))
+# with LISTEN/NOTIFY in place the version poll is only a safety net
+LISTEN_CHECK_INTERVAL = float(os.getenv("CATALOG_LISTEN_CHECK_INTERVAL", "60"))
+# LISTEN needs a dedicated session, which a transaction pooler cannot provide
+LISTEN_ENABLED = os.getenv("CATALOG_LISTEN", "0" if PGBOUNCER else "1").lower() in ("1", "true", "yes", "on")
+CATALOG_CHANNEL = "catalog_changed"
+
+CatalogProduct = namedtuple("CatalogProduct", "id product_name unit_price")
+CatalogStore = namedtuple("CatalogStore", "id store_id")
+
+logger = logging.getLogger("app.catalog")
+
+
+class Catalog:
+    """An immutable snapshot of products and stores."""
+
+    __slots__ = ("version", "products", "products_by_id", "products_by_name", "search_keys", "stores",
+                 "stores_by_id")
+
+    def __init__(self, version, products, stores):
+        self.version = version
+        # (lower(name), name) order and keys for the in-memory product search
+        self.products = tuple(sorted(products, key=lambda p: (p.product_name.lower(), p.product_name)))
+        self.search_keys = tuple((p.product_name.lower(), p.product_name) for p in self.products)
+        self.products_by_id = {p.id: p for p in self.products}
+        self.products_by_name = {p.product_name: p for p in self.products}
+        self.stores = tuple(stores)
+        self.stores_by_id = {s.store_id: s for s in self.stores}
+
+
+class CatalogCache:
+    def __init__(self, check_interval=CHECK_INTERVAL, listen=LISTEN_ENABLED):
+        self.check_interval = check_interval
+        self.listen = listen
+        self._lock = threading.Lock()
+        # counters are bumped from request threads, the event loop and the listener
+        self._stats_lock = threading.Lock()
+        self._catalog = None
+        self._checked_at = 0.0
+        self._stale = False
+        self._listener = None
+        self._async_lock = None
+        self.stats = {"hits": 0, "misses": 0, "version_checks": 0, "reloads": 0, "notifications": 0}
+
+    def get(self):
+        """Return the current catalog, reloading it only if its version changed."""
+        catalog = self._fresh()
+        if catalog is not None:
+            return catalog
+        with self._lock:
+            self._start_listener()
+            with SessionLocal() as session:
+                return self._check(session)
+
+    def refresh(self):
+        """Re-check the catalog version now, skipping the poll interval."""
+        self._stale = True
+        return self.get()
+
+    async def get_async(self, session_factory):
+        """Like ``get`` for the async server; ``session_factory`` makes an ``AsyncSession``."""
+        catalog = self._fresh()
+        if catalog is not None:
+            return catalog
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            catalog = self._fresh()
+            if catalog is not None:
+                return catalog
+            self._start_listener()
+            async with session_factory() as session:
+                return await session.run_sync(self._check)
+
+    async def refresh_async(self, session_factory):
+        self._stale = True
+        return await self.get_async(session_factory)
+
+    def _fresh(self):
+        catalog = self._catalog
+        if catalog is not None and not self._stale and time.monotonic() - self._checked_at < self._interval():
+            self._count("hits")
+            return catalog
+        return None
+
+    def _check(self, session):
+        self._stale = False
+        self._checked_at = time.monotonic()
+        self._count("version_checks")
+        version = _read_version(session)
+        if self._catalog is not None and self._catalog.version == version:
+            self._count("hits")
+            return self._catalog
+        self._count("misses", "reloads")
+        self._catalog = _load(session, version)
+        logger.info("Loaded catalog version %d (%d products, %d stores)",
+                    version, len(self._catalog.products), len(self._catalog.stores))
+        return self._catalog
+
+    def _count(self, *names):
+        with self._stats_lock:
+            for name in names:
+                self.stats[name] += 1
+
+    def invalidate(self):
+        """Drop the cached snapshot entirely."""
+        with self._lock:
+            self._catalog = None
+            self._stale = True
+
+    def metrics(self):
+        catalog = self._catalog
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        return dict(
+            stats,
+            hit_ratio=round(stats["hits"] / lookups, 4) if lookups else None,
+            version=catalog.version if catalog else None,
+            products=len(catalog.products) if catalog else 0,
+            stores=len(catalog.stores) if catalog else 0,
+            listening=bool(self._listener and self._listener.is_alive()),
+        )
+
+    def _interval(self):
+        if self._listener is not None and self._listener.is_alive():
+            return max(self.check_interval, LISTEN_CHECK_INTERVAL)
+        return self.check_interval
+
+    def _start_listener(self):
+        # started lazily (after any fork) and only where NOTIFY exists
+        if not self.listen or self._listener is not None or engine.dialect.name != "postgresql":
+            return
+        self._listener = threading.Thread(target=self._listen_loop, name="catalog-listener", daemon=True)
+        self._listener.start()
+
+    def _listen_loop(self):
+        dbapi_conn = None
+        try:
+            # a driver connection of its own: the listener holds it for the life
+            # of the process, so it must not take a slot in the request pool
+            cargs, cparams = engine.dialect.create_connect_args(engine.url)
+            dbapi_conn = engine.dialect.connect(*cargs, **cparams)
+            dbapi_conn.autocommit = True
+            with dbapi_conn.cursor() as cur:
+                cur.execute(f"LISTEN {CATALOG_CHANNEL}")
+            logger.info("Listening for %s notifications", CATALOG_CHANNEL)
+            while True:
+                if select.select([dbapi_conn], [], [], 30) == ([], [], []):
+                    continue
+                dbapi_conn.poll()
+                if dbapi_conn.notifies:
+                    dbapi_conn.notifies.clear()
+                    self._count("notifications")
+                    self._stale = True
+        except Exception:
+            # fall back to polling the version row
+            logger.exception("Catalog listener stopped; falling back to version polling")
+        finally:
+            if dbapi_conn is not None:
+                dbapi_conn.close()
+
+
+def _read_version(session):
+    return session.execute(sql_select(CatalogVersion.version).where(CatalogVersion.id == 1)).scalar() or 0
+
+
+def _load(session, version):
+    products = [CatalogProduct(*row) for row in session.execute(
+        sql_select(Product.id, Product.product_name, Product.unit_price).order_by(Product.product_name))]
+    stores = [CatalogStore(*row) for row in session.execute(sql_select(Store.id, Store.store_id).order_by(Store.store_id))]
+    return Catalog(version, products, stores)
+
+
+catalog_cache = CatalogCache()
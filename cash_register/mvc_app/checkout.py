@@ -0,0 +1,154 @@
+"""Checkout validation and write path shared by the form and batch endpoints."""
+import json
+import os
+from collections import Counter
+from datetime import datetime
+
+from .bulk import increment_product_purchases, increment_user_purchases, insert_missing, insert_purchases
+from .models import User
+from .rollups import record_sales
+from .sketches import sketch_buffer
+
+BATCH_MAX_PURCHASES = int(os.getenv("BATCH_MAX_PURCHASES", "1000"))
+MAX_QUANTITY = int(os.getenv("MAX_QUANTITY", "1000"))
+
+class CheckoutError(ValueError):
+    """A purchase failed validation; the message is safe to show to the client."""
+
+
+class UnknownProductError(CheckoutError):
+    """The basket names a product the catalog doesn't know (yet)."""
+
+
+def parse_items(items):
+    """Validate an items list (or its JSON encoding).
+
+    Each entry needs a ``product_id`` and may carry an integer ``quantity``
+    between 1 and ``MAX_QUANTITY`` (default 1). Returns ``(product_id,
+    quantity)`` pairs.
+    """
+    if isinstance(items, str) or items is None:
+        try:
+            items = json.loads(items or "[]")
+        except ValueError:
+            raise CheckoutError("Invalid items_list format")
+    if not isinstance(items, list) or len(items) == 0:
+        raise CheckoutError("Please add at least one product before submitting")
+    entries = []
+    try:
+        for it in items:
+            # expect each item to be a mapping with product_id
+            pid = it.get("product_id") if isinstance(it, dict) else None
+            if pid is None:
+                raise ValueError("missing product_id")
+            # normalize to int (Product.id is integer)
+            entries.append((int(pid), it.get("quantity", 1)))
+    except (TypeError, ValueError):
+        raise CheckoutError("Invalid items entries; expected product_id values")
+    # no coercion: int() would silently truncate 2.9 to 2
+    if any(not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1 for _, quantity in entries):
+        raise CheckoutError("Quantities must be positive integers")
+    if any(quantity > MAX_QUANTITY for _, quantity in entries):
+        raise CheckoutError(f"Quantities must not exceed {MAX_QUANTITY}")
+    if len({pid for pid, _ in entries}) != len(entries):
+        raise CheckoutError("Duplicate products found in items list")
+    return entries
+
+
+def parse_timestamp(ts_raw):
+    # parse timestamp from the client or fall back to the current time
+    if ts_raw:
+        from dateutil import parser  # deferred: only client-supplied timestamps need it
+
+        try:
+            return parser.isoparse(ts_raw)
+        except (TypeError, ValueError):
+            return datetime.utcnow()
+    return datetime.now()
+
+
+def format_items_list(names):
+    """The legacy ``items_list`` string (a name repeated per unit) from ``(name, quantity)`` pairs."""
+    return ",".join(((name + ",") * quantity)[:-1] for name, quantity in names)
+
+
+def build_purchase(catalog, store_id, user_id, items, ts_raw=None):
+    """Validate one purchase and price it from the catalog.
+
+    Returns ``(row, lines)`` where ``row`` holds the ``purchases`` column
+    values and ``lines`` lists ``(product_id, quantity, line_total)``. The
+    total is always recomputed server-side from catalog prices to prevent
+    client tampering. Raises ``CheckoutError``.
+    """
+    # ids from a JSON batch can be any type; only non-empty strings get past here
+    if any(value is not None and not isinstance(value, str) for value in (store_id, user_id)):
+        raise CheckoutError("store_id and user_id must be strings")
+    if not (store_id or "").strip() or not (user_id or "").strip():
+        raise CheckoutError("store_id and user_id are required")
+    store_id, user_id = store_id.strip(), user_id.strip()
+    entries = parse_items(items)
+    if any(pid not in catalog.products_by_id for pid, _ in entries):
+        raise UnknownProductError("One or more selected products were not found in the database")
+    lines = []
+    names = []
+    for pid, quantity in entries:
+        product = catalog.products_by_id[pid]
+        lines.append((pid, quantity, float(product.unit_price) * quantity))
+        names.append((product.product_name, quantity))
+    row = {
+        "supermarket_id": store_id,
+        "timestamp": parse_timestamp(ts_raw),
+        "user_id": user_id,
+        "items_list": format_items_list(names),
+        "total_amount": sum(line[2] for line in lines),
+    }
+    return row, lines
+
+
+def build_batch(catalog, entries):
+    """Validate and price a list of batch entries against one catalog.
+
+    Returns ``(results, valid, unknown)``: a result dict per entry in
+    request order, the ``(row, lines)`` pairs to write, and whether any
+    entry referenced a product missing from ``catalog`` (callers refresh
+    the catalog once and retry when it did).
+    """
+    results = []
+    valid = []
+    unknown = False
+    for index, entry in enumerate(entries):
+        try:
+            if not isinstance(entry, dict):
+                raise CheckoutError("each purchase must be a JSON object")
+            purchase = build_purchase(catalog, entry.get("store_id"), entry.get("user_id"),
+                                      entry.get("items", entry.get("items_list")), entry.get("timestamp"))
+        except CheckoutError as exc:
+            unknown = unknown or isinstance(exc, UnknownProductError)
+            results.append({"index": index, "status": "rejected", "error": str(exc)})
+            continue
+        valid.append(purchase)
+        results.append({"index": index, "status": "created"})
+    return results, valid, unknown
+
+
+def write_purchases(session, purchases):
+    """Write validated ``(row, lines)`` pairs in the caller's transaction.
+
+    Purchases are written with their line items and users are created as
+    needed. The per-user and per-product counters are aggregated across the
+    batch and incremented atomically in SQL and the sales rollups are
+    updated, so the number of statements does not grow with the number of
+    purchases. Customers are staged for the buffered sketch writer, which
+    takes them once the transaction commits.
+    """
+    user_deltas = Counter(row["user_id"] for row, _ in purchases)
+    product_deltas = Counter()
+    for _, lines in purchases:
+        for product_id, quantity, _ in lines:
+            product_deltas[product_id] += quantity
+    insert_missing(session, User, "user_id", user_deltas)
+    insert_purchases(session, purchases)
+    increment_user_purchases(session, user_deltas)
+    increment_product_purchases(session, product_deltas)
+    sketch_buffer.record(session, ((row["supermarket_id"], row["timestamp"], row["user_id"]) for row, _ in purchases))
+    record_sales(session, ((row["supermarket_id"], row["timestamp"], lines) for row, lines in purchases))
@@ -1,13 +1,159 @@
+import logging
 import os
-from sqlalchemy import create_engine
+import time
+
+from sqlalchemy import Column, Integer, String, Table, create_engine, exc, select
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+from .migrations import create_missing_indexes, migrate, schema_problems
+
+
+def _flag(name, default="0"):
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
+
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+psycopg2://appuser:apassword@db:5432/appdb")
-engine = create_engine(DATABASE_URL, echo=False, future=True)
+# optional replica for reporting queries; falls back to the primary
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL") or None
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+POOL_PRE_PING = _flag("DB_POOL_PRE_PING", "1")
+# behind a transaction pooler (pgbouncer pool_mode=transaction) the pooler owns
+# the connections: keep no idle ones here and avoid session state such as
+# LISTEN or server-side prepared statements
+PGBOUNCER = _flag("DB_PGBOUNCER")
+# with DB_CREATE_TABLES=0 the schema is owned by init.sql / migrations and a
+# worker refuses to start against an unexpected schema version
+CREATE_TABLES = _flag("DB_CREATE_TABLES", "1")
+
+logger = logging.getLogger("app.db")
+
+
+class TimedCheckout:
+    """Pool mixin reporting how long each checkout waited for a connection."""
+
+    wait_observers = []
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self._notify(time.perf_counter() - started, timed_out=True)
+            raise
+        self._notify(time.perf_counter() - started, timed_out=False)
+        return conn
+
+    def _notify(self, waited, timed_out):
+        for observer in self.wait_observers:
+            observer(self._orig_logging_name, waited, timed_out)
+
+
+class TimedQueuePool(TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def async_url(url):
+    """The asyncio driver URL (asyncpg / aiosqlite) for a sync ``url``."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == "postgresql":
+        return url.set(drivername="postgresql+asyncpg")
+    if backend == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    return url
+
+
+def engine_options(url, name="primary", is_async=False):
+    """Pool and driver settings for ``url`` taken from the DB_* environment."""
+    url = make_url(url)
+    options = {"pool_logging_name": name}
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return options
+    if PGBOUNCER:
+        options["poolclass"] = NullPool
+        if url.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+        elif url.get_driver_name() == "psycopg":
+            options["connect_args"] = {"prepare_threshold": None}
+        return options
+    options.update(
+        poolclass=TimedAsyncQueuePool if is_async else TimedQueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=POOL_PRE_PING,
+    )
+    return options
+
+
+engine = create_engine(DATABASE_URL, echo=False, future=True, **engine_options(DATABASE_URL))
+read_engine = (create_engine(READ_DATABASE_URL, echo=False, future=True, **engine_options(READ_DATABASE_URL, "replica"))
+               if READ_DATABASE_URL else engine)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+ReadSessionLocal = sessionmaker(bind=read_engine, autoflush=False, autocommit=False, future=True)
 Base = declarative_base()
 
 
-def create_tables():
-    Base.metadata.create_all(bind=engine)
+# one row per service: both services share the database but not all tables
+schema_version = Table(
+    "schema_version",
+    Base.metadata,
+    Column("component", String(64), primary_key=True),
+    Column("version", Integer, nullable=False),
+)
+
+
+def recorded_schema_version(component, bind=None):
+    """The schema version stamped for ``component``, or None if there is none."""
+    with (bind or engine).connect() as conn:
+        try:
+            return conn.scalar(select(schema_version.c.version).where(schema_version.c.component == component))
+        except exc.DBAPIError:
+            # no schema_version table yet
+            return None
+
+
+def ensure_schema(component, version, bind=None):
+    """Upgrade the schema unless ``component`` is already at ``version``.
 
+    A worker restart then costs one query instead of ``create_all``'s
+    per-table reflection. Otherwise the ``migrations`` steps since the
+    recorded version (0 when there is none) alter the existing tables,
+    ``create_all`` adds the missing ones, and the version is stamped only
+    if every table then has its declared columns and unique constraints.
+    Returns True when the schema was upgraded.
+    """
+    bind = bind or engine
+    current = recorded_schema_version(component, bind)
+    if current == version:
+        return False
+    if current is not None and current > version:
+        # an older build during a rolling deploy; leave the newer schema alone
+        logger.warning("%s schema is at version %s, newer than this build (%s)", component, current, version)
+        return False
+    if not CREATE_TABLES:
+        raise RuntimeError(f"{component} schema is at version {current}, expected {version}; "
+                           "apply the schema changes or set DB_CREATE_TABLES=1")
+    with bind.begin() as conn:
+        migrate(conn, current or 0, version)
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as conn:
+        create_missing_indexes(conn, Base.metadata)
+        problems = schema_problems(conn, Base.metadata)
+        if problems:
+            raise RuntimeError(f"{component} schema can't be brought to version {version}: " + "; ".join(problems))
+        conn.execute(schema_version.delete().where(schema_version.c.component == component))
+        conn.execute(schema_version.insert().values(component=component, version=version))
+    logger.info("Upgraded %s schema from version %s to %s", component, current, version)
+    return True
@@ -1,16 +1,187 @@
+"""Logging setup shared by both services.
+
+Records are handed to a ``QueueHandler`` and written by a ``QueueListener``
+thread, so formatting and stdout writes never run on a request or import
+thread. Settings come from the ``[logging]`` section of ``log.cfg`` or the
+environment:
+
+- ``level`` / ``LOG_LEVEL``, ``sql_level`` / ``SQL_LOG_LEVEL``
+- ``format`` / ``LOG_FORMAT``: ``text`` (default) or ``json``, one object per line
+- ``queue`` / ``LOG_QUEUE``: set to ``0`` to write synchronously
+
+The queue is unbounded: a stalled stdout costs memory, not request latency.
+Messages emitted per row or per request go through ``hot_logger``, which
+rate limits them instead of flooding the output.
+"""
+import atexit
 import os
 import logging
 import configparser
+import json
+import queue
 import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+HOT_LOG_RATE = float(os.getenv("LOG_HOT_RATE", "10"))
+HOT_LOG_BURST = int(os.getenv("LOG_HOT_BURST", "50"))
+
+# LogRecord attributes that are not ``extra=`` fields
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including any ``extra=`` fields."""
+
+    def format(self, record):
+        data = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                data[key] = value
+        return json.dumps(data, default=str)
+
+
+class InProcessQueueHandler(QueueHandler):
+    """``QueueHandler`` for a queue that never leaves the process.
+
+    The stock ``prepare`` formats the record (tracebacks included) and
+    copies it on the caller's thread so it can be pickled; here only the
+    message is frozen, in case its arguments change later, and everything
+    else is left to the writer thread.
+    """
+
+    def prepare(self, record):
+        record.msg, record.args = record.getMessage(), None
+        return record
+
+
+class HotLogger:
+    """Logger for messages emitted per row or per request in a hot loop.
+
+    Each message template (per level) is let through at most ``rate`` times
+    a second after a ``burst``. The check runs before a record is built, so
+    a suppressed call costs about as much as a disabled one. The next
+    record let through says how many it stands for, in its text and as the
+    ``suppressed`` field.
+    """
+
+    def __init__(self, logger, rate=HOT_LOG_RATE, burst=HOT_LOG_BURST):
+        self.logger = logger
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._buckets = {}  # (level, msg) -> [tokens, last refill, suppressed]
+
+    def isEnabledFor(self, level):
+        return self.logger.isEnabledFor(level)
+
+    def _allow(self, key):
+        """None when the record should be dropped, else the count it stands for."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return None
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+            return suppressed
+
+    def log(self, level, msg, *args, **kwargs):
+        if not self.logger.isEnabledFor(level):
+            return
+        suppressed = self._allow((level, msg))
+        if suppressed is None:
+            return
+        if suppressed:
+            msg = f"{msg} [{suppressed} similar messages suppressed]"
+            kwargs["extra"] = dict(kwargs.get("extra") or {}, suppressed=suppressed)
+        self.logger.log(level, msg, *args, **kwargs)
+
+    def debug(self, msg, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        self.log(logging.ERROR, msg, *args, **kwargs)
+
+
+_hot_loggers = {}
+
+
+def hot_logger(name):
+    """The shared ``HotLogger`` wrapping ``logging.getLogger(name)``."""
+    if name not in _hot_loggers:
+        _hot_loggers.setdefault(name, HotLogger(logging.getLogger(name)))
+    return _hot_loggers[name]
+
+
+def _flag(value):
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+def _start_listener(handler):
+    global _listener
+    records = queue.SimpleQueue()
+    _listener = QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    return records
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_after_fork():
+    # the writer thread doesn't survive a fork (e.g. gunicorn preload);
+    # give the child its own queue and thread
+    if _queue_handler is not None and _listener is not None:
+        _queue_handler.queue = _start_listener(_listener.handlers[0])
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+atexit.register(stop_logging)
 
 
 def setup_logging(config_path: str = "log.cfg"):
+    global _queue_handler
     cfg = configparser.ConfigParser()
     level_name = "INFO"
+    sql_level_name = os.getenv("SQL_LOG_LEVEL", "WARNING").upper()
+    log_format = os.getenv("LOG_FORMAT", "text").lower()
+    use_queue = _flag(os.getenv("LOG_QUEUE", "1"))
     if os.path.exists(config_path):
         try:
             cfg.read(config_path)
             level_name = cfg.get("logging", "level", fallback=level_name).upper()
+            sql_level_name = cfg.get("logging", "sql_level", fallback=sql_level_name).upper()
+            log_format = cfg.get("logging", "format", fallback=log_format).lower()
+            use_queue = cfg.getboolean("logging", "queue", fallback=use_queue)
         except Exception:
             level_name = "INFO"
     else:
@@ -18,15 +189,23 @@ def setup_logging(config_path: str = "log.cfg"):
 
     level = getattr(logging, level_name, logging.INFO)
     root = logging.getLogger()
+    stop_logging()
+    _queue_handler = None
     for h in list(root.handlers):
         root.removeHandler(h)
     root.setLevel(level)
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(level)
-    formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if log_format == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
     console_handler.setFormatter(formatter)
-    root.addHandler(console_handler)
-    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    if use_queue:
+        _queue_handler = InProcessQueueHandler(_start_listener(console_handler))
+        root.addHandler(_queue_handler)
+    else:
+        root.addHandler(console_handler)
+    logging.getLogger("sqlalchemy.engine").setLevel(getattr(logging, sql_level_name, logging.WARNING))
     logging.getLogger("werkzeug").setLevel(level)
     root.info("Logging initialized from %s with level %s", config_path, level_name)
-
@@ -0,0 +1,317 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+
+from flask import Response, g, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .db import TimedCheckout, engine, read_engine
+from .logging_config import hot_logger
+
+log = logging.getLogger("app.metrics")
+# slow query / N+1 warnings can fire on every request under load
+sql_log = hot_logger("app.sql")
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "250"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 1000, 5000)
+BACKGROUND = "background"
+
+_current = ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    """SQL activity observed while serving one request."""
+
+    def __init__(self, endpoint=None, method=None):
+        self.endpoint = endpoint
+        self.method = method
+        self.started = time.perf_counter()
+        self.recorded = False
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.commits = 0
+        self.seen = Counter()
+
+    def repeated(self, threshold=None):
+        """Statements issued at least ``threshold`` times, most frequent first."""
+        threshold = threshold or N_PLUS_ONE_THRESHOLD
+        return [(stmt, n) for stmt, n in self.seen.most_common() if n >= threshold]
+
+
+class Registry:
+    """Minimal Prometheus-style counters and histograms rendered as text."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = {}
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, tuple(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [buckets, [0] * (len(buckets) + 1), 0.0]
+            hist[1][bisect_left(buckets, value)] += 1
+            hist[2] += value
+
+    def add_collector(self, prefix, fn):
+        """Export the numeric values of ``fn()`` (a dict) as gauges named ``prefix_<key>``."""
+        self._collectors[prefix] = fn
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def value(self, name, labels=()):
+        return self._counters.get((name, tuple(labels)), 0)
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, (b, list(c), s)) for k, (b, c, s) in self._histograms.items())
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {self._help.get(name, (kind, name))[1]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), (buckets, counts, total) in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        for prefix, fn in list(self._collectors.items()):
+            try:
+                values = fn()
+            except Exception:
+                log.exception("Metrics collector %s failed", prefix)
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    header(f"{prefix}_{key}", "gauge")
+                    lines.append(f"{prefix}_{key} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+registry.describe("http_request_duration_seconds", "histogram", "Request wall time by endpoint.")
+registry.describe("http_requests_total", "counter", "Requests by endpoint and status code.")
+registry.describe("db_statements_per_request", "histogram", "SQL statements executed per request.")
+registry.describe("db_commits_per_request", "histogram", "Session commits per request.")
+registry.describe("db_statements_total", "counter", "SQL statements executed.")
+registry.describe("db_seconds_total", "counter", "Time spent executing SQL.")
+registry.describe("db_commits_total", "counter", "Session commits.")
+registry.describe("db_slow_queries_total", "counter", "Statements slower than SLOW_QUERY_MS.")
+registry.describe("db_pool_wait_seconds", "histogram", "Time spent waiting for a pooled connection.")
+registry.describe("db_pool_timeouts_total", "counter", "Checkouts that gave up after DB_POOL_TIMEOUT.")
+registry.describe("db_n_plus_one_total", "counter", "Requests repeating an identical statement N_PLUS_ONE_THRESHOLD+ times.")
+
+
+def _endpoint():
+    stats = _current.get()
+    return getattr(stats, "endpoint", None) or BACKGROUND
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    endpoint = _endpoint()
+    registry.inc("db_statements_total", (("endpoint", endpoint),))
+    registry.inc("db_seconds_total", (("endpoint", endpoint),), elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.sql_seconds += elapsed
+        stats.seen[statement] += 1
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        registry.inc("db_slow_queries_total", (("endpoint", endpoint),))
+        sql_log.warning("Slow query (%.1f ms, %s%s): %s", elapsed * 1000, endpoint,
+                        ", executemany" if executemany else "", _shorten(statement))
+
+
+def _handle_error(context):
+    starts = context.connection.info.get("query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def _after_commit(session):
+    registry.inc("db_commits_total", (("endpoint", _endpoint()),))
+    stats = _current.get()
+    if stats is not None:
+        stats.commits += 1
+
+
+def _pool_wait(pool_name, waited, timed_out):
+    labels = (("pool", pool_name or "primary"),)
+    registry.observe("db_pool_wait_seconds", labels, waited, LATENCY_BUCKETS)
+    if timed_out:
+        registry.inc("db_pool_timeouts_total", labels)
+
+
+def _pool_gauges(bind):
+    def collect():
+        pool = bind.pool
+        if not isinstance(pool, TimedCheckout):
+            return {}
+        return {"size": pool.size(), "checked_out": pool.checkedout(), "overflow": max(pool.overflow(), 0)}
+    return collect
+
+
+def _shorten(statement, limit=300):
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + "..."
+
+
+def instrument_engine(bind=None):
+    """Attach the SQL timing hooks to ``bind`` (the app engine by default) once."""
+    bind = bind or engine
+    for name, fn in (("before_cursor_execute", _before_cursor_execute),
+                     ("after_cursor_execute", _after_cursor_execute),
+                     ("handle_error", _handle_error)):
+        if not event.contains(bind, name, fn):
+            event.listen(bind, name, fn)
+    if not event.contains(Session, "after_commit", _after_commit):
+        event.listen(Session, "after_commit", _after_commit)
+
+
+def _start_request():
+    stats = RequestStats(request.endpoint or "unmatched", request.method)
+    g._request_stats_token = _current.set(stats)
+
+
+def _finish_request(response):
+    stats = _current.get()
+    if stats is not None and not stats.recorded:
+        _record(stats, response.status_code)
+        response.headers["Server-Timing"] = (
+            f"app;dur={(time.perf_counter() - stats.started) * 1000:.1f}, "
+            f"db;dur={stats.sql_seconds * 1000:.1f};desc=\"{stats.statements} queries\""
+        )
+    return response
+
+
+def _teardown_request(exc):
+    _record_failure()
+    token = g.pop("_request_stats_token", None)
+    if token is not None:
+        _current.reset(token)
+
+
+def _record_failure():
+    stats = _current.get()
+    if stats is not None and not stats.recorded:
+        _record(stats, 500)
+
+
+def _record(stats, status):
+    stats.recorded = True
+    endpoint = (("endpoint", stats.endpoint),)
+    elapsed = time.perf_counter() - stats.started
+    registry.observe("http_request_duration_seconds", endpoint + (("method", stats.method),), elapsed,
+                     LATENCY_BUCKETS)
+    registry.inc("http_requests_total", endpoint + (("method", stats.method), ("status", str(status))))
+    registry.observe("db_statements_per_request", endpoint, stats.statements, COUNT_BUCKETS)
+    registry.observe("db_commits_per_request", endpoint, stats.commits, COUNT_BUCKETS)
+    repeated = stats.repeated()
+    if repeated:
+        registry.inc("db_n_plus_one_total", endpoint)
+        statement, count = repeated[0]
+        sql_log.warning("Possible N+1 in %s: statement ran %d times (%d distinct repeated): %s",
+                        stats.endpoint, count, len(repeated), _shorten(statement))
+
+
+registry.add_collector("db_pool_primary", _pool_gauges(engine))
+if read_engine is not engine:
+    registry.add_collector("db_pool_replica", _pool_gauges(read_engine))
+TimedCheckout.wait_observers.append(_pool_wait)
+
+
+def metrics_view():
+    """Prometheus text exposition of the collected metrics."""
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app):
+    """Time every request, count its SQL and expose ``/metrics``."""
+    instrument_engine()
+    if read_engine is not engine:
+        instrument_engine(read_engine)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+
+
+def init_async_app(app, bind):
+    """``init_app`` for the Quart server, whose SQL runs on the async engine ``bind``."""
+    from quart import Response as AsyncResponse, request as async_request
+
+    instrument_engine(bind.sync_engine)
+    registry.add_collector("db_pool_async", _pool_gauges(bind.sync_engine))
+
+    @app.before_request
+    async def start_request():
+        # every request runs in its own task, so there is no token to reset
+        _current.set(RequestStats(async_request.endpoint or "unmatched", async_request.method))
+
+    @app.after_request
+    async def finish_request(response):
+        return _finish_request(response)
+
+    @app.teardown_request
+    async def teardown_request(exc):
+        _record_failure()
+
+    async def metrics_view():
+        return AsyncResponse(registry.render(), mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule("/metrics", "metrics", metrics_view)
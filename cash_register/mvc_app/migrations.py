@@ -0,0 +1,182 @@
+"""Schema upgrade steps run by ``db.ensure_schema`` before ``create_all``.
+
+``create_all`` only creates missing tables; it can't add a column, a
+unique constraint or an index to a table that already exists. The steps
+below do that for every ``SCHEMA_VERSION`` that changed an existing table.
+A database without a ``schema_version`` stamp is treated as version 0,
+which covers everything created before versioning. Steps inspect the live
+schema first, so they are no-ops on a fresh database and safe to re-run
+from either service (both share the database).
+"""
+import logging
+from collections import Counter
+
+from sqlalchemy import UniqueConstraint, insert, inspect, select, text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger("app.migrations")
+
+# legacy per-product counters are kept, out of the way, under this name
+LEGACY_PRODUCT_COUNTERS = "legacy_purchase_item_counts"
+
+
+def _columns(conn, table):
+    """Column names of ``table``, or an empty set when it doesn't exist."""
+    inspector = inspect(conn)
+    if not inspector.has_table(table):
+        return set()
+    return {column["name"] for column in inspector.get_columns(table)}
+
+
+def _unique_column_sets(conn, table):
+    inspector = inspect(conn)
+    sets = {frozenset(c["column_names"]) for c in inspector.get_unique_constraints(table)}
+    sets.update(frozenset(i["column_names"]) for i in inspector.get_indexes(table) if i["unique"])
+    primary = inspector.get_pk_constraint(table)["constrained_columns"]
+    if primary:
+        sets.add(frozenset(primary))
+    return sets
+
+
+def move_legacy_product_counters(conn):
+    """``purchase_items`` used to hold per-product counters; move it aside for the line items table.
+
+    The counters are not carried over: ``flask backfill-line-items``
+    recounts legacy sales into ``product_total_purchases``.
+    """
+    columns = _columns(conn, "purchase_items")
+    if "total_purchases" in columns and "purchase_id" not in columns:
+        # a copy rather than a rename, so the old constraint and sequence
+        # names don't collide with the new table's
+        conn.execute(text(f"CREATE TABLE {LEGACY_PRODUCT_COUNTERS} AS SELECT * FROM purchase_items"))
+        conn.execute(text("DROP TABLE purchase_items"))
+        logger.info("Moved the legacy purchase_items counters to %s", LEGACY_PRODUCT_COUNTERS)
+
+
+def add_purchase_row_hash(conn):
+    """``purchases.row_hash`` (imported row fingerprints); its unique index is created afterwards."""
+    columns = _columns(conn, "purchases")
+    if columns and "row_hash" not in columns:
+        conn.execute(text("ALTER TABLE purchases ADD COLUMN row_hash VARCHAR(32)"))
+
+
+def unique_user_totals(conn):
+    """One ``user_total_purchases`` row per user, as ``ON CONFLICT (user_id)`` needs.
+
+    Duplicate rows are merged into the oldest one first.
+    """
+    if not _columns(conn, "user_total_purchases") or {"user_id"} in _unique_column_sets(conn, "user_total_purchases"):
+        return
+    conn.execute(text(
+        "UPDATE user_total_purchases SET total_purchases = ("
+        " SELECT SUM(COALESCE(t.total_purchases, 0)) FROM user_total_purchases t"
+        " WHERE t.user_id = user_total_purchases.user_id)"
+        " WHERE id IN (SELECT MIN(id) FROM user_total_purchases GROUP BY user_id HAVING COUNT(*) > 1)"
+    ))
+    merged = conn.execute(text(
+        "DELETE FROM user_total_purchases WHERE id NOT IN (SELECT MIN(id) FROM user_total_purchases GROUP BY user_id)"
+    )).rowcount
+    conn.execute(text("CREATE UNIQUE INDEX ux_user_total_purchases_user_id ON user_total_purchases (user_id)"))
+    if merged:
+        logger.info("Merged %d duplicate user_total_purchases rows", merged)
+
+
+def count_purchases_per_store_day(conn, batch_size=10000):
+    """Create ``purchase_counts`` and fill it from ``purchases`` when sales rollups already exist.
+
+    On a database without rollups ``create_all`` creates it empty, along with them.
+    """
+    inspector = inspect(conn)
+    if not inspector.has_table("sales_rollups") or inspector.has_table("purchase_counts"):
+        return
+    # models import db, which imports this module
+    from .models import Purchase, PurchaseCount
+    from .sketches import utc_day
+
+    PurchaseCount.__table__.create(conn)
+    counts = Counter()
+    stmt = select(Purchase.supermarket_id, Purchase.timestamp).execution_options(yield_per=batch_size)
+    for store_id, ts in conn.execute(stmt):
+        counts[(store_id, utc_day(ts))] += 1
+    rows = [{"store_id": store_id, "day": day, "purchase_count": count} for (store_id, day), count in counts.items()]
+    for start in range(0, len(rows), batch_size):
+        conn.execute(insert(PurchaseCount.__table__), rows[start:start + batch_size])
+    logger.info("Counted purchases for %d store days", len(rows))
+
+
+def add_import_job_heartbeat(conn):
+    """``import_jobs.owner`` and ``heartbeat_at``, which tell a live job from one a dead worker left behind."""
+    columns = _columns(conn, "import_jobs")
+    if columns and "owner" not in columns:
+        conn.execute(text("ALTER TABLE import_jobs ADD COLUMN owner VARCHAR"))
+    if columns and "heartbeat_at" not in columns:
+        conn.execute(text("ALTER TABLE import_jobs ADD COLUMN heartbeat_at TIMESTAMP WITH TIME ZONE"))
+
+
+def fill_customer_sketches(conn):
+    """Build ``customer_sketches`` from ``purchases`` when the table is missing or empty.
+
+    The table predates schema versioning, so on an upgraded database
+    ``create_all`` of whichever service starts first creates it empty, and
+    approximate unique customer counts would read 0 until
+    ``flask rebuild-sketches`` ran.
+    """
+    inspector = inspect(conn)
+    if not inspector.has_table("purchases"):
+        return
+    from .models import CustomerSketch, Purchase
+    from .sketches import rebuild_customer_sketches
+
+    if not inspector.has_table("customer_sketches"):
+        CustomerSketch.__table__.create(conn)
+    elif conn.execute(select(CustomerSketch.id).limit(1)).first() is not None:
+        return
+    if conn.execute(select(Purchase.id).limit(1)).first() is None:
+        return
+    # the session joins the migration's transaction and doesn't commit it
+    with Session(bind=conn) as session:
+        seen = rebuild_customer_sketches(session)
+    logger.info("Built customer sketches from %d purchases", seen)
+
+
+# version -> steps that bring an existing database up to it
+MIGRATIONS = {
+    1: (move_legacy_product_counters, add_purchase_row_hash, unique_user_totals),
+    3: (count_purchases_per_store_day,),
+    4: (add_import_job_heartbeat,),
+    5: (fill_customer_sketches,),
+}
+
+
+def migrate(conn, current, target):
+    """Run the steps of every version after ``current`` up to ``target``."""
+    for version in sorted(MIGRATIONS):
+        if current < version <= target:
+            for step in MIGRATIONS[version]:
+                step(conn)
+
+
+def create_missing_indexes(conn, metadata):
+    """Create the declared indexes of tables that existed before ``create_all``."""
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def schema_problems(conn, metadata):
+    """Columns and unique constraints the models declare but the database lacks."""
+    problems = []
+    for table in metadata.sorted_tables:
+        columns = _columns(conn, table.name)
+        if not columns:
+            problems.append(f"table {table.name} is missing")
+            continue
+        problems.extend(f"{table.name}.{column.name} is missing" for column in table.columns
+                        if column.name not in columns)
+        unique = _unique_column_sets(conn, table.name)
+        declared = [[c.name for c in constraint.columns] for constraint in table.constraints
+                    if isinstance(constraint, UniqueConstraint)]
+        declared += [[c.name for c in index.columns] for index in table.indexes if index.unique]
+        problems.extend(f"{table.name} has no unique constraint on ({', '.join(cols)})" for cols in declared
+                        if frozenset(cols) not in unique)
+    return problems
@@ -0,0 +1,94 @@
+"""Product search behind the register's incremental product picker.
+
+Products are ordered case-insensitively by ``(lower(name), name)`` and
+paginated with the last name seen as the cursor. On Postgres the query
+runs in the database against the ``ix_products_search`` index on that key
+(code-point collation), which also serves prefix matches as a range scan;
+substring matches use the ``pg_trgm`` GIN index when it exists (see
+``models``). Elsewhere the catalog snapshot that checkout already keeps in
+memory, sorted by the same key, is searched.
+"""
+import os
+from bisect import bisect_left, bisect_right
+
+from sqlalchemy import func, select, tuple_
+
+from .db import engine
+from .models import Product
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "100"))
+MATCH_MODES = ("substring", "prefix")
+# Postgres has the search indexes; elsewhere the in-memory catalog is scanned
+SEARCH_IN_DATABASE = engine.dialect.name == "postgresql"
+_LOWER_NAME = func.lower(Product.product_name)
+_NAME = Product.product_name
+if engine.dialect.name == "postgresql":
+    # compare by code point whatever the database locale, so both backends
+    # page identically and the expressions match the index
+    _LOWER_NAME, _NAME = _LOWER_NAME.collate("C"), _NAME.collate("C")
+
+
+class SearchArgumentError(ValueError):
+    """A search query parameter is malformed."""
+
+
+def parse_search_args(args):
+    """Return ``(q, mode, limit, after)`` from request args."""
+    mode = args.get("mode", "substring")
+    if mode not in MATCH_MODES:
+        raise SearchArgumentError("mode must be one of " + ", ".join(MATCH_MODES))
+    raw = args.get("limit", str(SEARCH_DEFAULT_LIMIT))
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise SearchArgumentError("limit must be an integer")
+    if not 1 <= limit <= SEARCH_MAX_LIMIT:
+        raise SearchArgumentError(f"limit must be between 1 and {SEARCH_MAX_LIMIT}")
+    return args.get("q", "").strip(), mode, limit, args.get("after") or None
+
+
+def _escape_like(value):
+    return value.replace("/", "//").replace("%", "/%").replace("_", "/_")
+
+
+def search_query(q, mode="substring", limit=SEARCH_DEFAULT_LIMIT, after=None):
+    """The SELECT for one page (plus one row to detect a next page)."""
+    stmt = select(Product.id, Product.product_name, Product.unit_price)
+    if q and mode == "prefix":
+        stmt = stmt.where(_LOWER_NAME.like(_escape_like(q.lower()) + "%", escape="/"))
+    elif q:
+        stmt = stmt.where(Product.product_name.ilike("%" + _escape_like(q) + "%", escape="/"))
+    if after is not None:
+        stmt = stmt.where(tuple_(_LOWER_NAME, _NAME) > tuple_(after.lower(), after))
+    return stmt.order_by(_LOWER_NAME, _NAME).limit(limit + 1)
+
+
+def search_catalog(catalog, q, mode="substring", limit=SEARCH_DEFAULT_LIMIT, after=None):
+    """In-memory twin of ``search_query`` over a catalog snapshot; returns up to ``limit + 1`` products."""
+    needle = q.lower()
+    keys = catalog.search_keys
+    start = bisect_right(keys, (after.lower(), after)) if after is not None else 0
+    if mode == "prefix":
+        # prefix matches are contiguous in key order
+        start = max(start, bisect_left(keys, (needle,)))
+    matches = []
+    for index in range(start, len(keys)):
+        name = keys[index][0]
+        if mode == "prefix" and not name.startswith(needle):
+            break
+        if needle in name:
+            matches.append(catalog.products[index])
+            if len(matches) > limit:
+                break
+    return matches
+
+
+def search_page(rows, limit):
+    """``(products, next_cursor)`` from the ``limit + 1`` rows of a search."""
+    rows = list(rows)
+    products = [
+        {"id": product_id, "product_name": name, "unit_price": float(price)}
+        for product_id, name, price in rows[:limit]
+    ]
+    return products, (products[-1]["product_name"] if len(rows) > limit else None)
@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# point the app at a throwaway SQLite database before mvc_app creates its engine
+_db_dir = tempfile.mkdtemp(prefix="cash-register-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_db_dir, 'test.db')}")
+# tests flush the customer sketch buffer themselves
+os.environ.setdefault("SKETCH_FLUSH_INTERVAL", "3600")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from mvc_app.catalog import catalog_cache  # noqa: E402
+from mvc_app.db import Base, SessionLocal, engine  # noqa: E402
+from mvc_app.sketches import sketch_buffer  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    Base.metadata.drop_all(bind=engine)
+    catalog_cache.invalidate()
+    app = create_app()
+    app.config.update(TESTING=True)
+    yield app
+    sketch_buffer.flush()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def session(app):
+    with SessionLocal() as session:
+        yield session
+
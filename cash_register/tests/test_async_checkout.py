@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("quart")
+
+from mvc_app.models import Purchase, PurchaseItem, TotalProductPurchases, TotalUserPurchases  # noqa: E402
+
+from test_create_purchase import seed_products  # noqa: E402
+
+
+def run(scenario):
+    """Drive the ASGI app's test client, disposing the async pool on the same loop."""
+    import asgi
+
+    async def main():
+        try:
+            return await scenario(asgi.app.test_client())
+        finally:
+            await asgi.async_engine.dispose()
+    return asyncio.run(main())
+
+
+def test_async_create_purchase(app, session):
+    ids = seed_products(session)
+
+    async def scenario(client):
+        items = [{"product_id": ids["apple"], "quantity": 2}, {"product_id": ids["bread"]}]
+        response = await client.post("/create", form={"store_id": "SM1", "user_id": "u1",
+                                                      "items_list": json.dumps(items)})
+        assert response.status_code == 302
+        page = await (await client.get("/")).get_data(as_text=True)
+        assert "Purchase created" in page
+        found = await (await client.get("/products/search?q=APP")).get_json()
+        assert [p["product_name"] for p in found["products"]] == ["apple"]
+    run(scenario)
+
+    purchase = session.query(Purchase).one()
+    assert (purchase.items_list, float(purchase.total_amount)) == ("apple,apple,bread", 2.2)
+    assert session.query(PurchaseItem).count() == 2
+    assert session.query(TotalUserPurchases).filter_by(user_id="u1").one().total_purchases == 1
+
+
+def test_async_batch_matches_sync_rules(app, session):
+    ids = seed_products(session)
+
+    async def scenario(client):
+        response = await client.post("/purchases/batch", json={"purchases": [
+            {"store_id": "SM1", "user_id": "u1", "items": [{"product_id": ids["apple"]}]},
+            {"store_id": "SM1", "user_id": "u2", "items": [{"product_id": 999}]},
+            {"store_id": "SM1", "items": [{"product_id": ids["bread"]}]},
+        ]})
+        body = await response.get_json()
+        assert (body["created"], body["rejected"]) == (1, 2)
+        assert [r["status"] for r in body["results"]] == ["created", "rejected", "rejected"]
+        metrics = await (await client.get("/metrics")).get_data(as_text=True)
+        assert 'http_requests_total{endpoint="main.create_purchases_batch",method="POST",status="200"}' in metrics
+    run(scenario)
+
+    assert session.query(Purchase).count() == 1
+    assert session.query(TotalProductPurchases).filter_by(product_id=ids["apple"]).one().total_purchases == 1
@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import text
+
+from mvc_app.catalog import CATALOG_CHANNEL, CatalogCache, catalog_cache
+from mvc_app.db import engine
+from mvc_app.models import CatalogVersion, Product, Store
+
+from test_create_purchase import checkout, seed_products
+
+
+def bump(session):
+    row = session.get(CatalogVersion, 1)
+    if row is None:
+        session.add(CatalogVersion(id=1, version=1))
+    else:
+        row.version += 1
+    session.commit()
+
+
+def test_cache_serves_catalog_until_version_changes(app, session):
+    seed_products(session)
+    cache = CatalogCache(check_interval=0, listen=False)
+    first = cache.get()
+    assert set(first.products_by_name) == {"apple", "bread"}
+    assert cache.get() is first
+
+    session.add(Store(store_id="SM9"))
+    session.commit()
+    assert cache.get() is first  # not visible until the version is bumped
+    bump(session)
+    assert "SM9" in cache.get().stores_by_id
+    assert cache.stats["reloads"] == 2
+
+
+def test_version_checks_are_throttled(app, session):
+    seed_products(session)
+    cache = CatalogCache(check_interval=3600, listen=False)
+    for _ in range(5):
+        cache.get()
+    assert cache.stats["version_checks"] == 1
+    assert cache.stats["hits"] == 4
+
+
+def test_stats_count_every_lookup_across_threads(app, session):
+    seed_products(session)
+    cache = CatalogCache(check_interval=3600, listen=False)
+    cache.get()
+
+    def lookups():
+        for _ in range(2000):
+            cache.get()
+
+    threads = [threading.Thread(target=lookups) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.metrics()["hits"] == 16000
+
+
+@pytest.mark.skipif(engine.dialect.name != "postgresql", reason="LISTEN/NOTIFY needs Postgres")
+def test_listener_uses_its_own_connection(app, session):
+    seed_products(session)
+    checked_out = engine.pool.checkedout()
+    cache = CatalogCache(check_interval=3600, listen=True)
+    cache.get()
+
+    # notify until the listener has subscribed and seen one
+    deadline = time.monotonic() + 5
+    while cache.metrics()["notifications"] == 0 and time.monotonic() < deadline:
+        with engine.begin() as conn:
+            conn.execute(text(f"NOTIFY {CATALOG_CHANNEL}"))
+        time.sleep(0.05)
+    assert cache.metrics()["notifications"] >= 1
+    assert cache.metrics()["listening"]
+    assert engine.pool.checkedout() == checked_out
+
+
+def test_checkout_rechecks_version_on_unknown_product(client, session):
+    ids = seed_products(session)
+    catalog_cache.get()
+    session.add(Product(product_name="milk", unit_price=2.5))
+    session.commit()
+    bump(session)
+    milk = session.query(Product).filter_by(product_name="milk").one().id
+    checkout(client, "u1", ids["apple"], milk)
+    assert "milk" in catalog_cache.get().products_by_name
+
+    stats = client.get("/catalog/stats").get_json()
+    assert stats["products"] == 3
+    assert stats["reloads"] >= 2
+
+
+def test_metrics_include_catalog_cache(client, session):
+    seed_products(session)
+    client.get("/")
+    body = client.get("/metrics").get_data(as_text=True)
+    assert "# TYPE catalog_cache_hits gauge" in body
+    assert "catalog_cache_products 2" in body
+    assert 'http_request_duration_seconds_count{endpoint="main.index",method="GET"}' in body
@@ -0,0 +1,103 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+
+from mvc_app.db import SessionLocal
+from mvc_app.models import (
+    CustomerSketch, Product, Purchase, PurchaseItem, SalesRollup, TotalProductPurchases, TotalUserPurchases, User,
+)
+from mvc_app.sketches import HyperLogLog, sketch_buffer
+
+
+def seed_products(session):
+    session.add_all([
+        Product(product_name="apple", unit_price=0.5),
+        Product(product_name="bread", unit_price=1.2),
+    ])
+    session.commit()
+    return {p.product_name: p.id for p in session.query(Product)}
+
+
+def checkout(client, user_id, *product_ids):
+    items = [{"product_id": str(pid)} for pid in product_ids]
+    return client.post("/create", data={
+        "store_id": "SM1",
+        "user_id": user_id,
+        "items_list": json.dumps(items),
+        "timestamp": "2025-10-28T08:12:00Z",
+    })
+
+
+def test_create_purchase_writes_purchase_and_counters(client, session):
+    ids = seed_products(session)
+    resp = checkout(client, "u1", ids["apple"], ids["bread"])
+    assert resp.status_code == 302
+
+    purchase = session.query(Purchase).one()
+    assert purchase.items_list == "apple,bread"
+    assert float(purchase.total_amount) == 1.7
+    assert session.query(User).filter_by(user_id="u1").count() == 1
+    assert session.query(TotalUserPurchases).filter_by(user_id="u1").one().total_purchases == 1
+    assert {t.product_id: t.total_purchases for t in session.query(TotalProductPurchases)} == {ids["apple"]: 1, ids["bread"]: 1}
+    lines = {(pi.purchase_id, pi.product_id, pi.quantity, float(pi.line_total)) for pi in session.query(PurchaseItem)}
+    assert lines == {(purchase.id, ids["apple"], 1, 0.5), (purchase.id, ids["bread"], 1, 1.2)}
+    rollups = {(r.store_id, r.product_id): (r.units, float(r.revenue), r.purchase_count) for r in session.query(SalesRollup)}
+    assert rollups == {("SM1", ids["apple"]): (1, 0.5, 1), ("SM1", ids["bread"]): (1, 1.2, 1)}
+
+
+def test_create_purchase_rejects_unknown_product(client, session):
+    seed_products(session)
+    resp = checkout(client, "u1", 999)
+    assert resp.status_code == 302
+    assert session.query(Purchase).count() == 0
+
+
+def test_concurrent_checkouts_do_not_lose_increments(app, session):
+    ids = seed_products(session)
+
+    def run(i):
+        with app.test_client() as client:
+            return checkout(client, f"u{i % 3}", ids["apple"]).status_code
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert set(pool.map(run, range(40))) == {302}
+
+    assert session.query(Purchase).count() == 40
+    assert sum(t.total_purchases for t in session.query(TotalUserPurchases)) == 40
+    assert session.query(TotalProductPurchases).filter_by(product_id=ids["apple"]).one().total_purchases == 40
+
+
+def test_create_purchase_with_quantities(client, session):
+    ids = seed_products(session)
+    items = [{"product_id": ids["apple"], "quantity": 3}, {"product_id": ids["bread"]}]
+    client.post("/create", data={"store_id": "SM1", "user_id": "u1", "items_list": json.dumps(items)})
+    purchase = session.query(Purchase).one()
+    assert purchase.items_list == "apple,apple,apple,bread"
+    assert float(purchase.total_amount) == 2.7
+    assert session.query(TotalProductPurchases).filter_by(product_id=ids["apple"]).one().total_purchases == 3
+    assert session.query(PurchaseItem).filter_by(product_id=ids["apple"]).one().quantity == 3
+
+    items = [{"product_id": ids["apple"], "quantity": 0}]
+    client.post("/create", data={"store_id": "SM1", "user_id": "u1", "items_list": json.dumps(items)})
+    assert session.query(Purchase).count() == 1
+
+
+def test_checkout_sketches_are_buffered_until_flushed(client, session):
+    ids = seed_products(session)
+    for user_id in ("u1", "u2", "u1"):
+        checkout(client, user_id, ids["apple"])
+    # nothing is written per checkout
+    assert session.query(CustomerSketch).count() == 0
+    # a rolled back transaction leaves nothing behind in the buffer
+    with SessionLocal() as rolled_back:
+        sketch_buffer.record(rolled_back, [("SM9", datetime(2025, 10, 28, tzinfo=timezone.utc), "u9")])
+        rolled_back.execute(select(1))
+        rolled_back.rollback()
+
+    assert sketch_buffer.flush() == 1
+    sketch = session.query(CustomerSketch).one()
+    assert (sketch.store_id, sketch.day.isoformat()) == ("SM1", "2025-10-28")
+    assert HyperLogLog.from_bytes(sketch.registers).count() == 2
+    assert sketch_buffer.flush() == 0
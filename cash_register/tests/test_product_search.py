@@ -0,0 +1,58 @@
+import pytest
+
+from mvc_app.catalog import catalog_cache
+from mvc_app.models import Product
+from mvc_app.search import search_catalog, search_page, search_query
+
+NAMES = ["apple", "Apple juice", "banana", "pineapple", "grape", "100% juice", "juice_box"]
+
+
+@pytest.fixture
+def catalog(session):
+    session.add_all(Product(product_name=name, unit_price=1 + i) for i, name in enumerate(NAMES))
+    session.commit()
+    return catalog_cache.refresh()
+
+
+def names(response):
+    return [p["product_name"] for p in response.get_json()["products"]]
+
+
+def test_substring_and_prefix_search(client, catalog):
+    assert names(client.get("/products/search?q=APPLE")) == ["apple", "Apple juice", "pineapple"]
+    assert names(client.get("/products/search?q=apple&mode=prefix")) == ["apple", "Apple juice"]
+    # LIKE wildcards in the query match literally
+    assert names(client.get("/products/search?q=%25")) == ["100% juice"]
+    assert names(client.get("/products/search?q=e_b")) == ["juice_box"]
+    assert names(client.get("/products/search?q=kiwi")) == []
+
+
+def test_search_pages_with_a_name_cursor(client, catalog):
+    first = client.get("/products/search?q=e&limit=3").get_json()
+    assert [p["product_name"] for p in first["products"]] == ["100% juice", "apple", "Apple juice"]
+    assert first["products"][2]["unit_price"] == 2.0
+    assert first["next"] == "Apple juice"
+    second = client.get("/products/search", query_string={"q": "e", "limit": 3, "after": first["next"]}).get_json()
+    assert [p["product_name"] for p in second["products"]] == ["grape", "juice_box", "pineapple"]
+    assert second["next"] is None
+
+
+def test_search_limits_are_bounded(client, catalog):
+    assert client.get("/products/search?limit=0").status_code == 400
+    assert client.get("/products/search?limit=1000").status_code == 400
+    assert client.get("/products/search?mode=fuzzy").status_code == 400
+    assert len(names(client.get("/products/search?limit=2"))) == 2
+
+
+def test_database_and_memory_search_agree(session, catalog):
+    for q, mode in [("apple", "substring"), ("APP", "prefix"), ("", "substring"), ("%", "substring")]:
+        for after in (None, "Apple juice"):
+            in_db = search_page(session.execute(search_query(q, mode, 2, after)).all(), 2)
+            in_memory = search_page(search_catalog(catalog, q, mode, 2, after), 2)
+            assert in_db == in_memory, (q, mode, after)
+
+
+def test_index_no_longer_embeds_the_catalog(client, catalog):
+    page = client.get("/").get_data(as_text=True)
+    assert "pineapple" not in page
+    assert "/products/search" in page
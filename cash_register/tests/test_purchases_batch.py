@@ -0,0 +1,68 @@
+from mvc_app.models import Purchase, PurchaseItem, TotalProductPurchases, TotalUserPurchases
+
+from test_create_purchase import seed_products
+
+
+def test_batch_creates_valid_purchases_and_reports_each(client, session):
+    ids = seed_products(session)
+    apple, bread = {"product_id": ids["apple"]}, {"product_id": ids["bread"]}
+    resp = client.post("/purchases/batch", json={"purchases": [
+        {"store_id": "SM1", "user_id": "u1", "items": [apple, bread], "timestamp": "2025-10-28T08:00:00Z"},
+        {"store_id": "SM1", "user_id": "u1", "items": [apple]},
+        {"store_id": "SM1", "user_id": "u2", "items": [apple, apple]},
+        {"store_id": "SM2", "user_id": "u2", "items": [{"product_id": 999}]},
+        {"store_id": "SM2", "user_id": "u2", "items": "[]"},
+        "not a purchase",
+    ]})
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["created"] == 2
+    assert [r["status"] for r in body["results"]] == ["created", "created"] + ["rejected"] * 4
+    assert body["results"][2]["error"] == "Duplicate products found in items list"
+
+    assert sorted(float(p.total_amount) for p in session.query(Purchase)) == [0.5, 1.7]
+    assert session.query(TotalUserPurchases).filter_by(user_id="u1").one().total_purchases == 2
+    assert {t.product_id: t.total_purchases for t in session.query(TotalProductPurchases)} == {ids["apple"]: 2, ids["bread"]: 1}
+    assert session.query(PurchaseItem).count() == 3
+
+
+def test_batch_rejects_malformed_and_oversized_requests(client, monkeypatch):
+    from mvc_app import controllers
+
+    assert client.post("/purchases/batch", json={"nope": []}).status_code == 400
+    monkeypatch.setattr(controllers, "BATCH_MAX_PURCHASES", 1)
+    assert client.post("/purchases/batch", json={"purchases": [{}, {}]}).status_code == 413
+
+
+def test_batch_rejects_fractional_and_oversized_quantities(client, session, monkeypatch):
+    from mvc_app import checkout
+
+    ids = seed_products(session)
+    monkeypatch.setattr(checkout, "MAX_QUANTITY", 5)
+    body = client.post("/purchases/batch", json={"purchases": [
+        {"store_id": "SM1", "user_id": "u1", "items": [{"product_id": ids["apple"], "quantity": 2.9}]},
+        {"store_id": "SM1", "user_id": "u1", "items": [{"product_id": ids["apple"], "quantity": 6}]},
+        {"store_id": "SM1", "user_id": "u1", "items": [{"product_id": ids["apple"], "quantity": "2"}]},
+        {"store_id": "SM1", "user_id": "u1", "items": [{"product_id": ids["apple"], "quantity": 5}]},
+    ]}).get_json()
+    assert [r["status"] for r in body["results"]] == ["rejected"] * 3 + ["created"]
+    assert body["results"][1]["error"] == "Quantities must not exceed 5"
+    assert session.query(Purchase).one().items_list == ",".join(["apple"] * 5)
+
+
+def test_batch_rejects_non_string_ids(client, session):
+    ids = seed_products(session)
+    apple = [{"product_id": ids["apple"]}]
+    body = client.post("/purchases/batch", json={"purchases": [
+        {"store_id": "SM1", "user_id": "u1", "items": apple},
+        {"store_id": "SM1", "user_id": 42, "items": apple},
+        {"store_id": {"id": "SM1"}, "user_id": "u2", "items": apple},
+        {"store_id": "SM1", "user_id": "   ", "items": apple},
+        {"store_id": " SM2 ", "user_id": " u3 ", "items": apple},
+    ]})
+    assert body.status_code == 200
+    results = body.get_json()["results"]
+    assert [r["status"] for r in results] == ["created", "rejected", "rejected", "rejected", "created"]
+    assert results[1]["error"] == results[2]["error"] == "store_id and user_id must be strings"
+    assert results[3]["error"] == "store_id and user_id are required"
+    assert sorted((p.supermarket_id, p.user_id) for p in session.query(Purchase)) == [("SM1", "u1"), ("SM2", "u3")]
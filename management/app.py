@@ -2,8 +2,13 @@ from flask import Flask
 import os
 
 from mvc_app.controllers import bp as main_bp
-from mvc_app.db import create_tables
-import mvc_app.models
+from mvc_app.commands import (
+    backfill_line_items_command, rebuild_product_totals_command, rebuild_rollups_command, rebuild_sketches_command,
+)
+from mvc_app.db import ensure_schema
+from mvc_app.jobs import recover_interrupted_jobs
+from mvc_app import metrics
+from mvc_app.models import SCHEMA_VERSION
 from mvc_app.logging_config import setup_logging
 
 # Replace monolith with MVC app factory bootstrap
@@ -15,8 +20,15 @@ def create_app(test_config=None):
     app = Flask(__name__, template_folder=os.path.join(os.path.dirname(__file__), "mvc_app", "templates"))
     app.secret_key = os.getenv("SECRET_KEY", "dev-secret")
     app.register_blueprint(main_bp)
-    # ensure tables exist
-    create_tables()
+    metrics.init_app(app)
+    app.cli.add_command(rebuild_sketches_command)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(backfill_line_items_command)
+    app.cli.add_command(rebuild_product_totals_command)
+    # one version query on restart; create_all only for a new or older schema
+    ensure_schema("management", SCHEMA_VERSION)
+    # jobs a crashed or restarted worker left unfinished never complete on their own
+    recover_interrupted_jobs()
     return app
 
 
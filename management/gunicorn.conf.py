@@ -0,0 +1,28 @@
+"""gunicorn settings; worker count and preloading come from the environment.
+
+With ``GUNICORN_PRELOAD`` (the default) the app is imported and the schema
+version checked once in the master, and workers are forked from it. Pooled
+connections opened by the master are dropped in each child so no socket
+is shared across processes; background threads (import jobs) start on
+first use, after the fork. The upload stack (pandas) is imported in the
+master before forking, so workers share it instead of each loading it on
+their first upload.
+"""
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1").lower() in ("1", "true", "yes", "on")
+
+
+def post_fork(server, worker):
+    from mvc_app.db import engine, read_engine
+
+    engine.dispose(close=False)
+    read_engine.dispose(close=False)
+
+
+def when_ready(server):
+    if preload_app:
+        import pandas  # noqa: F401
@@ -0,0 +1,99 @@
+"""Backfill of ``purchase_items`` line items from legacy ``items_list`` strings."""
+import logging
+from collections import Counter
+
+from sqlalchemy import func, insert, select
+
+from .bulk import dialect_insert, increment_product_purchases
+from .db import SessionLocal
+from .models import BackfillProgress, Product, Purchase, PurchaseItem, TotalProductPurchases
+
+LINE_ITEMS_BACKFILL = "purchase_items"
+
+logger = logging.getLogger("app.backfill")
+
+
+def backfill_line_items(batch_size=5000, max_batches=None):
+    """Create line items for purchases that only have an ``items_list``.
+
+    Purchases are walked in id order, one committed batch at a time; the
+    last processed id is stored in ``backfill_progress`` so an interrupted
+    run resumes where it stopped. Purchases that already have line items
+    (written by the dual-write paths) are skipped. Names are priced at the
+    current unit price; unknown names are skipped and logged.
+
+    Legacy purchases were counted in the old counter table, not in
+    ``product_total_purchases``, so each batch also adds its units there,
+    in the same transaction as the line items and the watermark.
+
+    Returns ``(purchases_backfilled, last_id)``.
+    """
+    with SessionLocal() as session:
+        products = {name: (pid, float(price)) for pid, name, price in
+                    session.execute(select(Product.id, Product.product_name, Product.unit_price))}
+        last_id = session.execute(
+            select(BackfillProgress.last_id).where(BackfillProgress.name == LINE_ITEMS_BACKFILL)).scalar() or 0
+    backfilled = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with SessionLocal() as session:
+            rows = session.execute(
+                select(Purchase.id, Purchase.items_list).where(Purchase.id > last_id).order_by(Purchase.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            ids = [purchase_id for purchase_id, _ in rows]
+            done = set(session.execute(
+                select(PurchaseItem.purchase_id).where(PurchaseItem.purchase_id.in_(ids)).distinct()).scalars())
+            items = []
+            units = Counter()
+            for purchase_id, items_list in rows:
+                if purchase_id in done:
+                    continue
+                names = Counter(name.strip() for name in items_list.split(",") if name.strip())
+                unknown = [name for name in names if name not in products]
+                if unknown:
+                    logger.warning("Purchase %d lists unknown product(s): %s", purchase_id, ", ".join(unknown))
+                items.extend(
+                    {"purchase_id": purchase_id, "product_id": products[name][0], "quantity": qty,
+                     "line_total": products[name][1] * qty}
+                    for name, qty in names.items() if name in products
+                )
+                units.update({products[name][0]: qty for name, qty in names.items() if name in products})
+                backfilled += 1
+            if items:
+                session.execute(insert(PurchaseItem.__table__), items)
+                increment_product_purchases(session, units)
+            last_id = ids[-1]
+            _save_progress(session, last_id)
+            session.commit()
+        batches += 1
+        logger.info("Backfilled line items up to purchase %d", last_id)
+    return backfilled, last_id
+
+
+def rebuild_product_totals(session):
+    """Recompute ``product_total_purchases`` from ``purchase_items``.
+
+    For databases whose line items were backfilled before the backfill
+    counted units. Runs in the caller's transaction; returns the number of
+    products counted.
+    """
+    table = TotalProductPurchases.__table__
+    session.execute(table.delete())
+    totals = select(PurchaseItem.product_id, func.sum(PurchaseItem.quantity)).group_by(PurchaseItem.product_id)
+    return session.execute(insert(table).from_select(["product_id", "total_purchases"], totals)).rowcount
+
+
+def _save_progress(session, last_id):
+    table = BackfillProgress.__table__
+    stmt = dialect_insert(session, table)
+    if stmt is not None:
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c.name], set_={"last_id": stmt.excluded.last_id})
+        session.execute(stmt, {"name": LINE_ITEMS_BACKFILL, "last_id": last_id})
+        return
+    progress = session.get(BackfillProgress, LINE_ITEMS_BACKFILL)
+    if progress is None:
+        session.add(BackfillProgress(name=LINE_ITEMS_BACKFILL, last_id=last_id))
+    else:
+        progress.last_id = last_id
@@ -0,0 +1,153 @@
+"""Bulk write helpers shared by the import and checkout paths."""
+from sqlalchemy import bindparam, func, insert, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .models import Purchase, PurchaseItem, TotalProductPurchases, TotalUserPurchases
+
+# rows per statement; keeps us well below the bind parameter limits of both backends
+BATCH_SIZE = 5000
+
+
+def chunked(seq, size=BATCH_SIZE):
+    seq = list(seq)
+    for start in range(0, len(seq), size):
+        yield seq[start:start + size]
+
+
+def dialect_insert(session, table):
+    """Return a dialect specific INSERT supporting ON CONFLICT, or None."""
+    name = session.get_bind().dialect.name
+    if name == "postgresql":
+        return postgresql.insert(table)
+    if name == "sqlite":
+        return sqlite.insert(table)
+    return None
+
+
+def insert_missing(session, model, column, values):
+    """Insert a row for every value of ``model.column`` not in the table yet.
+
+    Existing values are resolved with one IN query per batch. Returns the
+    number of rows inserted.
+    """
+    table = model.__table__
+    col = table.c[column]
+    wanted = sorted(set(values))
+    existing = set()
+    for batch in chunked(wanted):
+        existing.update(session.execute(select(col).where(col.in_(batch))).scalars())
+    missing = [{column: v} for v in wanted if v not in existing]
+    if not missing:
+        return 0
+    stmt = dialect_insert(session, table)
+    # a concurrent writer may have created the row since our lookup
+    stmt = stmt.on_conflict_do_nothing(index_elements=[col]) if stmt is not None else insert(table)
+    for batch in chunked(missing):
+        session.execute(stmt, batch)
+    return len(missing)
+
+
+def upsert_add(session, model, keys, columns, deltas):
+    """Atomically add deltas to the counter ``columns`` of rows keyed by ``keys``.
+
+    ``deltas`` maps key tuples to tuples of values, one per column. Missing
+    rows are created. The addition happens in SQL (``column = column +
+    delta``) so concurrent transactions never lose updates; rows are written
+    in sorted key order to keep lock order stable.
+    """
+    if not deltas:
+        return
+    table = model.__table__
+    rows = [dict(zip(keys + columns, key + tuple(values))) for key, values in sorted(deltas.items())]
+    stmt = dialect_insert(session, table)
+    if stmt is not None:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[k] for k in keys],
+            set_={c: func.coalesce(table.c[c], 0) + stmt.excluded[c] for c in columns},
+        )
+        for batch in chunked(rows):
+            session.execute(stmt, batch)
+        return
+    key_cols = tuple_(*(table.c[k] for k in keys))
+    existing = set()
+    for batch in chunked(sorted(deltas)):
+        existing.update(tuple(r) for r in session.execute(select(*(table.c[k] for k in keys)).where(key_cols.in_(batch))))
+    updates = [
+        {**{f"b_{k}": r[k] for k in keys}, **{f"b_{c}": r[c] for c in columns}}
+        for r in rows if tuple(r[k] for k in keys) in existing
+    ]
+    inserts = [r for r in rows if tuple(r[k] for k in keys) not in existing]
+    if updates:
+        session.execute(
+            table.update()
+            .where(*(table.c[k] == bindparam(f"b_{k}") for k in keys))
+            .values({c: func.coalesce(table.c[c], 0) + bindparam(f"b_{c}") for c in columns}),
+            updates,
+        )
+    if inserts:
+        session.execute(insert(table), inserts)
+
+
+def upsert_increment(session, model, key, column, deltas):
+    """Atomically add ``deltas[k]`` to ``model.column`` for every key ``k``."""
+    upsert_add(session, model, (key,), (column,), {(k,): (d,) for k, d in deltas.items()})
+
+
+def insert_purchases(session, purchases, skip_duplicates=False):
+    """Insert ``(row, lines)`` pairs into ``purchases`` and ``purchase_items``.
+
+    ``row`` holds the purchase column values and ``lines`` lists
+    ``(product_id, quantity, line_total)``. Purchases are inserted with
+    executemany + RETURNING so their line items can be written in bulk too.
+    Returns the new purchase ids in input order.
+
+    With ``skip_duplicates`` every row must carry a distinct ``row_hash``; rows whose
+    hash is already stored are left out (ON CONFLICT DO NOTHING) together
+    with their line items, and get ``None`` in the returned list.
+    """
+    purchases_table = Purchase.__table__
+    ids = []
+    for batch in chunked(purchases):
+        rows = [row for row, _ in batch]
+        if skip_duplicates:
+            new_ids = _insert_new_purchases(session, rows)
+        else:
+            stmt = insert(purchases_table).returning(purchases_table.c.id, sort_by_parameter_order=True)
+            new_ids = session.execute(stmt, rows).scalars().all()
+        items = [
+            {"purchase_id": purchase_id, "product_id": product_id, "quantity": quantity, "line_total": line_total}
+            for purchase_id, (_, lines) in zip(new_ids, batch) if purchase_id is not None
+            for product_id, quantity, line_total in lines
+        ]
+        for item_batch in chunked(items):
+            session.execute(insert(PurchaseItem.__table__), item_batch)
+        ids.extend(new_ids)
+    return ids
+
+
+def _insert_new_purchases(session, rows):
+    purchases_table = Purchase.__table__
+    row_hash = purchases_table.c.row_hash
+    stmt = dialect_insert(session, purchases_table)
+    if stmt is not None:
+        new_rows = rows
+        stmt = stmt.on_conflict_do_nothing(index_elements=["row_hash"])
+    else:
+        existing = set(session.execute(select(row_hash).where(row_hash.in_([r["row_hash"] for r in rows]))).scalars())
+        new_rows = [r for r in rows if r["row_hash"] not in existing]
+        stmt = insert(purchases_table)
+    inserted = {}
+    if new_rows:
+        # conflicting rows return nothing, so the new ids are matched up by hash
+        inserted = {h: i for i, h in session.execute(stmt.returning(purchases_table.c.id, row_hash), new_rows)}
+    return [inserted.get(r["row_hash"]) for r in rows]
+
+
+def increment_user_purchases(session, deltas):
+    """Add per-user purchase counts to ``user_total_purchases``."""
+    upsert_increment(session, TotalUserPurchases, "user_id", "total_purchases", deltas)
+
+
+def increment_product_purchases(session, deltas):
+    """Add per-product unit counts to ``product_total_purchases``."""
+    upsert_increment(session, TotalProductPurchases, "product_id", "total_purchases", deltas)
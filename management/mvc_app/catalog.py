@@ -0,0 +1,18 @@
+"""Catalog change notifications for the cash register's catalog cache."""
+from sqlalchemy import text
+
+from .bulk import upsert_increment
+from .models import CatalogVersion
+
+CATALOG_CHANNEL = "catalog_changed"
+
+
+def bump_catalog_version(session):
+    """Bump the catalog version inside the caller's transaction.
+
+    On Postgres a NOTIFY is queued as well; it is delivered on commit so
+    listeners never reload before the new rows are visible.
+    """
+    upsert_increment(session, CatalogVersion, "id", "version", {1: 1})
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(text(f"NOTIFY {CATALOG_CHANNEL}"))
@@ -0,0 +1,50 @@
+"""Maintenance commands, run with ``flask --app app <command>``."""
+import click
+
+from .backfill import backfill_line_items, rebuild_product_totals
+from .db import SessionLocal
+from .rollups import rebuild_sales_rollups
+from .sketches import rebuild_customer_sketches
+
+
+@click.command("rebuild-sketches")
+def rebuild_sketches_command():
+    """Recompute the unique customer sketches from the purchases table.
+
+    Upgrades build missing sketches themselves; run this after a cash
+    register worker died with checkout sketches still buffered.
+    """
+    with SessionLocal() as session:
+        count = rebuild_customer_sketches(session)
+        session.commit()
+    click.echo(f"Rebuilt customer sketches from {count} purchases")
+
+
+@click.command("rebuild-rollups")
+def rebuild_rollups_command():
+    """Recompute the sales rollups and purchase counts from the purchases table.
+
+    Run once after upgrading an existing database: the rollups start empty
+    and /analytics/sales reports nothing until they are filled.
+    """
+    with SessionLocal() as session:
+        count = rebuild_sales_rollups(session)
+        session.commit()
+    click.echo(f"Rebuilt sales rollups from {count} purchases")
+
+
+@click.command("backfill-line-items")
+@click.option("--batch-size", default=5000, show_default=True, help="Purchases per committed batch.")
+def backfill_line_items_command(batch_size):
+    """Create purchase_items rows from legacy items_list strings (resumable)."""
+    count, last_id = backfill_line_items(batch_size=batch_size)
+    click.echo(f"Backfilled line items for {count} purchases (up to purchase {last_id})")
+
+
+@click.command("rebuild-product-totals")
+def rebuild_product_totals_command():
+    """Recompute the best sellers counters from purchase_items."""
+    with SessionLocal() as session:
+        count = rebuild_product_totals(session)
+        session.commit()
+    click.echo(f"Rebuilt purchase totals for {count} products")
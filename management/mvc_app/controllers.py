@@ -1,10 +1,19 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
-from .db import SessionLocal
-from .models import Product, Purchase, PurchaseItem, User, TotalUserPurchases, Store
+from flask import Blueprint, Response, render_template, request, redirect, url_for, flash, jsonify
+from .db import ReadSessionLocal, SessionLocal
+from .models import Product, Purchase, PurchaseItem, User, TotalUserPurchases, Store, ImportJob
 from .logging_config import setup_logging
-import pandas as pd
-from dateutil import parser
+from .exports import EXPORT_FORMATS, ExportFormatUnavailable, export_stream
+from .importers import format_row_errors, import_products_chunk, import_purchases
+from .jobs import get_manager as get_job_manager, job_status
+from .reports import (
+    GRANULARITIES, MAX_PAGE_SIZE, MAX_TOP_N, SALES_GROUPS, ReportArgumentError, loyal_customers_page, parse_filters,
+    parse_int_arg, sales_report, top_sellers, unique_customers_report,
+)
+from .streaming import (
+    PRODUCT_DTYPES, PURCHASE_DTYPES, InvalidCSVError, imported_file, read_columns, spool_upload, stream_import,
+)
 import logging
+import os
 
 bp = Blueprint("main", __name__)
 
@@ -12,6 +21,37 @@ bp = Blueprint("main", __name__)
 def index():
     return render_template("index.html")
 
+
+def wants_background():
+    """Uploads run as background jobs when asked to, or when IMPORT_BACKGROUND is set."""
+    flag = request.values.get("background", os.getenv("IMPORT_BACKGROUND", "0"))
+    return flag.lower() in ("1", "true", "yes", "on")
+
+
+def wants_json():
+    return request.accept_mimetypes.best == "application/json"
+
+
+def queue_import_job(kind, path, upload_key):
+    job_id = get_job_manager().submit(kind, path, upload_key)
+    status_url = url_for("main.job_status_view", job_id=job_id)
+    if wants_json():
+        return jsonify({"job_id": job_id, "status_url": status_url}), 202
+    flash(f"Import job {job_id} queued; follow its progress at {status_url}")
+    return redirect(url_for("main.index"))
+
+
+def column_problem(path, required):
+    """Why a spooled upload can't be imported, or None when it has the ``required`` columns."""
+    try:
+        columns = read_columns(path)
+    except InvalidCSVError:
+        return "The uploaded file is not a valid CSV"
+    if not required.issubset(columns):
+        return f"CSV must have columns: {', '.join(sorted(required))}"
+    return None
+
+
 @bp.route("/upload_products", methods=["POST"])
 def upload_products():
     logger = logging.getLogger("app.upload_products")
@@ -20,27 +60,34 @@ def upload_products():
         flash("No file uploaded")
         logger.warning("No file uploaded")
         return redirect(url_for("main.index"))
-    df = pd.read_csv(f)
-    if "product_name" not in df.columns or "unit_price" not in df.columns:
-        flash("CSV must have 'product_name' and 'unit_price'")
-        logger.warning("CSV missing required columns")
-        return redirect(url_for("main.index"))
-    session = SessionLocal()
+    path, upload_key = spool_upload(f, "products")
+    queued = False
     try:
-        logger.info("Uploading %d products", len(df))
-        for _, row in df.iterrows():
-            name = str(row["product_name"]).strip()
-            price = float(row["unit_price"])
-            existing = session.query(Product).filter_by(product_name=name).first()
-            if existing:
-                logger.debug("Updating price for %s", name)
-                existing.unit_price = price
-            else:
-                session.add(Product(product_name=name, unit_price=price))
-        session.commit()
+        problem = column_problem(path, {"product_name", "unit_price"})
+        if problem:
+            flash(problem)
+            logger.warning("Rejected products upload %s: %s", upload_key, problem)
+            return redirect(url_for("main.index"))
+        if wants_background():
+            response = queue_import_job("products", path, upload_key)
+            queued = True  # the job owns the spool file now
+            return response
+        logger.info("Uploading products from %s", upload_key)
+        counts = stream_import(path, upload_key, import_products_chunk, dtype=PRODUCT_DTYPES)
+    except Exception:
+        logger.exception("Products upload failed")
+        flash("Products upload was interrupted; upload the same file again to resume.")
+        return redirect(url_for("main.index"))
     finally:
-        session.close()
-    flash(f"Loaded {len(df)} products.")
+        if not queued:
+            os.remove(path)
+    flash(
+        f"Loaded {counts.get('inserted', 0) + counts.get('updated', 0) + counts.get('unchanged', 0)} products "
+        f"({counts.get('inserted', 0)} new, {counts.get('updated', 0)} updated, "
+        f"{counts.get('unchanged', 0)} unchanged)."
+    )
+    if counts.get("errors"):
+        flash(format_row_errors(counts["errors"], counts["error_count"]))
     return redirect(url_for("main.index"))
 
 @bp.route("/upload_purchases", methods=["POST"])
@@ -51,124 +98,154 @@ def upload_purchases():
         flash("No file uploaded")
         logger.warning("No file uploaded")
         return redirect(url_for("main.index"))
-    df = pd.read_csv(f)
-    expected_cols = {"supermarket_id", "timestamp", "user_id", "items_list", "total_amount"}
-    if not expected_cols.issubset(df.columns):
-        flash(f"CSV must have columns: {', '.join(expected_cols)}")
-        logger.warning("CSV missing required columns")
-        return redirect(url_for("main.index"))
-    inserted_count = 0
-    session = SessionLocal()
+    path, upload_key = spool_upload(f, "purchases")
+    queued = False
     try:
-        logger.info("Uploading %d purchases", len(df))
-        for _, row in df.iterrows():
-            supermarket_id = str(row["supermarket_id"]).strip()
-            timestamp = parser.parse(str(row["timestamp"]))
-            user_id = str(row["user_id"]).strip()
-            items_list_str = str(row["items_list"])
-            total_amount = float(row["total_amount"])
-            # Handle User
-            user = session.query(User).filter_by(user_id=user_id).first()
-            if not user:
-                logger.debug("Creating new user %s", user_id)
-                new_user = User(user_id=user_id)
-                new_total = TotalUserPurchases(user_id=user_id, total_purchases=1)
-                session.add(new_user)
-                session.add(new_total)
-                session.commit()
-            else:
-                logger.debug("Updating user %s", user_id)
-                existing_total = session.query(TotalUserPurchases).filter_by(user_id=user_id).first()
-                existing_total.total_purchases = (existing_total.total_purchases or 0) + 1
-                session.commit()
-            # Handle Items
-            items_list = [i.strip() for i in items_list_str.split(",") if i.strip()]
-            for item_name in items_list:
-                product_db_record = session.query(Product).filter_by(product_name=item_name).first()
-                if not product_db_record:
-                    logger.debug("Creating new product %s", item_name)
-                    session.rollback()
-                    return redirect(url_for("main.index"))
-                # Handle PurchaseItem
-                purchase_item = session.query(PurchaseItem).filter_by(product_id=product_db_record.id).first()
-                if not purchase_item:
-                    logger.debug("Creating new PurchaseItem for product %s", item_name)
-                    new_pi = PurchaseItem(product_id=product_db_record.id, total_purchases=1)
-                    session.add(new_pi)
-                else:
-                    purchase_item.total_purchases += 1
-                session.commit()
-            # Handle Store
-            store = session.query(Store).filter_by(store_id=supermarket_id).first()
-            if not store:
-                logger.debug("Store %s doesn't exist in the database", supermarket_id)
-                new_store = Store(store_id=supermarket_id)
-                session.add(new_store)
-                session.commit()
-            # Create Purchase
-            purchase = Purchase(
-                supermarket_id=supermarket_id,
-                timestamp=timestamp,
-                user_id=user_id,
-                items_list=items_list_str,
-                total_amount=total_amount
-            )
-            session.add(purchase)
-            inserted_count += 1
-            session.flush()
+        problem = column_problem(path, {"supermarket_id", "timestamp", "user_id", "items_list", "total_amount"})
+        if problem:
+            flash(problem)
+            logger.warning("Rejected purchases upload %s: %s", upload_key, problem)
+            return redirect(url_for("main.index"))
+        previous = imported_file(upload_key)
+        if previous is not None:
+            # byte-identical to a file that was fully imported before
+            logger.info("Skipping %s, imported at %s", upload_key, previous.imported_at)
+            if wants_json():
+                return jsonify({"inserted": 0, "duplicates": previous.rows, "already_imported": True})
+            flash(f"This file was already imported; skipped all {previous.rows} rows.")
+            return redirect(url_for("main.index"))
+        if wants_background():
+            response = queue_import_job("purchases", path, upload_key)
+            queued = True  # the job owns the spool file now
+            return response
+        logger.info("Uploading purchases from %s", upload_key)
+        result = stream_import(path, upload_key, import_purchases, dtype=PURCHASE_DTYPES)
+    except Exception:
+        logger.exception("Purchases upload failed")
+        flash("Purchases upload was interrupted; upload the same file again to resume.")
+        return redirect(url_for("main.index"))
     finally:
-        session.close()
-    flash(f"Loaded {inserted_count} purchases successfully.")
-    logger.info("Loaded %d purchases successfully.", inserted_count)
+        if not queued:
+            os.remove(path)
+    inserted = result.get("inserted", 0)
+    flash(f"Loaded {inserted} purchases successfully.")
+    if result.get("duplicates"):
+        flash(f"Skipped {result['duplicates']} duplicate rows that were already imported.")
+    if result["resumed_chunks"]:
+        flash(f"Resumed an interrupted upload; skipped {result['resumed_chunks']} committed chunks.")
+    if result.get("errors"):
+        flash(format_row_errors(result["errors"], result["error_count"]))
+    logger.info("Loaded %d purchases successfully.", inserted)
     return redirect(url_for("main.index"))
 
+@bp.route("/jobs/<job_id>")
+def job_status_view(job_id):
+    with SessionLocal() as session:
+        job = session.get(ImportJob, job_id)
+        if job is None:
+            return jsonify({"error": "job not found"}), 404
+        return jsonify(job_status(job))
+
 @bp.route('/loyal_customers')
 def loyal_customers():
-    session = SessionLocal()
+    logger = logging.getLogger("app.loyal_customers")
     try:
-        threshold = 3
-        loyal = session.query(User).join(TotalUserPurchases).filter(TotalUserPurchases.total_purchases >= threshold).order_by(TotalUserPurchases.total_purchases.desc()).all()
-        trimmed = [(c.user_id, c.total_purchases.total_purchases) for c in loyal]
-        logging.getLogger("app.loyal_customers").info("Number of loyal customers: %d", len(trimmed))
-        return render_template('loyal_customers.html', loyal_customers_list=trimmed)
-    finally:
-        session.close()
+        threshold = parse_int_arg(request.args, "threshold", 3, 1, 2 ** 31 - 1)
+        limit = parse_int_arg(request.args, "limit", 100, 1, MAX_PAGE_SIZE)
+        after = request.args.get("after")
+        session = ReadSessionLocal()
+        try:
+            rows, next_cursor = loyal_customers_page(session, threshold=threshold, limit=limit, after=after)
+        finally:
+            session.close()
+    except ReportArgumentError as exc:
+        return str(exc), 400
+    logger.info("Loyal customers page: %d rows", len(rows))
+    if request.args.get("format") == "json":
+        return jsonify({
+            "threshold": threshold,
+            "customers": [{"user_id": user_id, "total_purchases": total} for user_id, total in rows],
+            "next": next_cursor,
+        })
+    next_url = url_for("main.loyal_customers", threshold=threshold, limit=limit, after=next_cursor) if next_cursor else None
+    return render_template('loyal_customers.html', loyal_customers_list=rows, threshold=threshold, next_url=next_url)
 
 @bp.route('/unique_customers')
 def unique_customers():
-    session = SessionLocal()
+    logger = logging.getLogger("app.unique_customers")
+    mode = request.args.get("mode", "approx")
+    granularity = request.args.get("granularity", "total")
+    if mode not in ("approx", "exact") or granularity not in GRANULARITIES:
+        return "mode must be approx or exact; granularity must be one of " + ", ".join(GRANULARITIES), 400
+    try:
+        store, start, end = parse_filters(request.args)
+    except ReportArgumentError as exc:
+        return str(exc), 400
+    session = ReadSessionLocal()
     try:
-        count = session.query(User).count()
-        logging.getLogger("app.unique_customers").info("Number of unique customers: %d", count)
-        return render_template('unique_customers.html', unique_customers_count=count)
+        rows, error = unique_customers_report(session, mode=mode, granularity=granularity, store=store, start=start, end=end)
     finally:
         session.close()
+    logger.info("Unique customers (%s, %s): %d periods", mode, granularity, len(rows))
+    if request.args.get("format") == "json":
+        return jsonify({
+            "mode": mode,
+            "granularity": granularity,
+            "relative_error": error,
+            "periods": [{"start": bucket.isoformat() if bucket else None, "customers": count} for bucket, count in rows],
+        })
+    return render_template('unique_customers.html', rows=rows, mode=mode, granularity=granularity,
+                           relative_error=error, store=store, start=start, end=end,
+                           unique_customers_count=rows[0][1] if granularity == "total" else None)
+
+@bp.route("/analytics/sales")
+def analytics_sales():
+    """Sales totals from the rollup tables, optionally grouped by store, day and product."""
+    group_by = [g for g in request.args.get("group_by", "").split(",") if g]
+    if any(g not in SALES_GROUPS for g in group_by):
+        return jsonify({"error": "group_by must be a comma separated subset of " + ", ".join(SALES_GROUPS)}), 400
+    try:
+        store, start, end = parse_filters(request.args)
+        limit = parse_int_arg(request.args, "limit", 1000, 1, 10000)
+    except ReportArgumentError as exc:
+        return jsonify({"error": str(exc)}), 400
+    session = ReadSessionLocal()
+    try:
+        rows = sales_report(session, group_by=group_by, store=store, start=start, end=end,
+                            product=request.args.get("product") or None, limit=limit)
+    finally:
+        session.close()
+    return jsonify({"group_by": group_by, "rows": rows})
 
 @bp.route('/best_sellers')
 def best_sellers():
-    session = SessionLocal()
+    logger = logging.getLogger("app.best_sellers")
+    try:
+        n = parse_int_arg(request.args, "n", 3, 1, MAX_TOP_N)
+        store, start, end = parse_filters(request.args)
+    except ReportArgumentError as exc:
+        return str(exc), 400
+    session = ReadSessionLocal()
     try:
-        logger = logging.getLogger("app.best_sellers")
-        items = session.query(PurchaseItem).join(Product).order_by(PurchaseItem.total_purchases.desc()).all()
-        top_sellers_numbers = []
-        top_sellers = []
-        for item in items:
-            if len(set(top_sellers_numbers)) <= 3:
-                checked_item_total_purchases = item.total_purchases
-                checked_item_product_name = item.product.product_name
-                if checked_item_total_purchases in top_sellers_numbers:
-                    top_sellers.append((checked_item_product_name, checked_item_total_purchases))
-                    continue
-                else:
-                    if len(set(top_sellers_numbers)) < 3:
-                        top_sellers_numbers.append(checked_item_total_purchases)
-                        top_sellers.append((checked_item_product_name, checked_item_total_purchases))
-                    else:
-                        break
-            else:
-                break
-        logging.getLogger("app.best_sellers").info("Top selling products retrieved")
-        return render_template('best_sellers.html', top_sellers=top_sellers)
+        top = top_sellers(session, n=n, store=store, start=start, end=end)
+        logger.info("Top selling products retrieved")
+        return render_template('best_sellers.html', top_sellers=top, n=n, store=store, start=start, end=end)
     finally:
         session.close()
 
+@bp.route("/export/<any(purchases, products):table>")
+def export(table):
+    """Stream a table as CSV (default), Arrow or Parquet; purchases take store/start/end filters."""
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": "format must be one of " + ", ".join(EXPORT_FORMATS)}), 400
+    try:
+        store, start, end = parse_filters(request.args)
+        chunks = export_stream(table, fmt, store=store, start=start, end=end)
+    except ReportArgumentError as exc:
+        return jsonify({"error": str(exc)}), 400
+    except ExportFormatUnavailable as exc:
+        return jsonify({"error": str(exc)}), 501
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    return Response(chunks, mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename={table}.{extension}"})
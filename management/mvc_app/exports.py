@@ -0,0 +1,147 @@
+"""Streaming CSV / Arrow / Parquet exports of purchases and products.
+
+Rows are read with ``yield_per`` (a server-side cursor on Postgres) and
+encoded one batch of ``EXPORT_BATCH_ROWS`` at a time, so memory stays flat
+whatever the table size and the header goes out before the query runs.
+Arrow and Parquet need the optional ``pyarrow`` (``requirements-export.txt``);
+it is imported on first use.
+"""
+import csv
+import io
+import logging
+import os
+
+from sqlalchemy import select
+
+from .db import ReadSessionLocal
+from .models import Product, Purchase
+from .reports import purchase_filters
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "10000"))
+
+# format -> (mimetype, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+logger = logging.getLogger("app.exports")
+
+
+class ExportFormatUnavailable(RuntimeError):
+    """The requested format needs an optional dependency that isn't installed."""
+
+
+# table -> (columns, arrow type names); amounts are exported as float64
+EXPORTS = {
+    "purchases": (
+        [Purchase.id, Purchase.supermarket_id, Purchase.timestamp, Purchase.user_id, Purchase.items_list,
+         Purchase.total_amount],
+        ["int64", "string", "timestamp", "string", "string", "float64"],
+    ),
+    "products": (
+        [Product.id, Product.product_name, Product.unit_price],
+        ["int64", "string", "float64"],
+    ),
+}
+
+
+def export_query(table, store=None, start=None, end=None):
+    columns, _ = EXPORTS[table]
+    stmt = select(*columns).order_by(columns[0])
+    if table == "purchases":
+        stmt = stmt.where(*purchase_filters(store, start, end))
+    return stmt
+
+
+def iter_batches(stmt, batch_rows=None):
+    """Yield lists of rows from a server-side cursor on the read session."""
+    batch_rows = batch_rows or EXPORT_BATCH_ROWS
+    with ReadSessionLocal() as session:
+        result = session.execute(stmt.execution_options(yield_per=batch_rows))
+        yield from result.partitions()
+
+
+def _csv_value(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def csv_stream(names, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    yield buffer.getvalue().encode()
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_value(value) for value in row] for row in rows)
+        yield buffer.getvalue().encode()
+
+
+def arrow_schema(names, types):
+    import pyarrow as pa
+
+    mapping = {"int64": pa.int64(), "string": pa.string(), "float64": pa.float64(),
+               "timestamp": pa.timestamp("us", tz="UTC")}
+    return pa.schema([(name, mapping[kind]) for name, kind in zip(names, types)])
+
+
+def _record_batch(schema, rows):
+    import pyarrow as pa
+
+    arrays = []
+    for field, values in zip(schema, zip(*rows)):
+        if pa.types.is_floating(field.type):
+            # Numeric columns come back as Decimal
+            values = [None if value is None else float(value) for value in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _drain(sink):
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+
+def arrow_stream(schema, batches, parquet=False):
+    """Encode batches as an Arrow IPC stream or a Parquet file, one row group per batch."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = io.BytesIO()
+    writer = pq.ParquetWriter(sink, schema) if parquet else pa.ipc.new_stream(sink, schema)
+    yield _drain(sink)  # the schema message / Parquet magic
+    for rows in batches:
+        writer.write_batch(_record_batch(schema, rows))
+        yield _drain(sink)
+    writer.close()
+    yield _drain(sink)
+
+
+def _logged(table, fmt, batches):
+    rows = 0
+    for batch in batches:
+        rows += len(batch)
+        yield batch
+    logger.info("Exported %d %s rows as %s", rows, table, fmt)
+
+
+def export_stream(table, fmt, store=None, start=None, end=None, batch_rows=None):
+    """Return a generator of encoded chunks exporting ``table`` in ``fmt``.
+
+    Raises ``ExportFormatUnavailable`` up front when ``fmt`` needs pyarrow
+    and it isn't installed.
+    """
+    columns, types = EXPORTS[table]
+    names = [column.key for column in columns]
+    batches = _logged(table, fmt, iter_batches(export_query(table, store, start, end), batch_rows))
+    if fmt == "csv":
+        return csv_stream(names, batches)
+    try:
+        schema = arrow_schema(names, types)
+    except ImportError:
+        raise ExportFormatUnavailable(f"{fmt} exports need pyarrow (pip install -r requirements-export.txt)")
+    return arrow_stream(schema, batches, parquet=fmt == "parquet")
@@ -0,0 +1,207 @@
+"""Set-based importers used by the CSV upload endpoints."""
+import logging
+from collections import Counter
+
+from sqlalchemy import insert, literal_column, select, update
+from sqlalchemy.dialects import postgresql
+
+from .bulk import chunked, increment_product_purchases, increment_user_purchases, insert_missing, insert_purchases
+from .catalog import bump_catalog_version
+from .logging_config import hot_logger
+from .models import Product, Purchase, Store, User
+from .rollups import record_sales
+from .sketches import record_customers
+from .validation import (
+    compact_lines, normalize_products, normalize_purchases, reject_unknown_products, row_fingerprints, utc_datetimes,
+)
+
+logger = logging.getLogger("app.importers")
+row_logger = hot_logger("app.importers.rows")
+
+
+def upsert_products(session, prices):
+    """Insert new products and update changed prices in bulk.
+
+    ``prices`` maps product names to unit prices. Returns a dict with the
+    ``inserted``, ``updated`` and ``unchanged`` row counts. The caller owns
+    the transaction.
+    """
+    # name order, so concurrent upserts lock overlapping rows in the same order
+    rows = [{"product_name": name, "unit_price": prices[name]} for name in sorted(prices)]
+    if session.get_bind().dialect.name == "postgresql":
+        counts = _upsert_products_pg(session, rows)
+    else:
+        counts = _upsert_products_generic(session, rows)
+    logger.info(
+        "Products upsert: %d inserted, %d updated, %d unchanged",
+        counts["inserted"], counts["updated"], counts["unchanged"],
+    )
+    return counts
+
+
+def import_products_chunk(session, df):
+    prices, errors = normalize_products(df)
+    log_rejected_rows(errors)
+    counts = upsert_products(session, prices)
+    if counts["inserted"] or counts["updated"]:
+        bump_catalog_version(session)
+    return dict(counts, errors=errors)
+
+
+def _upsert_products_pg(session, rows):
+    table = Product.__table__
+    stmt = postgresql.insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.product_name],
+        set_={"unit_price": stmt.excluded.unit_price},
+        # skip no-op updates so unchanged rows are neither rewritten nor returned
+        where=table.c.unit_price.is_distinct_from(stmt.excluded.unit_price),
+    ).returning(literal_column("(xmax = 0)").label("inserted"))
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    for batch in chunked(rows):
+        flags = session.execute(stmt.values(batch)).scalars().all()
+        inserted = sum(1 for f in flags if f)
+        counts["inserted"] += inserted
+        counts["updated"] += len(flags) - inserted
+        counts["unchanged"] += len(batch) - len(flags)
+    return counts
+
+
+def _upsert_products_generic(session, rows):
+    # fallback for SQLite and friends: one IN lookup per batch, then executemany
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    for batch in chunked(rows):
+        names = [r["product_name"] for r in batch]
+        existing = {
+            name: (pid, price)
+            for pid, name, price in session.execute(
+                select(Product.id, Product.product_name, Product.unit_price).where(Product.product_name.in_(names))
+            )
+        }
+        new_rows = []
+        changed = []
+        for row in batch:
+            found = existing.get(row["product_name"])
+            if found is None:
+                new_rows.append(row)
+            elif float(found[1]) != row["unit_price"]:
+                changed.append({"id": found[0], "unit_price": row["unit_price"]})
+        if new_rows:
+            session.execute(insert(Product.__table__), new_rows)
+        if changed:
+            session.execute(update(Product), changed)
+        counts["inserted"] += len(new_rows)
+        counts["updated"] += len(changed)
+        counts["unchanged"] += len(batch) - len(new_rows) - len(changed)
+    return counts
+
+
+def import_purchases(session, df):
+    """Import a purchases dataframe with a fixed number of round trips.
+
+    The chunk is validated column by column (see ``validation``). Every
+    distinct product, user and store name is resolved with one IN query
+    per batch, counter deltas are accumulated in memory and all purchases
+    and their line items are written with executemany. Rows that fail
+    validation (bad values, unknown products) are skipped and reported.
+    Rows whose fingerprint was imported before (or repeats within the
+    file) are skipped in bulk and counted as duplicates. The caller owns
+    the transaction, so the whole import commits or rolls back as one.
+
+    Returns a dict with ``inserted``, ``duplicates``, ``new_users``,
+    ``new_stores`` and ``errors`` (a list of ``(line, message)``).
+    """
+    frame, items, errors = normalize_purchases(df)
+    frame["row_hash"] = row_fingerprints(frame)
+
+    # drop rows that were imported already before doing any other work
+    rows = len(frame)
+    frame = frame.drop_duplicates("row_hash")
+    seen = set()
+    for batch in chunked(frame["row_hash"].tolist()):
+        seen.update(session.execute(select(Purchase.row_hash).where(Purchase.row_hash.in_(batch))).scalars())
+    frame = frame[~frame["row_hash"].isin(seen)]
+    duplicates = rows - len(frame)
+    items = items[items["line"].isin(frame["line"])]
+
+    products = {}
+    for batch in chunked(sorted(items["product_name"].unique())):
+        products.update(
+            (name, (pid, float(price))) for name, pid, price in session.execute(
+                select(Product.product_name, Product.id, Product.unit_price).where(Product.product_name.in_(batch)))
+        )
+    frame, items, unknown = reject_unknown_products(frame, items, products.keys())
+    errors.extend(unknown)
+
+    # a product listed several times becomes one line with that quantity
+    lines_by_row = {}
+    for (line, name), qty in items.groupby(["line", "product_name"], sort=False).size().items():
+        product_id, price = products[name]
+        lines_by_row.setdefault(line, []).append((product_id, qty, price * qty))
+    purchases = [
+        ({
+            "supermarket_id": store,
+            "timestamp": ts,
+            "user_id": user,
+            "items_list": items_list,
+            "total_amount": total,
+            "row_hash": row_hash,
+        }, lines_by_row[line])
+        for line, store, ts, user, items_list, total, row_hash in zip(
+            frame["line"].tolist(), frame["supermarket_id"].tolist(), utc_datetimes(frame["timestamp"]),
+            frame["user_id"].tolist(), frame["items_list"].tolist(), frame["total_amount"].tolist(),
+            frame["row_hash"].tolist())
+    ]
+
+    # a concurrent import may have written some of the same rows meanwhile
+    ids = insert_purchases(session, purchases, skip_duplicates=True)
+    duplicates += ids.count(None)
+    purchases = [purchase for purchase, purchase_id in zip(purchases, ids) if purchase_id is not None]
+
+    user_deltas = Counter(row["user_id"] for row, _ in purchases)
+    product_deltas = Counter()
+    for _, lines in purchases:
+        product_deltas.update({product_id: qty for product_id, qty, _ in lines})
+    new_users = insert_missing(session, User, "user_id", user_deltas)
+    new_stores = insert_missing(session, Store, "store_id", {row["supermarket_id"] for row, _ in purchases})
+    if new_stores:
+        bump_catalog_version(session)
+    increment_user_purchases(session, user_deltas)
+    increment_product_purchases(session, product_deltas)
+    record_customers(session, ((row["supermarket_id"], row["timestamp"], row["user_id"]) for row, _ in purchases))
+    record_sales(session, ((row["supermarket_id"], row["timestamp"], lines) for row, lines in purchases))
+
+    errors.sort()
+    log_rejected_rows(errors)
+    logger.info(
+        "Imported %d purchases (%d duplicates skipped, %d new users, %d new stores, %d rows rejected)",
+        len(purchases), duplicates, new_users, new_stores, len(errors),
+    )
+    return {"inserted": len(purchases), "duplicates": duplicates, "new_users": new_users, "new_stores": new_stores,
+            "errors": errors}
+
+
+def log_rejected_rows(errors):
+    """Debug-log each rejected row, rate limited so big bad files don't flood the log."""
+    if row_logger.isEnabledFor(logging.DEBUG):
+        for line, message in errors:
+            row_logger.debug("Rejected line %d: %s", line, message)
+
+
+def format_row_errors(errors, total=None, limit=10):
+    """Render row errors as a short, user facing message.
+
+    Rows failing with the same message are grouped and their line numbers
+    shown as ranges, e.g. ``invalid timestamp (lines 4-9, 12)``.
+    """
+    total = len(errors) if total is None else total
+    grouped = {}
+    for line, message in errors:
+        grouped.setdefault(message, []).append(line)
+    shown = "; ".join(
+        f"{message} (line{'s' if len(lines) > 1 else ''} {compact_lines(lines)})"
+        for message, lines in list(grouped.items())[:limit]
+    )
+    unshown = total - sum(len(lines) for lines in list(grouped.values())[:limit])
+    more = f" (and {unshown} more)" if unshown > 0 else ""
+    return f"Skipped {total} rows: {shown}{more}"
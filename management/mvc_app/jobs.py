@@ -0,0 +1,275 @@
+"""Background import jobs backed by an in-process queue and worker pool.
+
+An upload is spooled to disk and registered as an ``ImportJob`` row; a
+dispatcher thread reads the file chunk by chunk and hands chunks to a pool
+of ``IMPORT_JOB_WORKERS`` threads. Chunks commit independently (see
+``streaming.process_chunk``) and counters are incremented atomically in
+SQL, so parallel chunks never lose updates. Progress lives in the
+database, which lets any web worker answer ``/jobs/<id>``.
+
+Each manager stamps its jobs with an owner token and refreshes their
+``heartbeat_at`` while it runs. ``recover_interrupted_jobs`` runs at startup:
+queued or running jobs whose heartbeat has gone quiet belonged to a worker
+that crashed or restarted, so they are failed and their spool files removed.
+Their committed chunks are kept, and uploading the same file again resumes
+from them.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+
+from .db import SessionLocal
+from .importers import import_products_chunk, import_purchases
+from .models import ImportJob
+from .streaming import (
+    PRODUCT_DTYPES, PURCHASE_DTYPES, SPOOL_DIR, committed_chunks, finish_import, iter_chunks, merge_result,
+    process_chunk,
+)
+
+JOB_WORKERS = int(os.getenv("IMPORT_JOB_WORKERS", "4"))
+# seconds between heartbeats, and without one before an unfinished job counts as interrupted
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("IMPORT_JOB_HEARTBEAT_INTERVAL", "30"))
+JOB_STALE_AFTER = float(os.getenv("IMPORT_JOB_STALE_AFTER", "300"))
+# spool files older than this that no live job reads are removed at startup
+SPOOL_MAX_AGE = float(os.getenv("UPLOAD_SPOOL_MAX_AGE", "86400"))
+UNFINISHED = ("queued", "running")
+
+# kind -> (chunk importer, read_csv dtypes, whether chunks may run in parallel);
+# product chunks run one at a time so the last row of a name wins across chunks
+IMPORTERS = {
+    "products": (import_products_chunk, PRODUCT_DTYPES, False),
+    "purchases": (import_purchases, PURCHASE_DTYPES, True),
+}
+
+logger = logging.getLogger("app.jobs")
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+class ImportJobManager:
+    """Runs queued import jobs one at a time, each with parallel chunk workers."""
+
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = max(1, workers)
+        self.queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._dispatcher = None
+        self._heartbeat = None
+        self._pool = None
+        self.owner = uuid.uuid4().hex
+
+    def submit(self, kind, path, upload_key):
+        """Register a spooled upload as a job and queue it. Returns the job id."""
+        if kind not in IMPORTERS:
+            raise ValueError(f"unknown import kind {kind!r}")
+        job_id = uuid.uuid4().hex
+        now = _now()
+        with SessionLocal() as session:
+            session.add(ImportJob(id=job_id, kind=kind, upload_key=upload_key, path=path, status="queued",
+                                  rows_done=0, chunks_done=0, error_count=0, created_at=now,
+                                  owner=self.owner, heartbeat_at=now))
+            session.commit()
+        self._ensure_started()
+        self.queue.put(job_id)
+        logger.info("Queued %s import job %s", kind, job_id)
+        return job_id
+
+    def join(self):
+        """Block until every queued job has finished."""
+        self.queue.join()
+
+    def _ensure_started(self):
+        # threads are created lazily so a pre-forking server doesn't start them in the parent
+        with self._lock:
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="import-chunk")
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name="import-dispatcher", daemon=True)
+                self._dispatcher.start()
+            if self._heartbeat is None or not self._heartbeat.is_alive():
+                self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="import-heartbeat", daemon=True)
+                self._heartbeat.start()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                self.beat()
+            except Exception:
+                logger.exception("Import job heartbeat failed")
+
+    def beat(self):
+        """Refresh ``heartbeat_at`` of this manager's unfinished jobs, queued ones included."""
+        with SessionLocal() as session:
+            session.query(ImportJob).filter(ImportJob.owner == self.owner, ImportJob.status.in_(UNFINISHED)) \
+                .update({"heartbeat_at": _now()}, synchronize_session=False)
+            session.commit()
+
+    def _dispatch_loop(self):
+        while True:
+            job_id = self.queue.get()
+            try:
+                self._run(job_id)
+            except Exception as exc:
+                logger.exception("Import job %s failed", job_id)
+                self._update(job_id, status="failed", message=str(exc), finished_at=_now())
+                # the committed chunks are enough to resume a re-upload
+                self._remove_spool(job_id)
+            finally:
+                self.queue.task_done()
+
+    def _update(self, job_id, **values):
+        with SessionLocal() as session:
+            session.query(ImportJob).filter_by(id=job_id).update(values)
+            session.commit()
+
+    @staticmethod
+    def _remove_spool(job_id):
+        with SessionLocal() as session:
+            job = session.get(ImportJob, job_id)
+            path = job.path if job is not None else None
+        if path:
+            _remove(path)
+
+    def _run(self, job_id):
+        with SessionLocal() as session:
+            job = session.get(ImportJob, job_id)
+            kind, path, upload_key = job.kind, job.path, job.upload_key
+            done = committed_chunks(session, upload_key)
+        import_chunk, dtype, parallel = IMPORTERS[kind]
+        # bound the chunks held in memory to twice the worker count
+        in_flight = 2 * self.workers if parallel else 1
+        self._update(job_id, status="running", started_at=_now())
+
+        total = {"chunks": 0, "resumed_chunks": 0, "rows": 0}
+        pending = set()
+
+        def collect(futures):
+            for future in futures:
+                rows, result = future.result()
+                merge_result(total, result)
+                self._progress(job_id, total, rows)
+
+        try:
+            for chunk_index, df in iter_chunks(path, dtype=dtype):
+                total["chunks"] += 1
+                total["rows"] += len(df)
+                if chunk_index in done:
+                    total["resumed_chunks"] += 1
+                    continue
+                if len(pending) >= in_flight:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                pending.add(self._pool.submit(self._run_chunk, upload_key, chunk_index, df, import_chunk))
+            finished, pending = wait(pending)
+            collect(finished)
+        finally:
+            # let in-flight chunks settle before reporting a failure
+            wait(pending)
+
+        finish_import(upload_key, total)
+        os.remove(path)
+        self._update(job_id, status="done", finished_at=_now(),
+                     result=json.dumps({k: v for k, v in total.items() if k != "errors"}))
+        logger.info("Import job %s finished: %s", job_id, total)
+
+    @staticmethod
+    def _run_chunk(upload_key, chunk_index, df, import_chunk):
+        return len(df), process_chunk(upload_key, chunk_index, df, import_chunk)
+
+    def _progress(self, job_id, total, rows):
+        self._update(
+            job_id,
+            rows_done=ImportJob.rows_done + rows,
+            chunks_done=ImportJob.chunks_done + 1,
+            error_count=total.get("error_count", 0),
+            errors=json.dumps(total.get("errors", [])),
+        )
+
+
+def recover_interrupted_jobs(stale_after=JOB_STALE_AFTER, spool_max_age=SPOOL_MAX_AGE):
+    """Fail unfinished jobs without a recent heartbeat and remove stale spool files.
+
+    Returns the number of jobs marked failed.
+    """
+    cutoff = _now() - timedelta(seconds=stale_after)
+    with SessionLocal() as session:
+        unfinished = session.query(ImportJob).filter(ImportJob.status.in_(UNFINISHED)).all()
+        stale = [job for job in unfinished if _as_utc(job.heartbeat_at or job.created_at) < cutoff]
+        for job in stale:
+            job.status = "failed"
+            job.message = "Interrupted by a worker restart; upload the same file again to resume it"
+            job.finished_at = _now()
+        session.commit()
+        live_paths = {os.path.abspath(job.path) for job in unfinished if job not in stale}
+        stale_paths = [job.path for job in stale]
+    for path in stale_paths:
+        _remove(path)
+    if stale:
+        logger.warning("Marked %d interrupted import job(s) as failed", len(stale))
+
+    if os.path.isdir(SPOOL_DIR):
+        oldest = time.time() - spool_max_age
+        for name in os.listdir(SPOOL_DIR):
+            path = os.path.abspath(os.path.join(SPOOL_DIR, name))
+            try:
+                if path not in live_paths and os.path.getmtime(path) < oldest:
+                    os.remove(path)
+                    logger.info("Removed stale spool file %s", path)
+            except OSError:
+                # raced with another worker's cleanup or a finishing upload
+                pass
+    return len(stale)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def job_status(job):
+    """Serialize a job row for the status API."""
+    end = job.finished_at or _now()
+    elapsed = (_as_utc(end) - _as_utc(job.started_at)).total_seconds() if job.started_at else 0.0
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "rows_done": job.rows_done,
+        "chunks_done": job.chunks_done,
+        "rows_per_second": round(job.rows_done / elapsed, 1) if elapsed > 0 else None,
+        "error_count": job.error_count,
+        "errors": [{"line": line, "message": message} for line, message in json.loads(job.errors or "[]")],
+        "result": json.loads(job.result) if job.result else None,
+        "message": job.message,
+        "created_at": job.created_at.isoformat(),
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def _as_utc(value):
+    # SQLite hands back naive datetimes
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager():
+    """Return the process-wide job manager, creating it on first use."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ImportJobManager()
+        return _manager
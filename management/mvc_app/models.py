@@ -1,7 +1,13 @@
-from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, TIMESTAMP
+import logging
+
+from sqlalchemy import Column, Index, Integer, String, Numeric, ForeignKey, TIMESTAMP, Text, UniqueConstraint, Date, LargeBinary
+from sqlalchemy import event, exc, text
 from sqlalchemy.orm import relationship
 from .db import Base
 
+# bump whenever a table, column or index below changes (see db.ensure_schema)
+SCHEMA_VERSION = 5
+
 class Product(Base):
     __tablename__ = "products"
     id = Column(Integer, primary_key=True)
@@ -16,13 +22,29 @@ class Purchase(Base):
     user_id = Column(String, nullable=False)
     items_list = Column(String, nullable=False)
     total_amount = Column(Numeric, nullable=False)
+    # fingerprint of an imported CSV row; re-sent rows conflict on it
+    row_hash = Column(String(32), nullable=True, unique=True, index=True)
 
 class PurchaseItem(Base):
+    """One line of a purchase: a product, its quantity and the line total."""
     __tablename__ = "purchase_items"
     id = Column(Integer, primary_key=True)
-    product_id = Column(Integer, ForeignKey("products.id"))
+    purchase_id = Column(Integer, ForeignKey("purchases.id", ondelete="CASCADE"), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    product = relationship("Product")
+    quantity = Column(Integer, nullable=False)
+    line_total = Column(Numeric, nullable=False)
+
+# product-level queries join purchase_items to purchases through this index
+Index("ix_purchase_items_product_purchase", PurchaseItem.product_id, PurchaseItem.purchase_id)
+
+class TotalProductPurchases(Base):
+    """Running count of units sold per product (the best sellers counter)."""
+    __tablename__ = "product_total_purchases"
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), unique=True, nullable=False)
     product = relationship("Product")
-    total_purchases = Column(Integer, nullable=False)
+    total_purchases = Column(Integer, nullable=False, index=True)
 
 class User(Base):
     __tablename__ = "users"
@@ -33,11 +55,136 @@ class User(Base):
 class TotalUserPurchases(Base):
     __tablename__ = "user_total_purchases"
     id = Column(Integer, primary_key=True)
-    user_id = Column(String, ForeignKey("users.user_id"), nullable=False)
+    user_id = Column(String, ForeignKey("users.user_id"), unique=True, nullable=False)
     user = relationship("User", back_populates="total_purchases")
     total_purchases = Column(Integer, nullable=True)
 
+# serves the loyal customers keyset pagination, ordered by (total_purchases DESC, user_id)
+Index("ix_user_total_purchases_total_user", TotalUserPurchases.total_purchases.desc(), TotalUserPurchases.user_id)
+
 class Store(Base):
     __tablename__ = "stores"
     id = Column(Integer, primary_key=True)
-    store_id = Column(String, unique=True, nullable=False)
\ No newline at end of file
+    store_id = Column(String, unique=True, nullable=False)
+
+class ImportChunk(Base):
+    """Checkpoint for a committed chunk of a streamed CSV upload.
+
+    Rows are keyed by the upload's content hash so re-sending an interrupted
+    file skips the chunks that already made it to the database.
+    """
+    __tablename__ = "import_chunks"
+    __table_args__ = (UniqueConstraint("upload_key", "chunk_index"),)
+    id = Column(Integer, primary_key=True)
+    upload_key = Column(String, nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    rows = Column(Integer, nullable=False)
+
+
+class ImportedFile(Base):
+    """Content hash of a fully imported upload, so an identical re-send is skipped."""
+    __tablename__ = "imported_files"
+    upload_key = Column(String, primary_key=True)
+    rows = Column(Integer, nullable=False)
+    imported_at = Column(TIMESTAMP(timezone=True), nullable=False)
+
+
+class ImportJob(Base):
+    """A background CSV import and its progress."""
+    __tablename__ = "import_jobs"
+    id = Column(String, primary_key=True)
+    kind = Column(String, nullable=False)
+    upload_key = Column(String, nullable=False)
+    path = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="queued")
+    rows_done = Column(Integer, nullable=False, default=0)
+    chunks_done = Column(Integer, nullable=False, default=0)
+    error_count = Column(Integer, nullable=False, default=0)
+    # JSON encoded row errors and merged result counters
+    errors = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)
+    message = Column(String, nullable=True)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False)
+    started_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    finished_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    # the manager that queued the job refreshes heartbeat_at while it is alive
+    owner = Column(String, nullable=True)
+    heartbeat_at = Column(TIMESTAMP(timezone=True), nullable=True)
+
+
+class CatalogVersion(Base):
+    """Single-row counter bumped whenever products or stores change."""
+    __tablename__ = "catalog_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+
+
+class CustomerSketch(Base):
+    """HyperLogLog registers of the customers seen in a store on a UTC day."""
+    __tablename__ = "customer_sketches"
+    __table_args__ = (UniqueConstraint("store_id", "day"),)
+    id = Column(Integer, primary_key=True)
+    store_id = Column(String, nullable=False)
+    day = Column(Date, nullable=False)
+    registers = Column(LargeBinary, nullable=False)
+
+
+class SalesRollup(Base):
+    """Units, revenue and purchase count per store, UTC day and product."""
+    __tablename__ = "sales_rollups"
+    __table_args__ = (
+        UniqueConstraint("store_id", "day", "product_id"),
+        Index("ix_sales_rollups_day_product", "day", "product_id"),
+    )
+    id = Column(Integer, primary_key=True)
+    store_id = Column(String, nullable=False)
+    day = Column(Date, nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    units = Column(Integer, nullable=False)
+    revenue = Column(Numeric, nullable=False)
+    purchase_count = Column(Integer, nullable=False)
+
+
+class PurchaseCount(Base):
+    """Purchases per store and UTC day; a purchase counts once whatever it contains."""
+    __tablename__ = "purchase_counts"
+    __table_args__ = (UniqueConstraint("store_id", "day"),)
+    id = Column(Integer, primary_key=True)
+    store_id = Column(String, nullable=False)
+    day = Column(Date, nullable=False)
+    purchase_count = Column(Integer, nullable=False)
+
+
+class BackfillProgress(Base):
+    """High-water mark of a resumable backfill, keyed by backfill name."""
+    __tablename__ = "backfill_progress"
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, nullable=False)
+
+
+# product search indexes on Postgres (see the register's search module):
+# (lower(name), name) in code-point collation for ordering, paging and
+# prefix ranges and, when the pg_trgm extension can be installed, trigram substring matching
+PRODUCT_SEARCH_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS ix_products_search ON products '
+    '((lower(product_name) COLLATE "C"), (product_name COLLATE "C"))',
+)
+PRODUCT_TRIGRAM_INDEX = (
+    "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (product_name gin_trgm_ops)"
+)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def create_product_search_indexes(target, connection, **kw):
+    if connection.dialect.name != "postgresql":
+        return
+    for statement in PRODUCT_SEARCH_INDEXES:
+        connection.execute(text(statement))
+    try:
+        with connection.begin_nested():
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            connection.execute(text(PRODUCT_TRIGRAM_INDEX))
+    except exc.DBAPIError as error:
+        logging.getLogger("app.models").warning(
+            "pg_trgm unavailable, substring product search is not indexed: %s",
+            str(error.orig).strip().splitlines()[0])
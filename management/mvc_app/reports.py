@@ -0,0 +1,292 @@
+"""Queries behind the reporting pages."""
+import zlib
+from datetime import date, datetime, time, timedelta, timezone
+
+from sqlalchemy import and_, func, or_, select
+
+from .models import (
+    CustomerSketch, Product, Purchase, PurchaseCount, PurchaseItem, SalesRollup, TotalProductPurchases,
+    TotalUserPurchases,
+)
+from .sketches import HyperLogLog, estimate_cardinality, utc_day
+
+MAX_TOP_N = 100
+MAX_PAGE_SIZE = 1000
+GRANULARITIES = ("total", "day", "week")
+SALES_GROUPS = ("store", "day", "product")
+
+
+class ReportArgumentError(ValueError):
+    """A report query parameter is missing or malformed."""
+
+
+def parse_int_arg(args, name, default, minimum, maximum):
+    raw = args.get(name)
+    if raw in (None, ""):
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ReportArgumentError(f"{name} must be an integer")
+    if not minimum <= value <= maximum:
+        raise ReportArgumentError(f"{name} must be between {minimum} and {maximum}")
+    return value
+
+
+def parse_date_arg(args, name):
+    raw = args.get(name)
+    if raw in (None, ""):
+        return None
+    try:
+        return date.fromisoformat(raw)
+    except ValueError:
+        raise ReportArgumentError(f"{name} must be a YYYY-MM-DD date")
+
+
+def parse_filters(args):
+    """Return ``(store, start, end)`` from request args; ``end`` is inclusive."""
+    start = parse_date_arg(args, "start")
+    end = parse_date_arg(args, "end")
+    if start and end and start > end:
+        raise ReportArgumentError("start must not be after end")
+    return args.get("store") or None, start, end
+
+
+def purchase_filters(store=None, start=None, end=None):
+    """WHERE clauses restricting purchases to a store and an inclusive date range."""
+    clauses = []
+    if store:
+        clauses.append(Purchase.supermarket_id == store)
+    if start:
+        clauses.append(Purchase.timestamp >= datetime.combine(start, time.min, timezone.utc))
+    if end:
+        clauses.append(Purchase.timestamp < datetime.combine(end + timedelta(days=1), time.min, timezone.utc))
+    return clauses
+
+
+def top_sellers(session, n=3, store=None, start=None, end=None):
+    """Products with the ``n`` highest purchase counts, ties included.
+
+    Returns ``(product_name, purchases)`` pairs, best first. Unfiltered
+    queries read the global ``product_total_purchases`` counters; store or
+    date filters sum the quantities of the matching purchases' line items.
+    Postgres ranks in SQL with DENSE_RANK(), other dialects rank in Python.
+    """
+    counts = _filtered_counts(store, start, end) if (store or start or end) else _global_counts()
+    if session.get_bind().dialect.name == "postgresql":
+        return [tuple(row) for row in session.execute(_dense_rank_top(counts, n))]
+    # walk the counts from the top and stop after n distinct values
+    stmt = (
+        select(counts.c.product_name, counts.c.total)
+        .order_by(counts.c.total.desc(), counts.c.product_name)
+        .execution_options(yield_per=500)
+    )
+    return _dense_top(session.execute(stmt), n)
+
+
+def _dense_rank_top(counts, n):
+    ranked = select(
+        counts.c.product_name,
+        counts.c.total,
+        func.dense_rank().over(order_by=counts.c.total.desc()).label("rnk"),
+    ).subquery()
+    return (
+        select(ranked.c.product_name, ranked.c.total)
+        .where(ranked.c.rnk <= n)
+        .order_by(ranked.c.total.desc(), ranked.c.product_name)
+    )
+
+
+def _global_counts():
+    return (
+        select(Product.product_name, TotalProductPurchases.total_purchases.label("total"))
+        .join(TotalProductPurchases.product)
+        .subquery()
+    )
+
+
+def _filtered_counts(store, start, end):
+    return (
+        select(Product.product_name, func.sum(PurchaseItem.quantity).label("total"))
+        .join(PurchaseItem.product)
+        .join(Purchase, Purchase.id == PurchaseItem.purchase_id)
+        .where(*purchase_filters(store, start, end))
+        .group_by(Product.product_name)
+        .subquery()
+    )
+
+
+def _dense_top(rows, n):
+    """Take rows ordered by count descending until the (n+1)th distinct count."""
+    top = []
+    distinct = 0
+    last = None
+    for name, total in rows:
+        if total != last:
+            distinct += 1
+            last = total
+            if distinct > n:
+                break
+        top.append((name, total))
+    return top
+
+
+def encode_cursor(total, user_id):
+    return f"{total}:{user_id}"
+
+
+def decode_cursor(cursor):
+    """Split an ``after`` cursor into ``(total_purchases, user_id)``."""
+    total, sep, user_id = (cursor or "").partition(":")
+    try:
+        if not sep:
+            raise ValueError(cursor)
+        return int(total), user_id
+    except ValueError:
+        raise ReportArgumentError("after must be a cursor returned by a previous page")
+
+
+def loyal_customers_page(session, threshold=3, limit=100, after=None):
+    """One keyset-paginated page of customers with at least ``threshold`` purchases.
+
+    Rows are ordered by ``(total_purchases DESC, user_id)``, which the
+    composite index on ``user_total_purchases`` serves directly, so every
+    page costs the same regardless of how deep it is. Returns
+    ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    total = TotalUserPurchases.total_purchases
+    stmt = select(TotalUserPurchases.user_id, total).where(total >= threshold)
+    if after:
+        after_total, after_user = decode_cursor(after)
+        stmt = stmt.where(or_(total < after_total, and_(total == after_total, TotalUserPurchases.user_id > after_user)))
+    stmt = stmt.order_by(total.desc(), TotalUserPurchases.user_id).limit(limit + 1)
+    rows = [tuple(row) for row in session.execute(stmt)]
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1][1], rows[-1][0])
+    return rows, None
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def unique_customers_report(session, mode="approx", granularity="total", store=None, start=None, end=None):
+    """Distinct customers per period, optionally restricted to a store and dates.
+
+    ``approx`` merges the stored HyperLogLog sketches and reports their
+    relative standard error; ``exact`` counts distinct ``user_id`` values in
+    ``purchases`` for verification. Returns ``(rows, relative_error)``
+    where ``rows`` are ``(period_start, count)`` pairs ordered by period;
+    ``period_start`` is None for the ``total`` granularity.
+    """
+    period = {"total": None, "day": lambda d: d, "week": week_start}[granularity]
+    if mode == "approx":
+        rows = sorted(approx_customer_counts(session, store, start, end, period).items())
+        if not rows and granularity == "total":
+            rows = [(None, 0)]
+        return rows, HyperLogLog().relative_error
+    filters = purchase_filters(store, start, end)
+    if period is None:
+        count = session.execute(select(func.count(func.distinct(Purchase.user_id))).where(*filters)).scalar()
+        return [(None, count)], 0.0
+    seen = {}
+    stmt = select(Purchase.timestamp, Purchase.user_id).where(*filters).execution_options(yield_per=5000)
+    for ts, user_id in session.execute(stmt):
+        seen.setdefault(period(utc_day(ts)), set()).add(user_id)
+    return sorted((bucket, len(users)) for bucket, users in seen.items()), 0.0
+
+
+def approx_customer_counts(session, store=None, start=None, end=None, period=None, batch_size=500):
+    """Merge the matching ``customer_sketches`` rows per period and count them.
+
+    Registers are merged with numpy a batch of rows at a time, so the cost
+    per stored sketch is a decompress and a vectorized max rather than a
+    Python loop over its registers. Returns ``{bucket: estimate}``; the
+    bucket is None without ``period``.
+    """
+    import numpy as np
+
+    m = HyperLogLog().m
+    # 2 ** -rank for every possible register value
+    powers = np.exp2(-np.arange(65, dtype=np.float64))
+    stmt = (select(CustomerSketch.day, CustomerSketch.registers)
+            .where(*_rollup_filters(CustomerSketch, store, start, end))
+            .execution_options(yield_per=batch_size))
+    merged = {}
+    for partition in session.execute(stmt).partitions():
+        buckets = {}
+        for day, registers in partition:
+            buckets.setdefault(period(day) if period else None, []).append(zlib.decompress(registers))
+        for bucket, sketches in buckets.items():
+            batch = np.frombuffer(b"".join(sketches), dtype=np.uint8).reshape(len(sketches), m).max(axis=0)
+            if bucket in merged:
+                np.maximum(merged[bucket], batch, out=merged[bucket])
+            else:
+                merged[bucket] = batch
+    return {
+        bucket: estimate_cardinality(m, float(powers[registers].sum()), int(np.count_nonzero(registers == 0)))
+        for bucket, registers in merged.items()
+    }
+
+
+def _rollup_filters(model, store=None, start=None, end=None):
+    filters = []
+    if store:
+        filters.append(model.store_id == store)
+    if start:
+        filters.append(model.day >= start)
+    if end:
+        filters.append(model.day <= end)
+    return filters
+
+
+def sales_report(session, group_by=(), store=None, start=None, end=None, product=None, limit=1000):
+    """Units, revenue and purchase counts from ``sales_rollups``.
+
+    ``group_by`` is a sequence drawn from ``SALES_GROUPS``; rows are ordered
+    by the grouping columns. Every filter maps onto the rollup keys, so the
+    query never touches ``purchases``. Unless rows are per product, the
+    purchase counts come from ``purchase_counts`` so that a purchase of
+    several products counts once.
+    """
+    columns = {
+        "store": SalesRollup.store_id.label("store"),
+        "day": SalesRollup.day.label("day"),
+        "product": Product.product_name.label("product"),
+    }
+    by_product = "product" in group_by or product
+    groups = [columns[g] for g in group_by]
+    stmt = select(
+        *groups,
+        func.sum(SalesRollup.units).label("units"),
+        func.sum(SalesRollup.revenue).label("revenue"),
+        func.sum(SalesRollup.purchase_count).label("purchases"),
+    )
+    if by_product:
+        stmt = stmt.join(Product, Product.id == SalesRollup.product_id)
+    stmt = stmt.where(*_rollup_filters(SalesRollup, store, start, end))
+    if product:
+        stmt = stmt.where(Product.product_name == product)
+    if groups:
+        stmt = stmt.group_by(*groups).order_by(*groups)
+    counts = None
+    if not by_product:
+        count_groups = [{"store": PurchaseCount.store_id, "day": PurchaseCount.day}[g] for g in group_by]
+        count_stmt = (select(*count_groups, func.sum(PurchaseCount.purchase_count))
+                      .where(*_rollup_filters(PurchaseCount, store, start, end)))
+        if count_groups:
+            count_stmt = count_stmt.group_by(*count_groups)
+        counts = {tuple(row[:-1]): row[-1] for row in session.execute(count_stmt)}
+    rows = []
+    for row in session.execute(stmt.limit(limit)):
+        data = row._asdict()
+        if data["units"] is None:
+            continue  # no rollups match an ungrouped query
+        if counts is not None:
+            data["purchases"] = counts.get(tuple(row[:len(groups)]), 0)
+        if "day" in data:
+            data["day"] = data["day"].isoformat()
+        data["revenue"] = float(data["revenue"])
+        rows.append(data)
+    return rows
@@ -0,0 +1,70 @@
+"""Incrementally maintained sales rollups per store, UTC day and product.
+
+Both write paths call ``record_sales`` in the transaction that writes the
+purchases, so ``sales_rollups`` and ``purchase_counts`` are always
+consistent with ``purchases``. A purchase counts towards the
+``purchase_count`` of every product it contains, so totals across products
+come from ``purchase_counts`` instead.
+
+This module is shared verbatim by the cash register and management services.
+"""
+from collections import Counter, defaultdict
+
+from sqlalchemy import select
+
+from .bulk import upsert_add
+from .models import Purchase, PurchaseCount, PurchaseItem, SalesRollup
+from .sketches import utc_day
+
+COLUMNS = ("units", "revenue", "purchase_count")
+
+
+def record_sales(session, purchases):
+    """Add purchases to the rollups in the caller's transaction.
+
+    ``purchases`` yields ``(store_id, timestamp, lines)`` where ``lines`` is
+    a list of ``(product_id, quantity, line_total)``. A product listed more
+    than once in a purchase counts once towards ``purchase_count``.
+    """
+    deltas = defaultdict(lambda: [0, 0, 0])
+    counts = Counter()
+    for store_id, ts, lines in purchases:
+        day = utc_day(ts)
+        counts[(store_id, day)] += 1
+        for product_id, quantity, line_total in lines:
+            delta = deltas[(store_id, day, product_id)]
+            delta[0] += quantity
+            delta[1] += line_total
+        for product_id in {line[0] for line in lines}:
+            deltas[(store_id, day, product_id)][2] += 1
+    upsert_add(session, SalesRollup, ("store_id", "day", "product_id"), COLUMNS, deltas)
+    upsert_add(session, PurchaseCount, ("store_id", "day"), ("purchase_count",),
+               {key: (count,) for key, count in counts.items()})
+
+
+def rebuild_sales_rollups(session, batch_size=10000):
+    """Recompute the rollups from ``purchases`` and ``purchase_items``.
+
+    Line items are streamed in purchase order, one batch of purchases at a
+    time. Runs in the caller's transaction; returns the number of purchases
+    read.
+    """
+    session.execute(SalesRollup.__table__.delete())
+    session.execute(PurchaseCount.__table__.delete())
+    stmt = (
+        select(Purchase.id, Purchase.supermarket_id, Purchase.timestamp,
+               PurchaseItem.product_id, PurchaseItem.quantity, PurchaseItem.line_total)
+        .join(PurchaseItem, PurchaseItem.purchase_id == Purchase.id)
+        .order_by(Purchase.id)
+        .execution_options(yield_per=batch_size)
+    )
+    purchases = {}
+    seen = 0
+    for purchase_id, store_id, ts, product_id, quantity, line_total in session.execute(stmt):
+        if purchase_id not in purchases and len(purchases) >= batch_size:
+            record_sales(session, purchases.values())
+            seen += len(purchases)
+            purchases = {}
+        purchases.setdefault(purchase_id, (store_id, ts, []))[2].append((product_id, quantity, line_total))
+    record_sales(session, purchases.values())
+    return seen + len(purchases)
@@ -0,0 +1,238 @@
+"""HyperLogLog sketches for approximate distinct customer counts.
+
+One sketch is kept per store and UTC day in ``customer_sketches``. Sketches
+merge losslessly (register-wise max), so any combination of stores and
+days can be answered by merging the matching rows; the management reports
+do that with numpy. With the default precision of 12 a sketch has 4096
+one-byte registers and a standard error of about 1.6%; registers are
+stored zlib-compressed, which keeps sparse sketches of small stores to a
+few hundred bytes.
+
+Bulk writers (CSV imports, the rebuild) merge into the stored rows with
+``record_customers`` in their own transaction. Checkouts go through
+``sketch_buffer`` instead, so register lanes never queue on a store's row.
+
+This module is shared verbatim by the cash register and management services.
+"""
+import atexit
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+import zlib
+from collections import defaultdict
+from datetime import timezone
+
+from sqlalchemy import bindparam, event, select, tuple_
+from sqlalchemy.orm import Session
+
+from .bulk import chunked, dialect_insert
+from .db import SessionLocal
+from .models import CustomerSketch, Purchase
+
+PRECISION = 12
+SKETCH_FLUSH_INTERVAL = float(os.getenv("SKETCH_FLUSH_INTERVAL", "5"))
+# session.info key of the sketches a checkout transaction has yet to commit
+_STAGED = "customer_sketches"
+
+logger = logging.getLogger("app.sketches")
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    def __init__(self, registers=None, precision=PRECISION):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+        if len(self.registers) != self.m:
+            raise ValueError("register count does not match precision")
+
+    @property
+    def relative_error(self):
+        """Standard error of ``count()`` relative to the true cardinality."""
+        return 1.04 / math.sqrt(self.m)
+
+    def add(self, value):
+        h = _hash64(value)
+        bits = 64 - self.precision
+        idx = h >> bits
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other):
+        if other.m != self.m:
+            raise ValueError("cannot merge sketches of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        return estimate_cardinality(self.m, sum(2.0 ** -r for r in self.registers), self.registers.count(0))
+
+    def to_bytes(self):
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data, precision=PRECISION):
+        return cls(zlib.decompress(data), precision)
+
+
+def estimate_cardinality(m, harmonic, zeros):
+    """HyperLogLog estimate from ``m`` registers, the sum of ``2 ** -register`` and the zero registers."""
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / harmonic
+    if estimate <= 2.5 * m and zeros:
+        # linear counting is more accurate for small cardinalities
+        estimate = m * math.log(m / zeros)
+    return int(round(estimate))
+
+
+def utc_day(ts):
+    # naive timestamps are taken as UTC
+    return (ts.astimezone(timezone.utc) if ts.tzinfo else ts).date()
+
+
+def _fold(purchases, local):
+    for store_id, ts, user_id in purchases:
+        local[(store_id, utc_day(ts))].add(user_id)
+    return local
+
+
+def record_customers(session, purchases):
+    """Fold ``(store_id, timestamp, user_id)`` triples into the stored sketches.
+
+    Triples are grouped into one in-memory sketch per store and day first;
+    each touched row is then created if missing, locked, merged and written
+    back in the caller's transaction, using a fixed number of statements
+    per batch of keys. Keys are handled in sorted order so concurrent
+    writers lock rows in the same order.
+    """
+    write_sketches(session, _fold(purchases, defaultdict(HyperLogLog)))
+
+
+def write_sketches(session, local):
+    """Merge a ``{(store_id, day): HyperLogLog}`` dict into the stored rows (see ``record_customers``)."""
+    if not local:
+        return
+    table = CustomerSketch.__table__
+    empty = HyperLogLog().to_bytes()
+    for keys in chunked(sorted(local)):
+        stmt = dialect_insert(session, table)
+        rows = [{"store_id": store_id, "day": day, "registers": empty} for store_id, day in keys]
+        if stmt is not None:
+            session.execute(stmt.on_conflict_do_nothing(index_elements=["store_id", "day"]), rows)
+        else:
+            existing = set(session.execute(
+                select(table.c.store_id, table.c.day).where(tuple_(table.c.store_id, table.c.day).in_(keys))).all())
+            missing = [r for r in rows if (r["store_id"], r["day"]) not in existing]
+            if missing:
+                session.execute(table.insert(), missing)
+        stored = session.execute(
+            select(table.c.id, table.c.store_id, table.c.day, table.c.registers)
+            .where(tuple_(table.c.store_id, table.c.day).in_(keys))
+            .order_by(table.c.store_id, table.c.day)
+            .with_for_update()
+        ).all()
+        updates = [
+            {"b_id": row.id, "b_registers": HyperLogLog.from_bytes(row.registers).merge(local[(row.store_id, row.day)]).to_bytes()}
+            for row in stored
+        ]
+        session.execute(
+            table.update().where(table.c.id == bindparam("b_id")).values(registers=bindparam("b_registers")),
+            updates,
+        )
+
+
+class SketchBuffer:
+    """Customer sketches of committed checkouts, written out every ``interval`` seconds.
+
+    ``record`` only folds a checkout's customers into sketches staged on its
+    session. They move to this per-process buffer when the session commits
+    (and are dropped on rollback), and a background thread merges the
+    buffer into ``customer_sketches`` in one transaction per flush. A worker
+    thus locks each store's row once per interval instead of once per
+    checkout. Sketches still buffered when a process dies are lost;
+    ``flask rebuild-sketches`` recomputes them from ``purchases``.
+    """
+
+    def __init__(self, interval=SKETCH_FLUSH_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+        self._pid = None
+
+    def record(self, session, purchases):
+        """Stage ``(store_id, timestamp, user_id)`` triples until ``session`` commits."""
+        _fold(purchases, session.info.setdefault(_STAGED, defaultdict(HyperLogLog)))
+
+    def add(self, sketches):
+        """Merge committed ``{(store_id, day): HyperLogLog}`` sketches into the buffer."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # the flush thread doesn't survive a fork; a new worker starts empty
+                self._pending, self._thread, self._pid = {}, None, os.getpid()
+            for key, sketch in sketches.items():
+                if key in self._pending:
+                    self._pending[key].merge(sketch)
+                else:
+                    self._pending[key] = sketch
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sketch-flush", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        """Write the buffered sketches now; returns the number of store days written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            with SessionLocal() as session:
+                write_sketches(session, pending)
+                session.commit()
+        except Exception:
+            logger.exception("Writing %d buffered customer sketches failed; will retry", len(pending))
+            self.add(pending)
+            return 0
+        return len(pending)
+
+
+sketch_buffer = SketchBuffer()
+atexit.register(sketch_buffer.flush)
+
+
+@event.listens_for(Session, "after_commit")
+def _buffer_committed_sketches(session):
+    staged = session.info.pop(_STAGED, None)
+    if staged:
+        sketch_buffer.add(staged)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back_sketches(session):
+    session.info.pop(_STAGED, None)
+
+
+def rebuild_customer_sketches(session, batch_size=10000):
+    """Recompute every sketch from ``purchases`` in one streaming pass.
+
+    Runs in the caller's transaction; returns the number of purchases read.
+    """
+    session.execute(CustomerSketch.__table__.delete())
+    stmt = select(Purchase.supermarket_id, Purchase.timestamp, Purchase.user_id).execution_options(yield_per=batch_size)
+    seen = 0
+    for partition in session.execute(stmt).partitions():
+        record_customers(session, partition)
+        seen += len(partition)
+    return seen
@@ -0,0 +1,153 @@
+"""Chunked, checkpointed ingestion of uploaded CSV files.
+
+Uploads are spooled to disk and read back ``IMPORT_CHUNK_ROWS`` rows at a
+time, so memory use does not depend on the file size. Every chunk is
+processed in its own transaction together with an ``ImportChunk``
+checkpoint; re-uploading a file whose import was interrupted skips the
+chunks that were already committed.
+
+pandas is imported on first use rather than with the module, which keeps
+it out of worker startup.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, select
+
+from .db import SessionLocal
+from .models import ImportChunk, ImportedFile
+
+CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "50000"))
+SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "icash-uploads"))
+# keep at most this many row errors per import; the total is still counted
+MAX_REPORTED_ERRORS = 100
+
+# read identifiers as strings so chunks agree on their types
+PRODUCT_DTYPES = {"product_name": str}
+PURCHASE_DTYPES = {"supermarket_id": str, "user_id": str, "items_list": str}
+# kinds whose re-import would duplicate data; uploads imported without a
+# rejected row are remembered by content hash and an identical re-send is
+# skipped outright
+FINGERPRINTED_KINDS = {"purchases"}
+
+logger = logging.getLogger("app.streaming")
+
+
+def spool_upload(file_storage, kind):
+    """Copy an uploaded file to the spool directory while hashing it.
+
+    Returns ``(path, upload_key)``; the key identifies the upload by kind
+    and content so an identical re-upload maps to the same checkpoints.
+    The path is unique per request: whoever finishes first deletes its own
+    copy, never one that a concurrent upload or job of the same file is
+    still reading.
+    """
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, path = tempfile.mkstemp(dir=SPOOL_DIR, prefix=f"{kind}-", suffix=".csv")
+    with os.fdopen(fd, "wb") as out:
+        while True:
+            block = file_storage.stream.read(1 << 20)
+            if not block:
+                break
+            digest.update(block)
+            out.write(block)
+    return path, f"{kind}:{digest.hexdigest()}"
+
+
+class InvalidCSVError(ValueError):
+    """A spooled upload that can't be parsed as CSV (empty, malformed or binary)."""
+
+
+def read_columns(path):
+    """The header columns of a spooled upload; raises ``InvalidCSVError``."""
+    import pandas as pd
+
+    try:
+        return set(pd.read_csv(path, nrows=0).columns)
+    except (pd.errors.EmptyDataError, pd.errors.ParserError, UnicodeDecodeError) as exc:
+        raise InvalidCSVError(str(exc)) from exc
+
+
+def iter_chunks(path, dtype=None, chunk_rows=None):
+    """Yield ``(chunk_index, dataframe)`` pairs; row indexes run across chunks."""
+    import pandas as pd
+
+    reader = pd.read_csv(path, dtype=dtype, chunksize=chunk_rows or CHUNK_ROWS)
+    with reader:
+        yield from enumerate(reader)
+
+
+def committed_chunks(session, upload_key):
+    return set(session.execute(select(ImportChunk.chunk_index).where(ImportChunk.upload_key == upload_key)).scalars())
+
+
+def process_chunk(upload_key, chunk_index, df, import_chunk):
+    """Run ``import_chunk(session, df)`` and checkpoint it in one transaction."""
+    with SessionLocal() as session:
+        result = import_chunk(session, df)
+        session.add(ImportChunk(upload_key=upload_key, chunk_index=chunk_index, rows=len(df)))
+        session.commit()
+    return result
+
+
+def finish_import(upload_key, total):
+    """Drop the checkpoints of a completed import and fingerprint the file if its kind needs it.
+
+    Only a file whose every row was written is fingerprinted: a rejected row
+    may import on a later re-send (say, once its product exists), and the
+    ``row_hash`` check already skips the rows that made it in. A resumed run
+    can't see the errors of chunks committed earlier, so it isn't either.
+    """
+    rows = total["rows"]
+    clean = not total.get("error_count") and not total.get("resumed_chunks")
+    with SessionLocal() as session:
+        session.execute(delete(ImportChunk).where(ImportChunk.upload_key == upload_key))
+        if clean and upload_key.split(":", 1)[0] in FINGERPRINTED_KINDS and session.get(ImportedFile, upload_key) is None:
+            session.add(ImportedFile(upload_key=upload_key, rows=rows, imported_at=datetime.now(timezone.utc)))
+        session.commit()
+
+
+def imported_file(upload_key):
+    """The ``ImportedFile`` for an upload whose every row was already imported, or None."""
+    with SessionLocal() as session:
+        return session.get(ImportedFile, upload_key)
+
+
+def merge_result(total, result):
+    """Fold a per-chunk result dict into the running totals."""
+    for key, value in result.items():
+        if key == "errors":
+            total["error_count"] = total.get("error_count", 0) + len(value)
+            kept = total.setdefault("errors", [])
+            kept.extend(value[:MAX_REPORTED_ERRORS - len(kept)])
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+def stream_import(path, upload_key, import_chunk, dtype=None, chunk_rows=None):
+    """Import a spooled CSV file chunk by chunk, resuming from checkpoints.
+
+    Returns the merged per-chunk results plus ``chunks``, ``rows`` and
+    ``resumed_chunks`` (chunks skipped because they were committed by an
+    earlier, interrupted attempt).
+    """
+    with SessionLocal() as session:
+        done = committed_chunks(session, upload_key)
+    if done:
+        logger.info("Resuming %s, %d chunks already committed", upload_key, len(done))
+    total = {"chunks": 0, "resumed_chunks": 0, "rows": 0}
+    for chunk_index, df in iter_chunks(path, dtype=dtype, chunk_rows=chunk_rows):
+        total["chunks"] += 1
+        total["rows"] += len(df)
+        if chunk_index in done:
+            total["resumed_chunks"] += 1
+            continue
+        merge_result(total, process_chunk(upload_key, chunk_index, df, import_chunk))
+        logger.debug("Committed chunk %d of %s (%d rows)", chunk_index, upload_key, len(df))
+    finish_import(upload_key, total)
+    return total
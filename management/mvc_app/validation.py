@@ -0,0 +1,164 @@
+"""Columnar validation and normalisation of uploaded CSV chunks.
+
+Every check runs on whole pandas columns: values are coerced in one pass,
+timestamps are parsed by ``pd.to_datetime`` and ``items_list`` is split and
+exploded into one row per item, so nothing loops over rows in Python.
+Offending rows are reported as ``(line, message)`` pairs where ``line`` is
+the 1-based line in the CSV file (the header is line 1).
+
+pandas is imported inside the functions so that web workers only load it
+when the first upload arrives.
+"""
+import hashlib
+from datetime import timezone
+
+PURCHASE_COLUMNS = ["supermarket_id", "timestamp", "user_id", "items_list", "total_amount"]
+
+
+def _lines(df):
+    import pandas as pd
+
+    return pd.Series(df.index + 2, index=df.index)
+
+
+def _reject(errors, lines, mask, message):
+    if mask.any():
+        errors.extend((int(line), message) for line in lines[mask])
+
+
+def _mask(values, index):
+    import pandas as pd
+
+    # comparisons on nullable strings yield NA; treat those as False
+    return pd.Series(values, index=index).astype("boolean").fillna(False).astype(bool)
+
+
+def _invalid_amounts(values):
+    """Missing, non-finite (``inf`` parses as a number) or negative amounts."""
+    import numpy as np
+
+    return values.isna() | ~np.isfinite(values) | (values < 0)
+
+
+def _strings(column):
+    return column.astype("string").str.strip()
+
+
+def parse_timestamps(column):
+    """Parse a column of timestamps to UTC; unparseable values become NaT.
+
+    ISO 8601 (what registers export) is parsed with the fast path; other
+    layouts fall back to per-value format detection. Values without an
+    offset are taken as UTC.
+    """
+    import pandas as pd
+
+    raw = _strings(column)
+    parsed = pd.to_datetime(raw, format="ISO8601", utc=True, errors="coerce")
+    retry = parsed.isna() & raw.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(raw[retry], format="mixed", utc=True, errors="coerce")
+    return parsed
+
+
+def utc_datetimes(column):
+    """Aware ``datetime`` objects for a UTC datetime column (faster than ``to_pydatetime``)."""
+    naive = column.dt.tz_localize(None).to_numpy().astype("datetime64[us]").tolist()
+    return [value.replace(tzinfo=timezone.utc) for value in naive]
+
+
+def normalize_purchases(df):
+    """Coerce a purchases chunk and validate it column by column.
+
+    Returns ``(purchases, items, errors)``. ``purchases`` holds the valid
+    rows with a ``line`` column, stripped strings, UTC timestamps and the
+    normalised ``items_list``; ``items`` has one ``(line, product_name)``
+    row per listed item of those purchases.
+    """
+    import pandas as pd
+
+    lines = _lines(df)
+    errors = []
+    bad = pd.Series(False, index=df.index)
+
+    def check(mask, message):
+        # report each row once, for the first check it fails
+        nonlocal bad
+        mask = _mask(mask, df.index)
+        _reject(errors, lines, mask & ~bad, message)
+        bad = bad | mask
+
+    out = pd.DataFrame({"line": lines})
+    for name in ("supermarket_id", "user_id"):
+        out[name] = _strings(df[name])
+        check(out[name].isna() | (out[name] == ""), f"missing {name}")
+    out["total_amount"] = pd.to_numeric(df["total_amount"], errors="coerce")
+    check(_invalid_amounts(out["total_amount"]), "invalid total_amount")
+    out["timestamp"] = parse_timestamps(df["timestamp"])
+    check(out["timestamp"].isna(), "invalid timestamp")
+
+    items = _strings(df["items_list"]).str.split(",").explode().str.strip()
+    items = items[items.notna() & (items != "")]
+    check(~out.index.isin(items.index), "empty items_list")
+    items = items[~bad.reindex(items.index).to_numpy()]
+
+    out = out[~bad]
+    out["items_list"] = items.groupby(level=0, sort=False).agg(",".join)
+    items = pd.DataFrame({"line": lines.reindex(items.index).to_numpy(), "product_name": items.to_numpy()})
+    return out, items, errors
+
+
+def reject_unknown_products(purchases, items, known):
+    """Drop purchases listing a product outside ``known`` with one set join.
+
+    Returns ``(purchases, items, errors)`` with the offending rows removed
+    and an ``unknown product(s): ...`` error per row.
+    """
+    unknown = items[~items["product_name"].isin(known)]
+    if unknown.empty:
+        return purchases, items, []
+    names = unknown.drop_duplicates().groupby("line", sort=True)["product_name"].agg(", ".join)
+    errors = [(int(line), f"unknown product(s): {listed}") for line, listed in names.items()]
+    bad_lines = names.index
+    return (purchases[~purchases["line"].isin(bad_lines)], items[~items["line"].isin(bad_lines)], errors)
+
+
+def row_fingerprints(purchases):
+    """Per-row hashes of store, UTC timestamp, user and items (see ``importers``)."""
+    keys = (purchases["supermarket_id"] + "\x1f"
+            + purchases["timestamp"].dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ") + "\x1f"
+            + purchases["user_id"] + "\x1f" + purchases["items_list"])
+    return [hashlib.blake2b(key.encode(), digest_size=16).hexdigest() for key in keys]
+
+
+def normalize_products(df):
+    """Coerce a products chunk; returns ``({product_name: unit_price}, errors)``.
+
+    When a name appears more than once the last row wins, like the
+    row-by-row loader used to behave.
+    """
+    import pandas as pd
+
+    lines = _lines(df)
+    errors = []
+    names = _strings(df["product_name"])
+    prices = pd.to_numeric(df["unit_price"], errors="coerce")
+    missing = _mask(names.isna() | (names == ""), df.index)
+    _reject(errors, lines, missing, "missing product_name")
+    invalid = _mask(_invalid_amounts(prices), df.index) & ~missing
+    _reject(errors, lines, invalid, "invalid unit_price")
+    ok = ~(missing | invalid)
+    return dict(zip(names[ok].tolist(), prices[ok].astype(float).tolist())), errors
+
+
+def compact_lines(lines, limit=8):
+    """Render sorted line numbers as ranges: ``2-4, 9, 12-13 (+5 more)``."""
+    ranges = []
+    for line in sorted(set(lines)):
+        if ranges and line == ranges[-1][1] + 1:
+            ranges[-1][1] = line
+        else:
+            ranges.append([line, line])
+    shown = ", ".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges[:limit])
+    hidden = sum(b - a + 1 for a, b in ranges[limit:])
+    return shown + (f" (+{hidden} more)" if hidden else "")
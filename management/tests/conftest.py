@@ -0,0 +1,38 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# point the app at a throwaway SQLite database before mvc_app creates its engine
+_db_dir = tempfile.mkdtemp(prefix="management-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_db_dir, 'test.db')}")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from mvc_app.db import Base, SessionLocal, engine  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    Base.metadata.drop_all(bind=engine)
+    app = create_app()
+    app.config.update(TESTING=True)
+    yield app
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def session(app):
+    with SessionLocal() as session:
+        yield session
+
+
+def csv_file(text, name="data.csv"):
+    import io
+    return io.BytesIO(text.encode()), name
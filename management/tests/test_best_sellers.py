@@ -0,0 +1,65 @@
+from datetime import date
+
+from sqlalchemy.dialects import postgresql
+
+from mvc_app import reports
+from mvc_app.db import SessionLocal
+
+from test_upload_purchases import upload
+
+PRODUCTS = "product_name,unit_price\na,1\nb,1\nc,1\nd,1\ne,1\n"
+HEADER = "supermarket_id,timestamp,user_id,items_list,total_amount\n"
+# purchase counts: a=4, b=3, c=3, d=2, e=1
+PURCHASES = HEADER + (
+    'SM1,2025-10-01T10:00:00Z,u1,"a,b,c,d,e",5\n'
+    'SM1,2025-10-02T10:00:00Z,u1,"a,b,c,d",4\n'
+    'SM2,2025-10-03T10:00:00Z,u2,"a,b,c",3\n'
+    'SM2,2025-10-04T10:00:00Z,u2,a,1\n'
+)
+
+
+def seed(client):
+    upload(client, "/upload_products", PRODUCTS)
+    upload(client, "/upload_purchases", PURCHASES)
+
+
+def test_top_sellers_includes_ties(client):
+    seed(client)
+    with SessionLocal() as session:
+        assert reports.top_sellers(session, n=3) == [("a", 4), ("b", 3), ("c", 3), ("d", 2)]
+        assert reports.top_sellers(session, n=1) == [("a", 4)]
+
+
+def test_top_sellers_with_store_and_date_filters(client):
+    seed(client)
+    with SessionLocal() as session:
+        assert reports.top_sellers(session, n=1, store="SM2") == [("a", 2)]
+        assert reports.top_sellers(session, n=2, start=reports.parse_date_arg({"d": "2025-10-02"}, "d"),
+                                   end=reports.parse_date_arg({"d": "2025-10-03"}, "d")) == [
+            ("a", 2), ("b", 2), ("c", 2), ("d", 1)]
+
+
+def test_best_sellers_page(client):
+    seed(client)
+    resp = client.get("/best_sellers?n=1")
+    assert resp.status_code == 200
+    assert b"<td>a</td>" in resp.data and b"<td>b</td>" not in resp.data
+    assert client.get("/best_sellers?n=0").status_code == 400
+    assert client.get("/best_sellers?start=yesterday").status_code == 400
+
+
+def test_postgres_ranking_compiles():
+    dialect = postgresql.dialect()
+    global_sql = str(reports._dense_rank_top(reports._global_counts(), 3).compile(
+        dialect=dialect, compile_kwargs={"literal_binds": True}))
+    assert "dense_rank() OVER (ORDER BY anon_2.total DESC) AS rnk" in global_sql
+    assert "WHERE anon_1.rnk <= 3" in global_sql
+    assert "product_total_purchases" in global_sql
+
+    filtered = reports._filtered_counts("SM1", date(2025, 10, 1), None)
+    filtered_sql = str(reports._dense_rank_top(filtered, 2).compile(
+        dialect=dialect, compile_kwargs={"literal_binds": True}))
+    assert "dense_rank() OVER (ORDER BY anon_2.total DESC) AS rnk" in filtered_sql
+    assert "WHERE anon_1.rnk <= 2" in filtered_sql
+    assert "sum(purchase_items.quantity) AS total" in filtered_sql
+    assert "purchases.supermarket_id = 'SM1'" in filtered_sql
@@ -0,0 +1,70 @@
+import csv
+import io
+
+import pytest
+
+from mvc_app import exports
+
+from test_upload_purchases import PRODUCTS, PURCHASES, upload
+
+
+@pytest.fixture
+def loaded(client, monkeypatch):
+    # several batches even for a handful of rows
+    monkeypatch.setattr(exports, "EXPORT_BATCH_ROWS", 2)
+    upload(client, "/upload_products", PRODUCTS)
+    upload(client, "/upload_purchases", PURCHASES)
+    return client
+
+
+def read_csv(response):
+    return list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+
+
+def test_export_purchases_csv_streams_in_batches(loaded):
+    response = loaded.get("/export/purchases", buffered=False)
+    assert response.mimetype == "text/csv"
+    assert response.headers["Content-Disposition"] == "attachment; filename=purchases.csv"
+    chunks = list(response.response)
+    assert chunks[0] == b"id,supermarket_id,timestamp,user_id,items_list,total_amount\r\n"
+    assert len(chunks) == 3  # header + two batches of two rows
+
+    rows = read_csv(loaded.get("/export/purchases"))
+    assert [(r["supermarket_id"], r["user_id"], r["items_list"]) for r in rows] == [
+        ("SM1", "u001", "apple"), ("SM1", "u002", "banana,milk"), ("SM2", "u001", "apple,milk"),
+    ]
+    assert rows[0]["timestamp"].startswith("2025-10-28T08:12:00")
+
+
+def test_export_filters_and_errors(loaded):
+    assert [r["user_id"] for r in read_csv(loaded.get("/export/purchases?store=SM2"))] == ["u001"]
+    assert read_csv(loaded.get("/export/purchases?start=2025-10-29")) == []
+    assert [r["product_name"] for r in read_csv(loaded.get("/export/products"))] == ["apple", "banana", "milk"]
+
+    assert loaded.get("/export/purchases?format=xlsx").status_code == 400
+    assert loaded.get("/export/purchases?start=yesterday").status_code == 400
+    assert loaded.get("/export/users").status_code == 404
+
+
+def test_export_without_pyarrow(loaded, monkeypatch):
+    def missing(names, types):
+        raise ImportError("No module named 'pyarrow'")
+
+    monkeypatch.setattr(exports, "arrow_schema", missing)
+    response = loaded.get("/export/purchases?format=parquet")
+    assert response.status_code == 501
+    assert "pyarrow" in response.get_json()["error"]
+
+
+def test_export_arrow_and_parquet(loaded):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    table = pa.ipc.open_stream(loaded.get("/export/purchases?format=arrow&store=SM1").data).read_all()
+    assert table.column("user_id").to_pylist() == ["u001", "u002"]
+    assert table.column("total_amount").to_pylist() == [0.5, 2.8]
+    assert str(table.schema.field("timestamp").type) == "timestamp[us, tz=UTC]"
+
+    table = pq.read_table(io.BytesIO(loaded.get("/export/products?format=parquet").data))
+    assert table.to_pydict() == {"id": [1, 2, 3], "product_name": ["apple", "banana", "milk"],
+                                 "unit_price": [0.5, 0.3, 2.5]}
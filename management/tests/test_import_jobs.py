@@ -0,0 +1,132 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+from mvc_app import jobs, streaming
+from mvc_app.models import (
+    ImportChunk, ImportJob, Product, Purchase, PurchaseItem, TotalProductPurchases, TotalUserPurchases,
+)
+
+from conftest import csv_file
+from test_upload_purchases import PRODUCTS, upload
+
+HEADER = "supermarket_id,timestamp,user_id,items_list,total_amount\n"
+
+
+def test_background_upload_runs_chunks_in_parallel(client, session, monkeypatch):
+    monkeypatch.setattr(streaming, "CHUNK_ROWS", 10)
+    manager = jobs.ImportJobManager(workers=3)
+    monkeypatch.setattr(jobs, "_manager", manager)
+    upload(client, "/upload_products", PRODUCTS)
+    rows = "".join(f'SM{i % 2},2025-10-28T08:{i % 60:02d}:{i // 60:02d}Z,u{i % 7},"apple,milk",3.0\n' for i in range(95))
+    rows += "SM1,2025-10-28T08:00:00Z,u1,caviar,1.0\n"
+
+    resp = client.post(
+        "/upload_purchases",
+        data={"file": csv_file(HEADER + rows), "background": "1"},
+        content_type="multipart/form-data",
+        headers={"Accept": "application/json"},
+    )
+    assert resp.status_code == 202
+    manager.join()
+
+    status = client.get(resp.get_json()["status_url"]).get_json()
+    assert status["status"] == "done"
+    assert status["rows_done"] == 96
+    assert status["chunks_done"] == 10
+    assert status["error_count"] == 1
+    assert status["errors"] == [{"line": 97, "message": "unknown product(s): caviar"}]
+    assert status["result"]["inserted"] == 95
+
+    assert session.query(Purchase).count() == 95
+    assert sum(t.total_purchases for t in session.query(TotalUserPurchases)) == 95
+    assert {t.total_purchases for t in session.query(TotalProductPurchases)} == {95}
+    assert session.query(PurchaseItem).count() == 190
+    assert session.query(ImportChunk).count() == 0
+
+
+def test_unknown_job_returns_404(client):
+    assert client.get("/jobs/missing").status_code == 404
+
+
+def test_startup_fails_interrupted_jobs_and_removes_old_spool_files(app, session, tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "SPOOL_DIR", str(tmp_path))
+    long_ago = datetime.now(timezone.utc) - timedelta(hours=2)
+    spools = {}
+    for name in ("orphaned", "live", "old", "fresh"):
+        spools[name] = tmp_path / f"purchases-{name}.csv"
+        spools[name].write_text(HEADER)
+    for name in ("orphaned", "live", "old"):
+        os.utime(spools[name], (long_ago.timestamp(), long_ago.timestamp()))
+    session.add_all([
+        ImportJob(id="dead", kind="purchases", upload_key="purchases:dead", path=str(spools["orphaned"]),
+                  status="running", created_at=long_ago, heartbeat_at=long_ago),
+        ImportJob(id="alive", kind="purchases", upload_key="purchases:alive", path=str(spools["live"]),
+                  status="queued", created_at=long_ago, heartbeat_at=datetime.now(timezone.utc)),
+    ])
+    session.commit()
+
+    assert jobs.recover_interrupted_jobs(stale_after=300, spool_max_age=3600) == 1
+
+    session.expire_all()
+    dead = session.get(ImportJob, "dead")
+    assert dead.status == "failed"
+    assert "upload the same file again" in dead.message
+    assert dead.finished_at is not None
+    assert session.get(ImportJob, "alive").status == "queued"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["purchases-fresh.csv", "purchases-live.csv"]
+
+
+def test_heartbeat_refreshes_the_managers_unfinished_jobs(app, session):
+    manager = jobs.ImportJobManager(workers=1)
+    long_ago = datetime.now(timezone.utc) - timedelta(hours=2)
+    session.add_all([
+        ImportJob(id="mine", kind="purchases", upload_key="k1", path="p1", status="queued",
+                  created_at=long_ago, owner=manager.owner, heartbeat_at=long_ago),
+        ImportJob(id="theirs", kind="purchases", upload_key="k2", path="p2", status="queued",
+                  created_at=long_ago, owner="someone-else", heartbeat_at=long_ago),
+    ])
+    session.commit()
+
+    manager.beat()
+
+    assert jobs.recover_interrupted_jobs(stale_after=300) == 1
+    session.expire_all()
+    assert session.get(ImportJob, "mine").status == "queued"
+    assert session.get(ImportJob, "theirs").status == "failed"
+
+
+def test_failed_job_removes_its_spool_file(client, session, tmp_path, monkeypatch):
+    def boom(session, df):
+        raise RuntimeError("disk on fire")
+
+    monkeypatch.setattr(jobs, "IMPORTERS", {"purchases": (boom, streaming.PURCHASE_DTYPES, True)})
+    manager = jobs.ImportJobManager(workers=2)
+    path = tmp_path / "purchases-failed.csv"
+    path.write_text(HEADER + "SM1,2025-10-28T08:00:00Z,u1,apple,0.5\n")
+
+    job_id = manager.submit("purchases", str(path), "purchases:failed")
+    manager.join()
+
+    job = session.get(ImportJob, job_id)
+    assert job.status == "failed"
+    assert job.message == "disk on fire"
+    assert not path.exists()
+
+
+def test_product_job_keeps_the_last_price_across_chunks(client, session, monkeypatch):
+    monkeypatch.setattr(streaming, "CHUNK_ROWS", 2)
+    manager = jobs.ImportJobManager(workers=4)
+    monkeypatch.setattr(jobs, "_manager", manager)
+    rows = "".join(f"apple,{price}\nmilk,{price + 1}\n" for price in range(1, 13))
+
+    resp = client.post(
+        "/upload_products",
+        data={"file": csv_file("product_name,unit_price\n" + rows), "background": "1"},
+        content_type="multipart/form-data",
+        headers={"Accept": "application/json"},
+    )
+    assert resp.status_code == 202
+    manager.join()
+
+    prices = {p.product_name: float(p.unit_price) for p in session.query(Product)}
+    assert prices == {"apple": 12.0, "milk": 13.0}
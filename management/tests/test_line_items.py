@@ -0,0 +1,72 @@
+from datetime import datetime, timezone
+
+from mvc_app import backfill, reports
+from mvc_app.models import BackfillProgress, Purchase, PurchaseItem, TotalProductPurchases
+
+from test_upload_purchases import PRODUCTS, upload
+
+
+def test_upload_writes_line_items_with_quantities(client, session):
+    upload(client, "/upload_products", PRODUCTS)
+    upload(client, "/upload_purchases", (
+        "supermarket_id,timestamp,user_id,items_list,total_amount\n"
+        'SM1,2025-10-28T08:12:00Z,u001,"apple,milk,apple",3.5\n'
+    ))
+    purchase = session.query(Purchase).one()
+    lines = {(pi.product.product_name, pi.quantity, float(pi.line_total)) for pi in session.query(PurchaseItem)}
+    assert lines == {("apple", 2, 1.0), ("milk", 1, 2.5)}
+    assert {pi.purchase_id for pi in session.query(PurchaseItem)} == {purchase.id}
+
+
+def legacy_purchase(session, items_list):
+    session.add(Purchase(supermarket_id="SM1", timestamp=datetime(2025, 10, 1, tzinfo=timezone.utc),
+                         user_id="u1", items_list=items_list, total_amount=0))
+
+
+def test_backfill_is_batched_and_resumable(client, session):
+    upload(client, "/upload_products", PRODUCTS)
+    for items_list in ["apple", "apple,apple,milk", "banana", "caviar,milk", "milk"]:
+        legacy_purchase(session, items_list)
+    session.commit()
+
+    assert backfill.backfill_line_items(batch_size=2, max_batches=1) == (2, 2)
+    assert session.get(BackfillProgress, backfill.LINE_ITEMS_BACKFILL).last_id == 2
+    # rerunning resumes after purchase 2 and leaves already converted rows alone
+    assert backfill.backfill_line_items(batch_size=2) == (3, 5)
+    lines = sorted((pi.purchase_id, pi.product.product_name, pi.quantity) for pi in session.query(PurchaseItem))
+    assert lines == [(1, "apple", 1), (2, "apple", 2), (2, "milk", 1), (3, "banana", 1), (4, "milk", 1), (5, "milk", 1)]
+    assert backfill.backfill_line_items(batch_size=2) == (0, 5)
+
+
+def test_backfill_counts_legacy_units_in_best_sellers(client, session):
+    # legacy purchases have an items_list but neither line items nor counters
+    upload(client, "/upload_products", PRODUCTS)
+    for items_list in ["apple,apple,milk", "milk", "banana"]:
+        legacy_purchase(session, items_list)
+    session.commit()
+    upload(client, "/upload_purchases", (
+        "supermarket_id,timestamp,user_id,items_list,total_amount\n"
+        "SM1,2025-10-28T08:12:00Z,u001,milk,2.5\n"
+    ))
+    assert reports.top_sellers(session, n=1) == [("milk", 1)]
+
+    backfill.backfill_line_items(batch_size=2, max_batches=1)
+    backfill.backfill_line_items(batch_size=2)
+    assert reports.top_sellers(session, n=3) == [("milk", 3), ("apple", 2), ("banana", 1)]
+    # a rerun skips converted purchases instead of counting them twice
+    backfill.backfill_line_items(batch_size=2)
+    session.expire_all()
+    assert reports.top_sellers(session, n=1) == [("milk", 3)]
+
+
+def test_rebuild_product_totals_from_line_items(client, session):
+    upload(client, "/upload_products", PRODUCTS)
+    upload(client, "/upload_purchases", (
+        "supermarket_id,timestamp,user_id,items_list,total_amount\n"
+        'SM1,2025-10-28T08:12:00Z,u001,"apple,apple,milk",3.5\n'
+    ))
+    session.query(TotalProductPurchases).delete()
+    session.commit()
+    assert backfill.rebuild_product_totals(session) == 2
+    session.commit()
+    assert reports.top_sellers(session, n=2) == [("apple", 2), ("milk", 1)]
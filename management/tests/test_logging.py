@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+import sys
+
+import pytest
+
+from mvc_app import logging_config
+from mvc_app.logging_config import HotLogger, JsonFormatter, setup_logging, stop_logging
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def output(tmp_path, monkeypatch):
+    """Route the log writer to a file configured from a throwaway log.cfg."""
+    path = tmp_path / "out.log"
+    stream = open(path, "w")
+
+    def configure(**settings):
+        # pytest swaps sys.stdout between phases; set it right before the handler binds it
+        monkeypatch.setattr(sys, "stdout", stream)
+        cfg = tmp_path / "log.cfg"
+        cfg.write_text("[logging]\n" + "".join(f"{key} = {value}\n" for key, value in settings.items()))
+        setup_logging(str(cfg))
+
+    def read():
+        stop_logging()  # drains the queue
+        stream.flush()
+        return path.read_text().splitlines()
+
+    configure.read = read
+    yield configure
+    monkeypatch.undo()
+    stream.close()
+    setup_logging(os.path.join(SERVICE_DIR, "log.cfg"))
+
+
+def test_queued_json_output(output):
+    output(level="INFO", format="json")
+    assert isinstance(logging.getLogger().handlers[0], logging.handlers.QueueHandler)
+    logging.getLogger("app.test").info("imported %d rows", 3, extra={"upload_key": "abc"})
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logging.getLogger("app.test").exception("failed")
+
+    records = [json.loads(line) for line in output.read()]
+    assert records[1]["logger"] == "app.test"
+    assert records[1]["message"] == "imported 3 rows"
+    assert records[1]["upload_key"] == "abc"
+    assert records[2]["level"] == "ERROR" and "ValueError: boom" in records[2]["exc_info"]
+
+
+def test_synchronous_text_output(output):
+    output(level="INFO", queue="false")
+    assert not any(isinstance(h, logging.handlers.QueueHandler) for h in logging.getLogger().handlers)
+    logging.getLogger("app.test").info("hello")
+    assert output.read()[-1].endswith("INFO app.test: hello")
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_child_gets_its_own_writer(output):
+    output(level="INFO")
+    pid = os.fork()
+    if pid == 0:
+        logging.getLogger("app.child").info("from the child")
+        stop_logging()
+        sys.stdout.flush()
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert any(line.endswith("app.child: from the child") for line in output.read())
+
+
+def test_hot_logger_reports_suppressed_records(monkeypatch, caplog):
+    clock = [100.0]
+    monkeypatch.setattr(logging_config.time, "monotonic", lambda: clock[0])
+    log = HotLogger(logging.getLogger("app.rows"), rate=2, burst=3)
+
+    with caplog.at_level(logging.DEBUG, logger="app.rows"):
+        for line in range(5):
+            log.debug("row %d rejected", line)
+        # other call sites have their own budget
+        log.debug("chunk %d committed", 1)
+        clock[0] += 0.5  # one token back
+        log.debug("row %d rejected", 5)
+        log.debug("row %d rejected", 6)
+
+    assert caplog.messages == [
+        "row 0 rejected", "row 1 rejected", "row 2 rejected", "chunk 1 committed",
+        "row 5 rejected [2 similar messages suppressed]",
+    ]
+    assert caplog.records[-1].suppressed == 2
+
+
+def test_json_formatter_without_extras():
+    line = JsonFormatter().format(logging.LogRecord("app.x", logging.WARNING, __file__, 1, "a %s", ("b",), None))
+    assert json.loads(line).keys() == {"ts", "level", "logger", "message"}
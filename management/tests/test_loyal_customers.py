@@ -0,0 +1,27 @@
+from mvc_app.models import TotalUserPurchases, User
+
+
+def seed(session):
+    totals = {"u1": 5, "u2": 3, "u3": 3, "u4": 3, "u5": 2, "u6": 7}
+    session.add_all([User(user_id=u) for u in totals])
+    session.add_all([TotalUserPurchases(user_id=u, total_purchases=t) for u, t in totals.items()])
+    session.commit()
+
+
+def test_loyal_customers_keyset_pages(client, session):
+    seed(session)
+    first = client.get("/loyal_customers?format=json&limit=2").get_json()
+    assert [c["user_id"] for c in first["customers"]] == ["u6", "u1"]
+    second = client.get(f"/loyal_customers?format=json&limit=2&after={first['next']}").get_json()
+    assert [c["user_id"] for c in second["customers"]] == ["u2", "u3"]
+    third = client.get(f"/loyal_customers?format=json&limit=2&after={second['next']}").get_json()
+    assert third == {"threshold": 3, "customers": [{"user_id": "u4", "total_purchases": 3}], "next": None}
+
+
+def test_loyal_customers_threshold_and_html(client, session):
+    seed(session)
+    body = client.get("/loyal_customers?threshold=5&format=json").get_json()
+    assert [c["user_id"] for c in body["customers"]] == ["u6", "u1"]
+    page = client.get("/loyal_customers?limit=1")
+    assert b"Next page" in page.data and b"at least 3 times" in page.data
+    assert client.get("/loyal_customers?after=garbage").status_code == 400
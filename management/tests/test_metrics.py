@@ -0,0 +1,81 @@
+import logging
+
+import pytest
+from sqlalchemy import select
+
+from mvc_app import db, metrics
+from mvc_app.db import SessionLocal
+from mvc_app.models import Product
+
+from conftest import csv_file
+
+
+def test_metrics_report_request_latency_and_sql(client):
+    metrics.registry.reset()
+    data = {"file": csv_file("product_name,unit_price\napple,0.5\nmilk,2.5\n", "products.csv")}
+    response = client.post("/upload_products", data=data, content_type="multipart/form-data")
+    assert "db;dur=" in response.headers["Server-Timing"]
+
+    body = client.get("/metrics").get_data(as_text=True)
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert 'http_request_duration_seconds_count{endpoint="main.upload_products",method="POST"} 1' in body
+    assert 'http_requests_total{endpoint="main.upload_products",method="POST",status="302"} 1' in body
+    assert metrics.registry.value("db_commits_total", (("endpoint", "main.upload_products"),)) >= 1
+    assert metrics.registry.value("db_statements_total", (("endpoint", "main.upload_products"),)) > 0
+
+
+def test_repeated_statements_are_flagged(app, client, caplog):
+    metrics.registry.reset()
+
+    def lookup_each():
+        with SessionLocal() as session:
+            for name in range(metrics.N_PLUS_ONE_THRESHOLD):
+                session.execute(select(Product).where(Product.product_name == str(name))).all()
+        return "ok"
+
+    app.add_url_rule("/n_plus_one", "n_plus_one", lookup_each)
+    with caplog.at_level(logging.WARNING, logger="app.sql"):
+        client.get("/n_plus_one")
+    assert metrics.registry.value("db_n_plus_one_total", (("endpoint", "n_plus_one"),)) == 1
+    assert "Possible N+1 in n_plus_one" in caplog.text
+
+
+def test_slow_queries_are_logged(client, caplog, monkeypatch):
+    monkeypatch.setattr(metrics, "SLOW_QUERY_MS", 0)
+    with caplog.at_level(logging.WARNING, logger="app.sql"):
+        client.get("/best_sellers")
+    assert "Slow query" in caplog.text
+
+
+@pytest.mark.skipif(db.PGBOUNCER, reason="no local pool behind pgbouncer")
+def test_pool_checkout_waits_are_exported(client):
+    metrics.registry.reset()
+    client.get("/jobs/missing")
+    body = client.get("/metrics").get_data(as_text=True)
+    assert 'db_pool_wait_seconds_count{pool="primary"}' in body
+    assert "# TYPE db_pool_primary_checked_out gauge" in body
+
+
+def test_pgbouncer_mode_keeps_no_pool(monkeypatch):
+    from sqlalchemy.pool import NullPool
+
+    monkeypatch.setattr(db, "PGBOUNCER", False)
+    assert db.engine_options("postgresql+psycopg2://u@h/db")["pool_size"] == db.POOL_SIZE
+    monkeypatch.setattr(db, "PGBOUNCER", True)
+    assert db.engine_options("postgresql+psycopg2://u@h/db")["poolclass"] is NullPool
+    assert db.engine_options("postgresql+asyncpg://u@h/db")["connect_args"]["statement_cache_size"] == 0
+
+
+def test_reports_use_the_read_session(client, monkeypatch):
+    from mvc_app import controllers
+
+    opened = []
+
+    def read_session():
+        opened.append(True)
+        return SessionLocal()
+
+    monkeypatch.setattr(controllers, "ReadSessionLocal", read_session)
+    for url in ("/best_sellers", "/loyal_customers", "/unique_customers", "/analytics/sales"):
+        assert client.get(url).status_code == 200
+    assert len(opened) == 4
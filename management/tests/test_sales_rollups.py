@@ -0,0 +1,65 @@
+from mvc_app.db import SessionLocal, engine, ensure_schema, schema_version
+from mvc_app.models import SCHEMA_VERSION, PurchaseCount, SalesRollup
+from mvc_app.rollups import rebuild_sales_rollups
+
+from test_upload_purchases import upload
+
+PRODUCTS = "product_name,unit_price\napple,0.5\nmilk,2.5\n"
+PURCHASES = (
+    "supermarket_id,timestamp,user_id,items_list,total_amount\n"
+    'SM1,2025-10-27T10:00:00Z,u1,"apple,milk",3.0\n'
+    'SM1,2025-10-27T11:00:00Z,u2,"apple,apple",1.0\n'
+    'SM2,2025-10-28T12:00:00Z,u1,milk,2.5\n'
+)
+
+
+def sales(client, query=""):
+    resp = client.get(f"/analytics/sales?{query}")
+    assert resp.status_code == 200
+    return resp.get_json()["rows"]
+
+
+def test_rollups_are_maintained_by_uploads(client):
+    upload(client, "/upload_products", PRODUCTS)
+    upload(client, "/upload_purchases", PURCHASES)
+    # three purchases, one of them with two products
+    assert sales(client) == [{"units": 5, "revenue": 6.5, "purchases": 3}]
+    assert sales(client, "group_by=store") == [
+        {"store": "SM1", "units": 4, "revenue": 4.0, "purchases": 2},
+        {"store": "SM2", "units": 1, "revenue": 2.5, "purchases": 1},
+    ]
+    assert sales(client, "group_by=store,product") == [
+        {"store": "SM1", "product": "apple", "units": 3, "revenue": 1.5, "purchases": 2},
+        {"store": "SM1", "product": "milk", "units": 1, "revenue": 2.5, "purchases": 1},
+        {"store": "SM2", "product": "milk", "units": 1, "revenue": 2.5, "purchases": 1},
+    ]
+    assert sales(client, "group_by=day&product=milk&start=2025-10-28") == [
+        {"day": "2025-10-28", "units": 1, "revenue": 2.5, "purchases": 1}]
+    assert client.get("/analytics/sales?group_by=user").status_code == 400
+
+
+def test_rebuild_matches_incremental_rollups(client, session):
+    upload(client, "/upload_products", PRODUCTS)
+    upload(client, "/upload_purchases", PURCHASES)
+    before = sales(client, "group_by=store,day,product")
+    session.query(SalesRollup).delete()
+    session.commit()
+    assert sales(client) == []
+    with SessionLocal() as s:
+        assert rebuild_sales_rollups(s, batch_size=2) == 3
+        s.commit()
+    assert sales(client, "group_by=store,day,product") == before
+
+
+def test_upgrade_counts_purchases_of_existing_rollups(client):
+    upload(client, "/upload_products", PRODUCTS)
+    upload(client, "/upload_purchases", PURCHASES)
+    # a version 2 database: rollups but no purchase_counts
+    PurchaseCount.__table__.drop(engine)
+    with engine.begin() as conn:
+        conn.execute(schema_version.update().values(version=2))
+    assert ensure_schema("management", SCHEMA_VERSION) is True
+    assert sales(client, "group_by=day") == [
+        {"day": "2025-10-27", "units": 4, "revenue": 4.0, "purchases": 2},
+        {"day": "2025-10-28", "units": 1, "revenue": 2.5, "purchases": 1},
+    ]
@@ -0,0 +1,126 @@
+import os
+import subprocess
+import sys
+
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, Numeric, String, Table, TIMESTAMP, inspect, text
+
+from mvc_app import backfill, db, reports
+from mvc_app.db import SessionLocal, engine, ensure_schema, recorded_schema_version, schema_version
+from mvc_app.migrations import LEGACY_PRODUCT_COUNTERS
+from mvc_app.models import SCHEMA_VERSION
+
+from test_upload_purchases import PRODUCTS, upload
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_create_app_stamps_the_schema_version(app):
+    assert recorded_schema_version("management") == SCHEMA_VERSION
+    # a restart against the same schema skips create_all
+    assert ensure_schema("management", SCHEMA_VERSION) is False
+
+
+def test_missing_or_older_schema_is_created(app):
+    db.Base.metadata.drop_all(bind=engine)
+    assert recorded_schema_version("management") is None
+    assert ensure_schema("management", SCHEMA_VERSION) is True
+    assert "imported_files" in inspect(engine).get_table_names()
+
+    assert ensure_schema("management", SCHEMA_VERSION + 1) is True
+    assert recorded_schema_version("management") == SCHEMA_VERSION + 1
+    # an older build leaves the newer stamp alone
+    assert ensure_schema("management", SCHEMA_VERSION) is False
+    assert recorded_schema_version("management") == SCHEMA_VERSION + 1
+
+
+def test_managed_schema_must_match(app, monkeypatch):
+    monkeypatch.setattr(db, "CREATE_TABLES", False)
+    with engine.begin() as conn:
+        conn.execute(schema_version.delete())
+    with pytest.raises(RuntimeError, match=f"expected {SCHEMA_VERSION}"):
+        ensure_schema("management", SCHEMA_VERSION)
+
+
+def legacy_tables():
+    """The tables as ``create_all`` made them before schema versioning."""
+    metadata = MetaData()
+    Table("products", metadata, Column("id", Integer, primary_key=True),
+          Column("product_name", String, unique=True, nullable=False), Column("unit_price", Numeric, nullable=False))
+    Table("purchases", metadata, Column("id", Integer, primary_key=True),
+          Column("supermarket_id", String, nullable=False), Column("timestamp", TIMESTAMP(timezone=True), nullable=False),
+          Column("user_id", String, nullable=False), Column("items_list", String, nullable=False),
+          Column("total_amount", Numeric, nullable=False))
+    Table("purchase_items", metadata, Column("id", Integer, primary_key=True),
+          Column("product_id", Integer, ForeignKey("products.id")), Column("total_purchases", Integer, nullable=False))
+    Table("users", metadata, Column("id", Integer, primary_key=True), Column("user_id", String, unique=True, nullable=False))
+    Table("user_total_purchases", metadata, Column("id", Integer, primary_key=True),
+          Column("user_id", String, ForeignKey("users.user_id"), nullable=False), Column("total_purchases", Integer))
+    return metadata
+
+
+@pytest.fixture
+def legacy_db():
+    db.Base.metadata.drop_all(bind=engine)
+    legacy = legacy_tables()
+    legacy.create_all(bind=engine)
+    yield legacy
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {LEGACY_PRODUCT_COUNTERS}"))
+    db.Base.metadata.drop_all(bind=engine)
+
+
+def test_legacy_database_is_migrated(legacy_db):
+    tables = legacy_db.tables
+    with engine.begin() as conn:
+        conn.execute(tables["products"].insert(), [{"product_name": "apple", "unit_price": 0.5},
+                                                  {"product_name": "milk", "unit_price": 2.5}])
+        conn.execute(tables["purchases"].insert(), {
+            "supermarket_id": "SM1", "timestamp": datetime(2025, 10, 1, tzinfo=timezone.utc), "user_id": "u1",
+            "items_list": "apple,apple,milk", "total_amount": 3.5})
+        conn.execute(tables["purchase_items"].insert(), [{"product_id": 1, "total_purchases": 2},
+                                                        {"product_id": 2, "total_purchases": 1}])
+        conn.execute(tables["users"].insert(), {"user_id": "u1"})
+        conn.execute(tables["user_total_purchases"].insert(), [{"user_id": "u1", "total_purchases": 1},
+                                                              {"user_id": "u1", "total_purchases": 2}])
+
+    assert ensure_schema("management", SCHEMA_VERSION) is True
+    assert recorded_schema_version("management") == SCHEMA_VERSION
+    inspector = inspect(engine)
+    assert "row_hash" in {c["name"] for c in inspector.get_columns("purchases")}
+    assert {"purchase_id", "quantity", "line_total"} <= {c["name"] for c in inspector.get_columns("purchase_items")}
+    with engine.connect() as conn:
+        assert conn.execute(text(f"SELECT COUNT(*) FROM {LEGACY_PRODUCT_COUNTERS}")).scalar() == 2
+        assert conn.execute(text("SELECT user_id, total_purchases FROM user_total_purchases")).all() == [("u1", 3)]
+        assert conn.execute(text("SELECT store_id FROM customer_sketches")).all() == [("SM1",)]
+
+    # the upsert and row-hash paths work against the migrated tables
+    from app import create_app
+
+    client = create_app().test_client()
+    upload(client, "/upload_products", PRODUCTS)
+    upload(client, "/upload_purchases", "supermarket_id,timestamp,user_id,items_list,total_amount\n"
+                                        "SM1,2025-10-28T08:12:00Z,u1,milk,2.5\n")
+    backfill.backfill_line_items()
+    with SessionLocal() as session:
+        assert reports.top_sellers(session, n=2) == [("apple", 2), ("milk", 2)]
+        assert session.execute(text("SELECT total_purchases FROM user_total_purchases")).scalar() == 4
+
+
+def test_schema_is_not_stamped_when_a_table_cant_be_migrated(legacy_db):
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE imported_files (upload_key VARCHAR PRIMARY KEY)"))
+    with pytest.raises(RuntimeError, match="imported_files.rows is missing"):
+        ensure_schema("management", SCHEMA_VERSION)
+    assert recorded_schema_version("management") is None
+
+
+def test_app_import_does_not_load_pandas():
+    # one write call: print() writes its parts separately and a log line could land in between
+    probe = "import sys, app; app.create_app(); sys.stdout.write('pandas loaded: %s\\n' % ('pandas' in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", probe], cwd=SERVICE_DIR, capture_output=True, text=True,
+                         env=dict(os.environ, LOG_LEVEL="WARNING"), check=True)
+    # log lines are written by a background thread and may come after the probe's
+    assert "pandas loaded: False" in out.stdout.splitlines()
@@ -0,0 +1,62 @@
+import io
+import os
+
+import pytest
+
+from mvc_app import streaming
+from mvc_app.importers import import_purchases
+from mvc_app.models import ImportChunk, Purchase, TotalUserPurchases
+from test_upload_purchases import PRODUCTS, upload
+
+HEADER = "supermarket_id,timestamp,user_id,items_list,total_amount\n"
+
+
+def purchases_csv(tmp_path, rows):
+    path = tmp_path / "purchases.csv"
+    path.write_text(HEADER + "".join(f"SM1,2025-10-28T08:{i % 60:02d}:00Z,u{i % 3},apple,0.5\n" for i in range(rows)))
+    return str(path)
+
+
+def test_upload_is_processed_in_chunks(client, session, monkeypatch):
+    monkeypatch.setattr(streaming, "CHUNK_ROWS", 2)
+    upload(client, "/upload_products", PRODUCTS)
+    text = HEADER + "".join(f"SM1,2025-10-28T08:0{i}:00Z,u{i % 2},apple,0.5\n" for i in range(5))
+    upload(client, "/upload_purchases", text)
+    assert session.query(Purchase).count() == 5
+    assert session.query(ImportChunk).count() == 0
+
+
+def test_interrupted_import_resumes_from_last_chunk(client, session, tmp_path):
+    upload(client, "/upload_products", PRODUCTS)
+    path = purchases_csv(tmp_path, 10)
+    calls = []
+
+    def failing_import(session, df):
+        calls.append(len(calls))
+        if len(calls) == 3:
+            raise RuntimeError("worker killed")
+        return import_purchases(session, df)
+
+    with pytest.raises(RuntimeError):
+        streaming.stream_import(path, "purchases:test", failing_import, dtype=streaming.PURCHASE_DTYPES, chunk_rows=3)
+    assert session.query(Purchase).count() == 6
+    assert session.query(ImportChunk).count() == 2
+
+    result = streaming.stream_import(path, "purchases:test", import_purchases, dtype=streaming.PURCHASE_DTYPES, chunk_rows=3)
+    assert result["resumed_chunks"] == 2
+    assert result["inserted"] == 4
+    assert session.query(Purchase).count() == 10
+    assert sum(t.total_purchases for t in session.query(TotalUserPurchases)) == 10
+    assert session.query(ImportChunk).count() == 0
+
+
+def test_identical_uploads_get_their_own_spool_files(monkeypatch, tmp_path):
+    from werkzeug.datastructures import FileStorage
+
+    monkeypatch.setattr(streaming, "SPOOL_DIR", str(tmp_path))
+    first, key = streaming.spool_upload(FileStorage(io.BytesIO(b"a,b\n1,2\n")), "purchases")
+    second, same_key = streaming.spool_upload(FileStorage(io.BytesIO(b"a,b\n1,2\n")), "purchases")
+    # one checkpoint key, two files: removing one leaves the other readable
+    assert key == same_key and first != second
+    os.remove(first)
+    assert open(second, "rb").read() == b"a,b\n1,2\n"
@@ -0,0 +1,117 @@
+
+from datetime import date, timedelta
+
+from mvc_app.db import SessionLocal, engine, ensure_schema, schema_version
+from mvc_app.models import SCHEMA_VERSION, CustomerSketch
+from mvc_app.reports import approx_customer_counts, week_start
+from mvc_app.sketches import HyperLogLog, rebuild_customer_sketches
+
+from test_upload_purchases import upload
+
+PRODUCTS = "product_name,unit_price\napple,0.5\n"
+HEADER = "supermarket_id,timestamp,user_id,items_list,total_amount\n"
+
+
+def test_hyperloglog_estimate_is_within_error_bound():
+    sketch = HyperLogLog()
+    for i in range(50000):
+        sketch.add(f"user-{i}")
+    assert abs(sketch.count() - 50000) / 50000 < 4 * sketch.relative_error
+    half = HyperLogLog()
+    for i in range(25000, 75000):
+        half.add(f"user-{i}")
+    merged = HyperLogLog.from_bytes(sketch.to_bytes()).merge(half)
+    assert abs(merged.count() - 75000) / 75000 < 4 * sketch.relative_error
+
+
+def test_small_counts_are_exact():
+    sketch = HyperLogLog()
+    for user in ["a", "b", "c", "a"]:
+        sketch.add(user)
+    assert sketch.count() == 3
+
+
+def test_numpy_merge_matches_sketch_merge(app, session):
+    sketches = {}
+    for offset in range(21):
+        for store in ("SM1", "SM2"):
+            sketch = HyperLogLog()
+            for i in range(offset * 300, offset * 300 + 2000):
+                sketch.add(f"{store}-{i % 5000}")
+            sketches[(store, date(2025, 10, 6) + timedelta(days=offset))] = sketch
+    session.add_all([CustomerSketch(store_id=store, day=day, registers=sketch.to_bytes())
+                     for (store, day), sketch in sketches.items()])
+    session.commit()
+
+    def expected(keep, period):
+        merged = {}
+        for (store, day), sketch in sketches.items():
+            if keep(store, day):
+                bucket = period(day) if period else None
+                merged.setdefault(bucket, HyperLogLog()).merge(sketch)
+        return {bucket: sketch.count() for bucket, sketch in merged.items()}
+
+    assert approx_customer_counts(session, batch_size=4) == expected(lambda s, d: True, None)
+    assert approx_customer_counts(session, period=week_start, batch_size=4) == expected(lambda s, d: True, week_start)
+    assert approx_customer_counts(session, store="SM2", start=date(2025, 10, 10), batch_size=4) == \
+        expected(lambda s, d: s == "SM2" and d >= date(2025, 10, 10), None)
+
+
+def seed(client):
+    upload(client, "/upload_products", PRODUCTS)
+    rows = [
+        ("SM1", "2025-10-27T10:00:00Z", "u1"),
+        ("SM1", "2025-10-27T11:00:00Z", "u2"),
+        ("SM2", "2025-10-27T12:00:00Z", "u1"),
+        ("SM2", "2025-10-28T12:00:00Z", "u3"),
+        ("SM1", "2025-11-03T12:00:00Z", "u4"),
+    ]
+    upload(client, "/upload_purchases", HEADER + "".join(f"{s},{t},{u},apple,0.5\n" for s, t, u in rows))
+
+
+def periods(client, query):
+    body = client.get(f"/unique_customers?format=json&{query}").get_json()
+    return [(p["start"], p["customers"]) for p in body["periods"]]
+
+
+def test_unique_customers_approx_matches_exact(client):
+    seed(client)
+    for query in ["", "store=SM1", "granularity=day", "granularity=week", "store=SM2&start=2025-10-28"]:
+        assert periods(client, query) == periods(client, query + "&mode=exact"), query
+    assert periods(client, "granularity=week") == [("2025-10-27", 3), ("2025-11-03", 1)]
+    assert periods(client, "") == [(None, 4)]
+
+
+def test_unique_customers_page_and_validation(client):
+    seed(client)
+    resp = client.get("/unique_customers")
+    assert b"The number of unique customers is: 4" in resp.data
+    assert client.get("/unique_customers?mode=guess").status_code == 400
+
+
+def test_rebuild_sketches(client, session):
+    seed(client)
+    session.query(CustomerSketch).delete()
+    session.commit()
+    with SessionLocal() as s:
+        assert rebuild_customer_sketches(s, batch_size=2) == 5
+        s.commit()
+    assert periods(client, "granularity=day") == [("2025-10-27", 2), ("2025-10-28", 1), ("2025-11-03", 1)]
+
+
+def test_upgrade_builds_sketches_of_existing_purchases(client):
+    seed(client)
+    # a database from before the sketches: the table is missing, or empty after create_all
+    CustomerSketch.__table__.drop(engine)
+    with engine.begin() as conn:
+        conn.execute(schema_version.update().values(version=4))
+    assert ensure_schema("management", SCHEMA_VERSION) is True
+    assert periods(client, "granularity=week") == [("2025-10-27", 3), ("2025-11-03", 1)]
+
+    with SessionLocal() as s:
+        s.query(CustomerSketch).delete()
+        s.commit()
+    with engine.begin() as conn:
+        conn.execute(schema_version.update().values(version=4))
+    assert ensure_schema("management", SCHEMA_VERSION) is True
+    assert periods(client, "") == [(None, 4)]
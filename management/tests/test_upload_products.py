@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from mvc_app import streaming
+from mvc_app.models import CatalogVersion, Product
+
+from conftest import csv_file
+
+
+def upload(client, text):
+    return client.post("/upload_products", data={"file": csv_file(text)}, content_type="multipart/form-data")
+
+
+def prices(session):
+    return {p.product_name: float(p.unit_price) for p in session.query(Product).all()}
+
+
+def test_upload_products_inserts_and_updates(client, session):
+    upload(client, "product_name,unit_price\napple,0.5\nbanana,0.3\n")
+    resp = upload(client, "product_name,unit_price\napple,0.5\n banana ,0.4\nmilk,2.5\n")
+    assert resp.status_code == 302
+    assert prices(session) == {"apple": 0.5, "banana": 0.4, "milk": 2.5}
+    with client.session_transaction() as flask_session:
+        messages = [m for _, m in flask_session["_flashes"]]
+    assert "(1 new, 1 updated, 1 unchanged)" in messages[-1]
+
+
+def test_upload_products_last_duplicate_wins(client, session):
+    upload(client, "product_name,unit_price\napple,0.5\napple,0.7\n")
+    assert prices(session) == {"apple": 0.7}
+
+
+def test_upload_products_bumps_catalog_version(client, session):
+    upload(client, "product_name,unit_price\napple,0.5\n")
+    upload(client, "product_name,unit_price\napple,0.5\n")
+    assert session.get(CatalogVersion, 1).version == 1
+    upload(client, "product_name,unit_price\napple,0.6\n")
+    assert session.get(CatalogVersion, 1).version == 2
+
+
+@pytest.mark.parametrize("text", ["", '"unterminated\nquote'], ids=["empty", "malformed"])
+@pytest.mark.parametrize("route", ["/upload_products", "/upload_purchases"])
+def test_invalid_csv_is_rejected_and_not_left_in_the_spool(client, monkeypatch, tmp_path, route, text):
+    monkeypatch.setattr(streaming, "SPOOL_DIR", str(tmp_path))
+    resp = client.post(route, data={"file": csv_file(text)}, content_type="multipart/form-data")
+    assert resp.status_code == 302
+    with client.session_transaction() as flask_session:
+        assert [m for _, m in flask_session["_flashes"]] == ["The uploaded file is not a valid CSV"]
+    assert os.listdir(tmp_path) == []
+
+
+def test_missing_columns_are_reported(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(streaming, "SPOOL_DIR", str(tmp_path))
+    upload(client, "product_name\napple\n")
+    with client.session_transaction() as flask_session:
+        assert [m for _, m in flask_session["_flashes"]] == ["CSV must have columns: product_name, unit_price"]
+    assert os.listdir(tmp_path) == []
@@ -1,2 +1,94 @@
+from mvc_app.models import Purchase, PurchaseItem, Product, Store, TotalProductPurchases, TotalUserPurchases, User
 
+from conftest import csv_file
 
+PRODUCTS = "product_name,unit_price\napple,0.5\nbanana,0.3\nmilk,2.5\n"
+PURCHASES = (
+    "supermarket_id,timestamp,user_id,items_list,total_amount\n"
+    'SM1,2025-10-28T08:12:00Z,u001,apple,0.5\n'
+    'SM1,2025-10-28T09:30:00Z,u002,"banana,milk",2.8\n'
+    'SM2,2025-10-28T10:00:00Z,u001,"apple,milk",3.0\n'
+    'SM2,2025-10-28T11:00:00Z,u003,"apple,caviar",100\n'
+)
+
+
+def upload(client, endpoint, text):
+    return client.post(endpoint, data={"file": csv_file(text)}, content_type="multipart/form-data")
+
+
+def flashes(client):
+    with client.session_transaction() as flask_session:
+        return [m for _, m in flask_session.get("_flashes", [])]
+
+
+def product_totals(session):
+    return {
+        name: total
+        for name, total in session.query(Product.product_name, TotalProductPurchases.total_purchases).join(TotalProductPurchases.product)
+    }
+
+
+def test_upload_purchases_writes_rows_and_counters(client, session):
+    upload(client, "/upload_products", PRODUCTS)
+    resp = upload(client, "/upload_purchases", PURCHASES)
+    assert resp.status_code == 302
+
+    assert session.query(Purchase).count() == 3
+    assert {s.store_id for s in session.query(Store)} == {"SM1", "SM2"}
+    assert {u.user_id for u in session.query(User)} == {"u001", "u002"}
+    totals = {t.user_id: t.total_purchases for t in session.query(TotalUserPurchases)}
+    assert totals == {"u001": 2, "u002": 1}
+    assert product_totals(session) == {"apple": 2, "banana": 1, "milk": 2}
+
+    messages = flashes(client)
+    assert "Loaded 3 purchases successfully." in messages
+    assert messages[-1] == "Skipped 1 rows: unknown product(s): caviar (line 5)"
+
+
+def test_upload_purchases_increments_existing_counters(client, session):
+    upload(client, "/upload_products", PRODUCTS)
+    upload(client, "/upload_purchases", PURCHASES)
+    upload(client, "/upload_purchases", PURCHASES.replace("2025-10-28", "2025-10-29"))
+    totals = {t.user_id: t.total_purchases for t in session.query(TotalUserPurchases)}
+    assert totals == {"u001": 4, "u002": 2}
+    assert product_totals(session) == {"apple": 4, "banana": 2, "milk": 4}
+
+
+def test_reuploaded_file_is_skipped(client, session):
+    clean = PURCHASES.rsplit("SM2,2025-10-28T11:00:00Z", 1)[0]
+    upload(client, "/upload_products", PRODUCTS)
+    upload(client, "/upload_purchases", clean)
+    upload(client, "/upload_purchases", clean)
+    assert flashes(client)[-1] == "This file was already imported; skipped all 3 rows."
+    assert session.query(Purchase).count() == 3
+
+
+def test_reupload_imports_rows_rejected_the_first_time(client, session):
+    upload(client, "/upload_products", PRODUCTS)
+    upload(client, "/upload_purchases", PURCHASES)
+    upload(client, "/upload_products", "product_name,unit_price\ncaviar,99.5\n")
+    upload(client, "/upload_purchases", PURCHASES)
+
+    assert session.query(Purchase).count() == 4
+    assert product_totals(session)["caviar"] == 1
+    messages = flashes(client)
+    assert "Loaded 1 purchases successfully." in messages
+    assert "Skipped 3 duplicate rows that were already imported." in messages
+
+
+def test_overlapping_rows_are_skipped_as_duplicates(client, session):
+    upload(client, "/upload_products", PRODUCTS)
+    upload(client, "/upload_purchases", PURCHASES)
+    overlapping = PURCHASES + (
+        'SM1,2025-10-28T08:12:00+02:00,u001,apple,0.5\n'  # same items, different instant
+        'SM2,2025-10-28T10:00:00+00:00,u001,"apple,milk",3.0\n'  # same instant as line 4
+    )
+    upload(client, "/upload_purchases", overlapping)
+
+    assert session.query(Purchase).count() == 4
+    assert session.query(PurchaseItem).count() == 6
+    totals = {t.user_id: t.total_purchases for t in session.query(TotalUserPurchases)}
+    assert totals == {"u001": 3, "u002": 1}
+    messages = flashes(client)
+    assert messages[-3:-1] == ["Loaded 1 purchases successfully.",
+                               "Skipped 4 duplicate rows that were already imported."]
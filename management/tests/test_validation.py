@@ -0,0 +1,81 @@
+import pandas as pd
+
+from mvc_app.importers import format_row_errors
+from mvc_app.streaming import PURCHASE_DTYPES
+from mvc_app.validation import compact_lines, normalize_products, normalize_purchases, reject_unknown_products
+
+from conftest import csv_file
+from test_upload_purchases import PRODUCTS, flashes, upload
+
+CSV = (
+    "supermarket_id,timestamp,user_id,items_list,total_amount\n"
+    "SM1,2025-10-28T08:12:00Z,u1,apple,0.5\n"                    # line 2
+    'SM1,2025-10-28 09:30,u2," banana , milk ",2.8\n'            # naive -> UTC, items stripped
+    'SM2,28/10/2025 10:00,u1,"apple,,milk",3.0\n'                # non-ISO layout
+    "SM2,garbage,u3,apple,1\n"                                   # line 5
+    ",2025-10-28T11:00:00Z,u3,apple,1\n"
+    "SM2,2025-10-28T11:00:00Z,u3,,1\n"
+    "SM2,2025-10-28T11:00:00Z,u3,apple,x\n"
+    'SM2,2025-10-28T13:00:00+02:00,u3,"apple,caviar,caviar",2\n'  # line 9
+)
+
+
+def read(text):
+    return pd.read_csv(csv_file(text)[0], dtype=PURCHASE_DTYPES)
+
+
+def test_normalize_purchases_reports_each_bad_row_once():
+    frame, items, errors = normalize_purchases(read(CSV))
+    assert sorted(errors) == [(5, "invalid timestamp"), (6, "missing supermarket_id"), (7, "empty items_list"),
+                              (8, "invalid total_amount")]
+    assert frame["line"].tolist() == [2, 3, 4, 9]
+    assert frame["items_list"].tolist() == ["apple", "banana,milk", "apple,milk", "apple,caviar,caviar"]
+    assert [ts.isoformat() for ts in frame["timestamp"]] == [
+        "2025-10-28T08:12:00+00:00", "2025-10-28T09:30:00+00:00", "2025-10-28T10:00:00+00:00",
+        "2025-10-28T11:00:00+00:00",
+    ]
+
+    frame, items, unknown = reject_unknown_products(frame, items, {"apple", "banana", "milk"})
+    assert unknown == [(9, "unknown product(s): caviar")]
+    assert frame["line"].tolist() == [2, 3, 4]
+    assert items.groupby("line").size().to_dict() == {2: 1, 3: 2, 4: 2}
+
+
+def test_normalize_products_skips_bad_rows():
+    prices, errors = normalize_products(pd.DataFrame({"product_name": ["a", " b", None, "a "],
+                                                      "unit_price": ["1", "x", "2", "3"]}))
+    assert prices == {"a": 3.0}
+    assert errors == [(4, "missing product_name"), (3, "invalid unit_price")]
+
+
+def test_error_report_groups_lines():
+    assert compact_lines([9, 2, 3, 4, 12, 13]) == "2-4, 9, 12-13"
+    assert compact_lines(range(2, 40, 2), limit=3) == "2, 4, 6 (+16 more)"
+    errors = [(line, "invalid timestamp") for line in (4, 5, 6, 9)] + [(7, "empty items_list")]
+    assert format_row_errors(errors, total=12) == (
+        "Skipped 12 rows: invalid timestamp (lines 4-6, 9); empty items_list (line 7) (and 7 more)"
+    )
+
+
+def test_upload_reports_bad_rows_and_keeps_good_ones(client, session):
+    upload(client, "/upload_products", PRODUCTS)
+    upload(client, "/upload_purchases", CSV)
+    messages = flashes(client)
+    assert "Loaded 3 purchases successfully." in messages
+    assert messages[-1] == (
+        "Skipped 5 rows: invalid timestamp (line 5); missing supermarket_id (line 6); empty items_list (line 7); "
+        "invalid total_amount (line 8); unknown product(s): caviar (line 9)"
+    )
+
+
+def test_non_finite_and_negative_amounts_are_rejected():
+    text = "supermarket_id,timestamp,user_id,items_list,total_amount\n" + "".join(
+        f"SM1,2025-10-28T08:12:00Z,u1,apple,{amount}\n" for amount in ("inf", "-inf", "nan", "-1", "0", "2.5"))
+    frame, _, errors = normalize_purchases(read(text))
+    assert errors == [(line, "invalid total_amount") for line in (2, 3, 4, 5)]
+    assert frame["total_amount"].tolist() == [0.0, 2.5]
+
+    prices, errors = normalize_products(pd.DataFrame({"product_name": ["a", "b", "c", "d"],
+                                                      "unit_price": ["inf", "-0.5", "NaN", "1"]}))
+    assert prices == {"d": 1.0}
+    assert errors == [(2, "invalid unit_price"), (3, "invalid unit_price"), (4, "invalid unit_price")]
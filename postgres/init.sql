@@ -4,14 +4,25 @@ CREATE TABLE IF NOT EXISTS products (
   unit_price NUMERIC NOT NULL
 );
 
+-- product search (see cash_register/mvc_app/search.py): case-insensitive
+-- order, paging and prefix ranges; trigram substring matching
+CREATE INDEX IF NOT EXISTS ix_products_search ON products ((lower(product_name) COLLATE "C"), (product_name COLLATE "C"));
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (product_name gin_trgm_ops);
+
 CREATE TABLE IF NOT EXISTS purchases (
   id SERIAL PRIMARY KEY,
   supermarket_id TEXT NOT NULL,
   timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
   user_id TEXT NOT NULL,
-  total_amount NUMERIC NOT NULL
+  items_list TEXT NOT NULL,
+  total_amount NUMERIC NOT NULL,
+  row_hash VARCHAR(32)
 );
 
+-- fingerprint of imported CSV rows; NULL for register checkouts
+CREATE UNIQUE INDEX IF NOT EXISTS ix_purchases_row_hash ON purchases (row_hash);
+
 CREATE TABLE IF NOT EXISTS purchase_items (
   id SERIAL PRIMARY KEY,
   purchase_id INTEGER NOT NULL REFERENCES purchases(id) ON DELETE CASCADE,
@@ -19,3 +30,12 @@ CREATE TABLE IF NOT EXISTS purchase_items (
   quantity INTEGER NOT NULL,
   line_total NUMERIC NOT NULL
 );
+
+CREATE INDEX IF NOT EXISTS ix_purchase_items_purchase_id ON purchase_items (purchase_id);
+CREATE INDEX IF NOT EXISTS ix_purchase_items_product_purchase ON purchase_items (product_id, purchase_id);
+
+CREATE TABLE IF NOT EXISTS product_total_purchases (
+  id SERIAL PRIMARY KEY,
+  product_id INTEGER UNIQUE NOT NULL REFERENCES products(id),
+  total_purchases INTEGER NOT NULL DEFAULT 0
+);